@@ -32,6 +32,10 @@ from web.models import Mascota, FotoMascotaDesaparecida
 # Registrar blueprint
 app.register_blueprint(main)
 
+# Comandos de mantenimiento (flask --app app <comando>)
+from web.comandos import registrar_comandos
+registrar_comandos(app)
+
 if __name__ == "__main__":
     with app.app_context():
         print(">>> Secret key configurada:", bool(app.secret_key))
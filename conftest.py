@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+# Variables que los módulos de publicación exigen al importarse.
+for _var in ("PAGE_ACCESS_TOKEN", "FACEBOOK_PAGE_ID", "IG_USER_ID", "ACCESS_TOKEN", "OPENAI_API_KEY"):
+    os.environ.setdefault(_var, "test")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+
+@pytest.fixture
+def app(tmp_path):
+    from web import create_app
+    from web.models import db
+
+    app = create_app()
+    app.config.update(
+        TESTING=True,
+        EXTERNAL_BASE_URL="http://testserver",
+        FOTOS_STORAGE="local",
+        FOTOS_STORAGE_DIR=str(tmp_path / "blobs"),
+        FOTOS_VARIANTES_DIR=str(tmp_path / "variantes"),
+        COLA_TRABAJADOR_EMBEBIDO=False,
+    )
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
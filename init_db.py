@@ -5,6 +5,7 @@ from datetime import date
 from flask import current_app
 from app import app
 from web.models import db, Mascota, FotoMascotaDesaparecida as Foto
+from web.utils.almacen_blobs import obtener_almacen
 from sqlalchemy.exc import IntegrityError
 
 
@@ -229,12 +230,13 @@ with app.app_context():
         datos = _cargar_foto(ruta)
         if not datos:
             continue
+        hash_contenido = obtener_almacen().guardar(datos["data"])
         fotos.append(
             Foto(
                 mascota_id=mascota_id,
                 tipo_foto=tipo,
-                ruta=datos["ruta_rel"],
-                data=datos["data"],
+                ruta=f"blobs/{hash_contenido}",
+                hash_contenido=hash_contenido,
                 mime_type=datos["mime_type"],
                 nombre_archivo=datos["nombre_archivo"],
                 tamano_bytes=datos["tamano_bytes"],
@@ -1,7 +1,8 @@
 import os
-import requests
 from dotenv import load_dotenv
 
+from web.utils.cliente_http import obtener_cliente
+
 # Carga las variables definidas en el archivo .env
 load_dotenv()
 
@@ -33,11 +34,10 @@ class MessengerClient:
         }
         params = {"access_token": self.page_access_token}
 
-        response = requests.post(
+        response = obtener_cliente("messenger", timeout=10).post(
             GRAPH_API_URL,
             params=params,
             json=payload,
-            timeout=10
         )
         response.raise_for_status()  # lanza error si la respuesta no es 200 OK
         return response.json()
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""Tabla trabajo: cola persistente de notificaciones
+
+Revision ID: 1f6b0d93a7e4
+Revises: e9a1f3b7c250
+Create Date: 2026-10-16 17:05:31.640128
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f6b0d93a7e4'
+down_revision = 'e9a1f3b7c250'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'trabajo',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('clave', sa.String(length=80), nullable=False),
+        sa.Column('tipo', sa.String(length=20), nullable=False),
+        sa.Column('mascota_id', sa.Integer(), nullable=False),
+        sa.Column('estado', sa.String(length=10), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('intentos', sa.Integer(), nullable=False),
+        sa.Column('ejecutar_despues', sa.DateTime(), nullable=False),
+        sa.Column('bloqueado_hasta', sa.DateTime(), nullable=True),
+        sa.Column('ultimo_error', sa.Text(), nullable=True),
+        sa.Column('creado', sa.DateTime(), nullable=False),
+        sa.Column('actualizado', sa.DateTime(), nullable=False),
+        sa.CheckConstraint(
+            "estado IN ('pendiente','en_curso','hecho','fallido')", name='chk_trabajo_estado_valido'
+        ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('clave'),
+    )
+    with op.batch_alter_table('trabajo', schema=None) as batch_op:
+        batch_op.create_index('ix_trabajo_estado_ejecutar_despues', ['estado', 'ejecutar_despues'], unique=False)
+        batch_op.create_index(batch_op.f('ix_trabajo_mascota_id'), ['mascota_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('trabajo', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_trabajo_mascota_id'))
+        batch_op.drop_index('ix_trabajo_estado_ejecutar_despues')
+
+    op.drop_table('trabajo')
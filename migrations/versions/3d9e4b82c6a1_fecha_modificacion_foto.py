@@ -0,0 +1,29 @@
+"""Fecha de modificación de cada foto (Last-Modified de /foto/<id>)
+
+Revision ID: 3d9e4b82c6a1
+Revises: 7a3c5e19d2b8
+Create Date: 2026-10-16 19:40:17.552903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d9e4b82c6a1'
+down_revision = '7a3c5e19d2b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('fotos_mascotas_desaparecidas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fecha_modificacion', sa.DateTime(), nullable=True))
+
+    # Las fotos existentes no tienen fecha: se toma la del momento de la migración
+    op.execute("UPDATE fotos_mascotas_desaparecidas SET fecha_modificacion = CURRENT_TIMESTAMP")
+
+
+def downgrade():
+    with op.batch_alter_table('fotos_mascotas_desaparecidas', schema=None) as batch_op:
+        batch_op.drop_column('fecha_modificacion')
@@ -0,0 +1,31 @@
+"""Latitud y longitud geocodificadas en mascota
+
+Revision ID: 5be08d43c1f9
+Revises: a3c91e5d7b20
+Create Date: 2026-10-16 10:03:17.882410
+
+Las filas existentes se rellenan con:
+    flask --app app geocodificar-mascotas
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5be08d43c1f9'
+down_revision = 'a3c91e5d7b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('mascota', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitud', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitud', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('mascota', schema=None) as batch_op:
+        batch_op.drop_column('longitud')
+        batch_op.drop_column('latitud')
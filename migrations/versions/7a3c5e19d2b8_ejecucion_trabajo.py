@@ -0,0 +1,44 @@
+"""Tabla ejecucion_trabajo: duración y resultado de cada intento por canal
+
+Revision ID: 7a3c5e19d2b8
+Revises: 1f6b0d93a7e4
+Create Date: 2026-10-16 18:12:04.215337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3c5e19d2b8'
+down_revision = '1f6b0d93a7e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ejecucion_trabajo',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('trabajo_id', sa.Integer(), nullable=False),
+        sa.Column('tipo', sa.String(length=20), nullable=False),
+        sa.Column('mascota_id', sa.Integer(), nullable=False),
+        sa.Column('intento', sa.Integer(), nullable=False),
+        sa.Column('inicio', sa.DateTime(), nullable=False),
+        sa.Column('duracion_ms', sa.Integer(), nullable=False),
+        sa.Column('resultado', sa.String(length=10), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['trabajo_id'], ['trabajo.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    with op.batch_alter_table('ejecucion_trabajo', schema=None) as batch_op:
+        batch_op.create_index('ix_ejecucion_trabajo_tipo_inicio', ['tipo', 'inicio'], unique=False)
+        batch_op.create_index(batch_op.f('ix_ejecucion_trabajo_trabajo_id'), ['trabajo_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ejecucion_trabajo', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_ejecucion_trabajo_trabajo_id'))
+        batch_op.drop_index('ix_ejecucion_trabajo_tipo_inicio')
+
+    op.drop_table('ejecucion_trabajo')
@@ -27,6 +27,7 @@ def upgrade():
     sa.Column('propietario_email', sa.String(length=120), nullable=False),
     sa.Column('propietario_telefono', sa.String(length=20), nullable=False),
     sa.Column('zona', sa.String(length=50), nullable=False),
+    sa.Column('codigo_postal', sa.String(length=5), nullable=False),
     sa.Column('tipo_registro', sa.String(length=12), nullable=False),
     sa.Column('color', sa.String(length=30), nullable=False),
     sa.Column('descripcion', sa.Text(), nullable=True),
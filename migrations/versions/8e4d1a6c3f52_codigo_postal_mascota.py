@@ -0,0 +1,44 @@
+"""codigo_postal en mascota para las BDs creadas solo con migraciones
+
+Revision ID: 8e4d1a6c3f52
+Revises: b5f2c8a4e913
+Create Date: 2026-10-17 09:21:05.114382
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4d1a6c3f52'
+down_revision = 'b5f2c8a4e913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columnas = {c['name']: c for c in inspector.get_columns('mascota')}
+    indices = {i['name'] for i in inspector.get_indexes('mascota')}
+    columna = columnas.get('codigo_postal')
+    if columna is None:
+        # El esquema inicial no tenía la columna: solo existía en las BDs creadas
+        # con create_all(). Las filas previas quedan con '' (sin CP, como las
+        # que no se pueden geocodificar) y la columna es NOT NULL como en el modelo.
+        with op.batch_alter_table('mascota', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('codigo_postal', sa.String(length=5), nullable=False, server_default=''))
+        with op.batch_alter_table('mascota', schema=None) as batch_op:
+            batch_op.alter_column('codigo_postal', existing_type=sa.String(length=5), server_default=None)
+    elif columna['nullable']:
+        mascota = sa.table('mascota', sa.column('codigo_postal', sa.String))
+        op.execute(mascota.update().where(mascota.c.codigo_postal.is_(None)).values(codigo_postal=''))
+        with op.batch_alter_table('mascota', schema=None) as batch_op:
+            batch_op.alter_column('codigo_postal', existing_type=sa.String(length=5), nullable=False)
+    if 'ix_mascota_codigo_postal' not in indices:
+        with op.batch_alter_table('mascota', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_mascota_codigo_postal'), ['codigo_postal'], unique=False)
+
+
+def downgrade():
+    # La columna y el índice pueden venir de antes: no se sabe si los creó esta revisión
+    pass
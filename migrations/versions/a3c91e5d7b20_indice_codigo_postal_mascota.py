@@ -0,0 +1,26 @@
+"""Indice sobre mascota.codigo_postal
+
+Revision ID: a3c91e5d7b20
+Revises: 305968ec3d79
+Create Date: 2026-10-16 09:12:41.503117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c91e5d7b20'
+down_revision = '305968ec3d79'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('mascota', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_mascota_codigo_postal'), ['codigo_postal'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('mascota', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_mascota_codigo_postal'))
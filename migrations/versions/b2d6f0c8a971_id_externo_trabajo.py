@@ -0,0 +1,26 @@
+"""Id de lo publicado por cada trabajo, para no repetir publicaciones
+
+Revision ID: b2d6f0c8a971
+Revises: f3a7b9d2c614
+Create Date: 2026-10-17 11:20:14.308462
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d6f0c8a971'
+down_revision = 'f3a7b9d2c614'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('trabajo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('id_externo', sa.String(length=100), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('trabajo', schema=None) as batch_op:
+        batch_op.drop_column('id_externo')
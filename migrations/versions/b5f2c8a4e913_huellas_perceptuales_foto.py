@@ -0,0 +1,31 @@
+"""Huellas perceptuales de las fotos (aHash, dHash y pHash en hex)
+
+Revision ID: b5f2c8a4e913
+Revises: 3d9e4b82c6a1
+Create Date: 2026-10-16 21:12:48.306117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5f2c8a4e913'
+down_revision = '3d9e4b82c6a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Las fotos existentes se rellenan con `flask huellas-fotos`
+    with op.batch_alter_table('fotos_mascotas_desaparecidas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ahash', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('dhash', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('phash', sa.String(length=16), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('fotos_mascotas_desaparecidas', schema=None) as batch_op:
+        batch_op.drop_column('phash')
+        batch_op.drop_column('dhash')
+        batch_op.drop_column('ahash')
@@ -0,0 +1,96 @@
+"""Fotos fuera de la tabla: hash de contenido y binarios en el almacén de blobs
+
+Revision ID: c4d8e2a61f07
+Revises: 5be08d43c1f9
+Create Date: 2026-10-16 12:41:05.113902
+
+Copia cada `data` existente al almacén configurado (FOTOS_STORAGE) y guarda su
+SHA-256 en `hash_contenido`. `data` se conserva: se vacía aparte, cuando se haya
+comprobado el almacén, con `flask fotos-vaciar-data`. Si hay fotos que copiar y
+el almacén es el directorio local por defecto (se pierde en cada despliegue de
+Render), la migración se aborta. El downgrade restaura `data` donde falte.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8e2a61f07'
+down_revision = '5be08d43c1f9'
+branch_labels = None
+depends_on = None
+
+LOTE = 50
+
+fotos = sa.table(
+    'fotos_mascotas_desaparecidas',
+    sa.column('id', sa.Integer),
+    sa.column('data', sa.LargeBinary),
+    sa.column('hash_contenido', sa.String),
+)
+
+
+def _recorrer(bind, condicion, columnas):
+    ultimo_id = 0
+    while True:
+        filas = bind.execute(
+            sa.select(fotos.c.id, *columnas)
+            .where(condicion, fotos.c.id > ultimo_id)
+            .order_by(fotos.c.id)
+            .limit(LOTE)
+        ).all()
+        if not filas:
+            return
+        yield from filas
+        ultimo_id = filas[-1][0]
+
+
+def upgrade():
+    from flask import current_app
+
+    from web.utils.almacen_blobs import almacen_persistente, obtener_almacen
+
+    bind = op.get_bind()
+    pendientes = bind.execute(
+        sa.select(sa.func.count()).select_from(fotos).where(fotos.c.data.isnot(None))
+    ).scalar()
+    if pendientes and not almacen_persistente(current_app.config):
+        raise RuntimeError(
+            f"Hay {pendientes} fotos en la tabla y el almacén de blobs es el directorio por defecto "
+            "(instance/fotos), que no sobrevive a un despliegue. Configura FOTOS_STORAGE=s3 o "
+            "FOTOS_STORAGE_DIR en un disco persistente antes de migrar."
+        )
+
+    with op.batch_alter_table('fotos_mascotas_desaparecidas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hash_contenido', sa.String(length=64), nullable=True))
+        batch_op.create_index(
+            batch_op.f('ix_fotos_mascotas_desaparecidas_hash_contenido'), ['hash_contenido'], unique=False
+        )
+
+    almacen = obtener_almacen()
+    for foto_id, data in _recorrer(bind, fotos.c.data.isnot(None), [fotos.c.data]):
+        clave = almacen.guardar(bytes(data))
+        bind.execute(
+            fotos.update()
+            .where(fotos.c.id == foto_id)
+            .values(hash_contenido=clave)
+        )
+
+
+def downgrade():
+    from web.utils.almacen_blobs import obtener_almacen
+
+    bind = op.get_bind()
+    almacen = obtener_almacen()
+    condicion = sa.and_(fotos.c.hash_contenido.isnot(None), fotos.c.data.is_(None))
+    for foto_id, clave in _recorrer(bind, condicion, [fotos.c.hash_contenido]):
+        bind.execute(
+            fotos.update()
+            .where(fotos.c.id == foto_id)
+            .values(data=almacen.leer(clave))
+        )
+
+    with op.batch_alter_table('fotos_mascotas_desaparecidas', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_fotos_mascotas_desaparecidas_hash_contenido'))
+        batch_op.drop_column('hash_contenido')
@@ -0,0 +1,26 @@
+"""Progreso de los envíos parciales de cada trabajo
+
+Revision ID: d5c3a8e1f406
+Revises: b2d6f0c8a971
+Create Date: 2026-10-17 12:02:51.194730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5c3a8e1f406'
+down_revision = 'b2d6f0c8a971'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('trabajo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('progreso', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('trabajo', schema=None) as batch_op:
+        batch_op.drop_column('progreso')
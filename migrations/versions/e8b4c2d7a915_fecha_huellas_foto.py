@@ -0,0 +1,30 @@
+"""Fecha de cálculo de las huellas de cada foto
+
+Revision ID: e8b4c2d7a915
+Revises: d5c3a8e1f406
+Create Date: 2026-10-17 12:41:09.552107
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b4c2d7a915'
+down_revision = 'd5c3a8e1f406'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('fotos_mascotas_desaparecidas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fecha_huellas', sa.DateTime(), nullable=True))
+        batch_op.create_index(
+            batch_op.f('ix_fotos_mascotas_desaparecidas_fecha_huellas'), ['fecha_huellas'], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('fotos_mascotas_desaparecidas', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_fotos_mascotas_desaparecidas_fecha_huellas'))
+        batch_op.drop_column('fecha_huellas')
@@ -0,0 +1,30 @@
+"""Hash de la copia original de cada foto
+
+Revision ID: e9a1f3b7c250
+Revises: c4d8e2a61f07
+Create Date: 2026-10-16 15:22:48.301774
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9a1f3b7c250'
+down_revision = 'c4d8e2a61f07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('fotos_mascotas_desaparecidas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hash_original', sa.String(length=64), nullable=True))
+        batch_op.create_index(
+            batch_op.f('ix_fotos_mascotas_desaparecidas_hash_original'), ['hash_original'], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('fotos_mascotas_desaparecidas', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_fotos_mascotas_desaparecidas_hash_original'))
+        batch_op.drop_column('hash_original')
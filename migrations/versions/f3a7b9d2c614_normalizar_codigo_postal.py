@@ -0,0 +1,45 @@
+"""Códigos postales normalizados e índice sobre mascota.latitud
+
+Revision ID: f3a7b9d2c614
+Revises: 8e4d1a6c3f52
+Create Date: 2026-10-17 09:48:36.720519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a7b9d2c614'
+down_revision = '8e4d1a6c3f52'
+branch_labels = None
+depends_on = None
+
+
+def _normalizar_cp(cp):
+    # Igual que web.utils.indice_cp.normalizar_cp (sin importar la app)
+    cp = str(cp or "").strip()
+    if cp.isdigit() and len(cp) < 5:
+        cp = cp.zfill(5)
+    return cp
+
+
+def upgrade():
+    # El filtro por radio compara codigo_postal con las claves del índice de CPs
+    bind = op.get_bind()
+    mascota = sa.table('mascota', sa.column('id', sa.Integer), sa.column('codigo_postal', sa.String))
+    filas = bind.execute(sa.select(mascota.c.id, mascota.c.codigo_postal)).fetchall()
+    for mascota_id, cp in filas:
+        normalizado = _normalizar_cp(cp)
+        if normalizado != cp:
+            bind.execute(
+                mascota.update().where(mascota.c.id == mascota_id).values(codigo_postal=normalizado)
+            )
+
+    with op.batch_alter_table('mascota', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_mascota_latitud'), ['latitud'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('mascota', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_mascota_latitud'))
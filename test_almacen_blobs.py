@@ -0,0 +1,292 @@
+import hashlib
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from web.utils.almacen_blobs import AlmacenBlobs, AlmacenLocal, AlmacenS3, BlobNoEncontrado, calcular_hash
+
+JPEG = b"\xff\xd8\xff\xe0" + b"foto de prueba" * 100
+
+
+def test_almacen_local_direccionado_por_contenido(tmp_path):
+    almacen = AlmacenLocal(tmp_path)
+    clave = almacen.guardar(JPEG)
+
+    assert clave == hashlib.sha256(JPEG).hexdigest()
+    assert almacen.ruta(clave) == tmp_path / clave[:2] / clave[2:4] / clave
+    assert almacen.guardar(JPEG) == clave
+    assert almacen.leer(clave) == JPEG
+
+    vista = almacen.leer_vista(clave)
+    assert isinstance(vista, memoryview) and vista == JPEG
+
+    almacen.eliminar(clave)
+    assert not almacen.existe(clave)
+    with pytest.raises(BlobNoEncontrado):
+        almacen.leer(clave)
+    with pytest.raises(BlobNoEncontrado):
+        almacen.leer_vista(clave)
+    with pytest.raises(ValueError):
+        almacen.ruta("../../etc/passwd")
+    with pytest.raises(TypeError):
+        AlmacenBlobs()
+
+
+class _S3Falso(BaseHTTPRequestHandler):
+    objetos: dict = {}
+    peticiones: list = []
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, codigo, cuerpo=b""):
+        self.send_response(codigo)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(cuerpo)
+
+    def _autorizado(self):
+        self.peticiones.append((self.command, self.path, dict(self.headers)))
+        auth = self.headers.get("Authorization", "")
+        if not auth.startswith("AWS4-HMAC-SHA256 Credential=clave/"):
+            self._responder(403)
+            return False
+        return True
+
+    def do_PUT(self):
+        if self._autorizado():
+            cuerpo = self.rfile.read(int(self.headers["Content-Length"]))
+            assert hashlib.sha256(cuerpo).hexdigest() == self.headers["x-amz-content-sha256"]
+            self.objetos[self.path] = cuerpo
+            self._responder(200)
+
+    def do_GET(self):
+        if self._autorizado():
+            if self.path not in self.objetos:
+                self._responder(404)
+                return
+            cuerpo = self.objetos[self.path]
+            rango = self.headers.get("Range")
+            if rango:
+                inicio, fin = (int(x) for x in rango.removeprefix("bytes=").split("-"))
+                self._responder(206, cuerpo[inicio:fin + 1])
+            else:
+                self._responder(200, cuerpo)
+
+    def do_HEAD(self):
+        if self._autorizado():
+            if self.path in self.objetos:
+                self._responder(200, self.objetos[self.path])
+            else:
+                self._responder(404)
+
+    def do_DELETE(self):
+        if self._autorizado():
+            self.objetos.pop(self.path, None)
+            self._responder(204)
+
+
+@pytest.fixture
+def servidor_s3():
+    _S3Falso.objetos = {}
+    _S3Falso.peticiones = []
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _S3Falso)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield f"http://127.0.0.1:{servidor.server_port}"
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def test_almacen_s3_contra_servidor_local(servidor_s3):
+    almacen = AlmacenS3(servidor_s3, "mascotas", "clave", "secreto", prefijo="fotos/")
+    clave = almacen.guardar(JPEG)
+
+    assert f"/mascotas/fotos/{clave}" in _S3Falso.objetos
+    assert almacen.existe(clave)
+    assert almacen.leer(clave) == JPEG
+
+    # Subir el mismo contenido no repite el PUT
+    almacen.guardar(JPEG)
+    assert [m for m, _, _ in _S3Falso.peticiones].count("PUT") == 1
+
+    almacen.eliminar(clave)
+    assert not almacen.existe(clave)
+    with pytest.raises(BlobNoEncontrado):
+        almacen.abrir(clave)
+
+
+def _mascota_con_fotos(db, *contenidos, nombre="toby"):
+    from web.models import FotoMascotaDesaparecida as Foto, Mascota
+    from web.utils.almacen_blobs import obtener_almacen
+
+    mascota = Mascota(
+        nombre=nombre, especie="perro", propietario_email="a@x.es",
+        propietario_telefono="600000000", zona="pinto", codigo_postal="28320",
+        tipo_registro="desaparecida", color="marron", sexo="macho",
+        tamano="mediano", fecha_registro=date(2024, 5, 1),
+    )
+    db.session.add(mascota)
+    db.session.flush()
+    fotos = []
+    for i, contenido in enumerate(contenidos):
+        clave = obtener_almacen().guardar(contenido)
+        fotos.append(Foto(
+            mascota_id=mascota.id, tipo_foto=f"tipo{i}", ruta=f"blobs/{clave}",
+            hash_contenido=clave, mime_type="image/jpeg", tamano_bytes=len(contenido),
+        ))
+    db.session.add_all(fotos)
+    db.session.commit()
+    return mascota, fotos
+
+
+def test_ver_foto_sirve_desde_el_almacen(app, client):
+    from web.models import FotoMascotaDesaparecida as Foto, db
+
+    mascota, (foto,) = _mascota_con_fotos(db, JPEG)
+    resp = client.get(f"/foto/{foto.id}")
+    assert resp.status_code == 200
+    assert resp.data == JPEG
+    assert resp.headers["ETag"] == f'"{calcular_hash(JPEG)}"'
+    assert client.get(f"/foto/{foto.id}", headers={"If-None-Match": resp.headers["ETag"]}).status_code == 304
+
+    # Las filas antiguas con el binario en la tabla siguen funcionando
+    antigua = Foto(mascota_id=mascota.id, tipo_foto="antigua", ruta="fotos/x.jpg", data=b"legacy")
+    db.session.add(antigua)
+    db.session.commit()
+    assert client.get(f"/foto/{antigua.id}").data == b"legacy"
+
+
+def test_revalidacion_responde_304_sin_leer_binarios(app, client, monkeypatch):
+    from test_consultas_fotos import _capturar_sql, _selecciona_data
+    from web.models import db
+    from web.utils.almacen_blobs import AlmacenLocal
+
+    app.config["FOTOS_CACHE"] = "no"
+    _, (foto,) = _mascota_con_fotos(db, JPEG)
+    resp = client.get(f"/foto/{foto.id}")
+    etag, ultima_modificacion = resp.headers["ETag"], resp.headers["Last-Modified"]
+
+    def _prohibido(*args, **kwargs):
+        raise AssertionError("Una revalidación no debe abrir el blob")
+
+    monkeypatch.setattr(AlmacenLocal, "ruta_local", _prohibido)
+    monkeypatch.setattr(AlmacenLocal, "abrir", _prohibido)
+    for cabeceras in ({"If-None-Match": etag}, {"If-Modified-Since": ultima_modificacion}):
+        db.session.expire_all()
+        with _capturar_sql(db) as sentencias:
+            resp = client.get(f"/foto/{foto.id}", headers=cabeceras)
+        assert resp.status_code == 304
+        assert resp.headers["ETag"] == etag
+        assert resp.headers["Cache-Control"] == "public, max-age=31536000"
+        assert sentencias and not _selecciona_data(sentencias)
+
+    # Un ETag distinto no es una coincidencia
+    monkeypatch.undo()
+    assert client.get(f"/foto/{foto.id}", headers={"If-None-Match": '"otro"'}).status_code == 200
+
+
+def _comprobar_rangos(client, url, contenido):
+    resp = client.get(url)
+    assert resp.status_code == 200 and resp.data == contenido
+    assert resp.headers["Accept-Ranges"] == "bytes"
+
+    resp = client.get(url, headers={"Range": "bytes=10-19"})
+    assert resp.status_code == 206
+    assert resp.data == contenido[10:20]
+    assert resp.headers["Content-Range"] == f"bytes 10-19/{len(contenido)}"
+
+    assert client.get(url, headers={"Range": "bytes=-5"}).data == contenido[-5:]
+    assert client.get(url, headers={"Range": f"bytes={len(contenido)}-"}).status_code == 416
+    # If-Range que no coincide: se envía la foto completa
+    resp = client.get(url, headers={"Range": "bytes=0-3", "If-Range": '"otra"'})
+    assert resp.status_code == 200 and resp.data == contenido
+
+
+def test_range_en_disco_local(app, client):
+    from web.models import db
+
+    app.config["FOTOS_CACHE"] = "no"
+    _, (foto,) = _mascota_con_fotos(db, JPEG)
+    _comprobar_rangos(client, f"/foto/{foto.id}", JPEG)
+
+
+def test_range_y_streaming_desde_s3(app, client, servidor_s3, monkeypatch):
+    from web.models import db
+
+    app.extensions["almacen_fotos"] = AlmacenS3(servidor_s3, "mascotas", "clave", "secreto")
+    app.config["FOTOS_CACHE"] = "no"
+    grande = bytes(range(256)) * 1024
+    _, (foto,) = _mascota_con_fotos(db, grande)
+    monkeypatch.setattr("web.routes.TROZO_FOTO", 4096)
+
+    resp = client.get(f"/foto/{foto.id}")
+    assert resp.is_streamed and resp.data == grande
+    _comprobar_rangos(client, f"/foto/{foto.id}", grande)
+    # El rango se pide a S3, no se descarga el blob entero
+    rangos = [cabeceras.get("Range") for metodo, _, cabeceras in _S3Falso.peticiones if metodo == "GET"]
+    assert "bytes=10-19" in rangos
+
+
+def test_range_y_streaming_de_filas_antiguas(app, client, monkeypatch):
+    from web.models import FotoMascotaDesaparecida as Foto, db
+
+    app.config["FOTOS_CACHE"] = "no"
+    mascota, _ = _mascota_con_fotos(db)
+    contenido = bytes(range(256)) * 40
+    antigua = Foto(mascota_id=mascota.id, tipo_foto="antigua", ruta="fotos/x.jpg", data=contenido)
+    db.session.add(antigua)
+    db.session.commit()
+    monkeypatch.setattr("web.routes.TROZO_COLUMNA_DATA", 1000)
+
+    _comprobar_rangos(client, f"/foto/{antigua.id}", contenido)
+
+
+def test_eliminar_mascota_purga_blobs_sin_referencias(app, client):
+    from web.models import db
+    from web.utils.almacen_blobs import obtener_almacen
+
+    compartida = b"misma foto"
+    _, (foto_a,) = _mascota_con_fotos(db, compartida)
+    mascota_b, _ = _mascota_con_fotos(db, compartida, b"solo de b", nombre="luna")
+    almacen = obtener_almacen()
+
+    client.post(f"/mascotas/{mascota_b.id}/eliminar")
+    assert almacen.existe(foto_a.hash_contenido)
+    assert not almacen.existe(calcular_hash(b"solo de b"))
+
+
+def test_vaciar_data_solo_con_el_blob_en_el_almacen(app, client, monkeypatch):
+    from web.models import FotoMascotaDesaparecida as Foto, db
+    from web.utils.almacen_blobs import obtener_almacen
+
+    app.config["FOTOS_CACHE"] = "no"
+    mascota, _ = _mascota_con_fotos(db)
+    # Filas como las deja la migración: hash en el almacén y `data` aún en la tabla
+    copiada = Foto(mascota_id=mascota.id, tipo_foto="a", ruta="fotos/a.jpg",
+                   data=JPEG, hash_contenido=obtener_almacen().guardar(JPEG))
+    perdida = Foto(mascota_id=mascota.id, tipo_foto="b", ruta="fotos/b.jpg",
+                   data=b"sin blob", hash_contenido=calcular_hash(b"sin blob"))
+    db.session.add_all([copiada, perdida])
+    db.session.commit()
+    ids = copiada.id, perdida.id
+
+    # Si el blob falta se sigue sirviendo desde la tabla
+    assert client.get(f"/foto/{ids[1]}").data == b"sin blob"
+
+    monkeypatch.delenv("FOTOS_STORAGE_DIR", raising=False)
+    app.config["FOTOS_STORAGE_DIR"] = None
+    resultado = app.test_cli_runner().invoke(args=["fotos-vaciar-data"])
+    assert resultado.exit_code != 0 and "FOTOS_STORAGE_DIR" in resultado.output
+
+    app.config["FOTOS_STORAGE_DIR"] = str(obtener_almacen().raiz)
+    resultado = app.test_cli_runner().invoke(args=["fotos-vaciar-data"])
+    assert "Fotos vaciadas: 1. Sin blob en el almacén: 1." in resultado.output
+
+    db.session.expire_all()
+    assert db.session.get(Foto, ids[0]).data is None
+    assert db.session.get(Foto, ids[1]).data == b"sin blob"
+    assert client.get(f"/foto/{ids[0]}").data == JPEG
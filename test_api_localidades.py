@@ -0,0 +1,27 @@
+def test_localidades_por_cp_con_etag(client):
+    resp = client.get("/api/localidades/28320")
+    assert resp.status_code == 200
+    assert "Pinto" in resp.get_json()["localidades"]
+    assert resp.headers["ETag"]
+    assert "max-age" in resp.headers["Cache-Control"]
+
+    resp2 = client.get("/api/localidades/28320", headers={"If-None-Match": resp.headers["ETag"]})
+    assert resp2.status_code == 304
+    assert resp2.data == b""
+
+
+def test_sugerencias_por_prefijo(client):
+    datos = client.get("/api/localidades/2832").get_json()
+    cps = [s["codigo_postal"] for s in datos["sugerencias"]]
+    assert cps == sorted(cps)
+    assert "28320" in cps
+    assert all(cp.startswith("2832") for cp in cps)
+
+    limitado = client.get("/api/localidades/28?limite=3").get_json()
+    assert len(limitado["sugerencias"]) == 3
+
+
+def test_codigo_invalido(client):
+    assert client.get("/api/localidades/2").status_code == 400
+    assert client.get("/api/localidades/28a20").status_code == 400
+    assert client.get("/api/localidades/99999").get_json() == {"localidades": []}
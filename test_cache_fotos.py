@@ -0,0 +1,119 @@
+from test_almacen_blobs import JPEG, _mascota_con_fotos
+from test_consultas_fotos import _capturar_sql, _selecciona_data
+from test_variantes_foto import _jpeg
+from web.utils.cache_fotos import CacheFotosDisco, CacheLRUBytes, FotoCacheada
+
+
+def _cacheada(data: bytes) -> FotoCacheada:
+    return FotoCacheada(data, "image/jpeg", "etag", None, "x.jpg")
+
+
+def test_cache_acotada_por_bytes():
+    cache = CacheLRUBytes(max_bytes=800)
+
+    for i in range(8):
+        cache.set((i, None, None), _cacheada(b"x" * 100))
+    assert cache.get((0, None, None)) is not None  # 0 pasa a ser la más reciente
+    cache.set((8, None, None), _cacheada(b"x" * 100))
+
+    assert cache.get((1, None, None)) is None
+    assert cache.get((0, None, None)) is not None
+    # Más de una octava parte del presupuesto no se guarda
+    cache.set((9, None, None), _cacheada(b"x" * 101))
+    assert cache.get((9, None, None)) is None
+
+    cache.set((0, 320, "webp"), _cacheada(b"y" * 50))
+    cache.invalidar_foto(0)
+    assert cache.get((0, None, None)) is None and cache.get((0, 320, "webp")) is None
+
+    estadisticas = cache.estadisticas()
+    # La variante de 0 expulsó a la 2; luego se invalidan las dos de la foto 0
+    assert estadisticas["bytes"] == 600 and estadisticas["entradas"] == 6
+    assert estadisticas["expulsiones"] == 2
+    assert estadisticas["aciertos"] == 2 and estadisticas["fallos"] == 4
+
+
+def test_cache_en_disco_compartida_entre_workers(tmp_path):
+    worker_a = CacheFotosDisco(tmp_path, max_bytes=800)
+    worker_b = CacheFotosDisco(tmp_path, max_bytes=800)
+
+    worker_a.set((1, None, None), _cacheada(b"a" * 100))
+    worker_a.set((1, 320, "jpeg"), _cacheada(b"b" * 50))
+    assert worker_b.get((1, None, None)).data == b"a" * 100
+
+    worker_b.invalidar_foto(1)
+    assert worker_a.get((1, None, None)) is None and worker_a.get((1, 320, "jpeg")) is None
+
+    for i in range(10):
+        worker_a.set((i, None, None), _cacheada(b"x" * 100))
+    estadisticas = worker_b.estadisticas()
+    assert estadisticas["bytes"] <= 800 and estadisticas["entradas"] == 8
+    assert worker_a.estadisticas()["expulsiones"] == 2
+
+
+def test_acierto_solo_consulta_los_metadatos(app, client, monkeypatch):
+    from web.models import FotoMascotaDesaparecida as Foto, db
+    from web.utils.almacen_blobs import AlmacenLocal
+    from web.utils.cache_fotos import obtener_cache_fotos
+
+    _, (foto,) = _mascota_con_fotos(db, JPEG)
+    primera = client.get(f"/foto/{foto.id}")
+
+    def _prohibido(*args, **kwargs):
+        raise AssertionError("Un acierto no debe abrir el blob")
+
+    monkeypatch.setattr(AlmacenLocal, "ruta_local", _prohibido)
+    monkeypatch.setattr(AlmacenLocal, "abrir", _prohibido)
+    with _capturar_sql(db) as sentencias:
+        resp = client.get(f"/foto/{foto.id}")
+        parcial = client.get(f"/foto/{foto.id}", headers={"Range": "bytes=0-9"})
+        revalidada = client.get(f"/foto/{foto.id}", headers={"If-None-Match": primera.headers["ETag"]})
+    consultas = [s for s in sentencias if "fotos_mascotas_desaparecidas" in s]
+    assert len(consultas) == 3 and not _selecciona_data(consultas)
+    monkeypatch.undo()
+
+    assert resp.data == JPEG and resp.headers["ETag"] == primera.headers["ETag"]
+    assert resp.headers["Cache-Control"] == "public, max-age=31536000"
+    assert parcial.status_code == 206 and parcial.data == JPEG[:10]
+    assert revalidada.status_code == 304
+    assert obtener_cache_fotos().estadisticas()["aciertos"] == 3
+
+    # Borrada desde otro worker (sin invalidar esta caché): no se sirve
+    db.session.query(Foto).filter(Foto.id == foto.id).delete()
+    db.session.commit()
+    assert client.get(f"/foto/{foto.id}").status_code == 404
+    assert obtener_cache_fotos().get((foto.id, None, None)) is None
+
+
+def test_borrar_la_mascota_invalida_sus_fotos(app, client, tmp_path):
+    from web.models import db
+    from web.utils.cache_fotos import obtener_cache_fotos
+
+    app.config.update(FOTOS_CACHE="disco", FOTOS_CACHE_DIR=str(tmp_path / "cache"))
+    data = _jpeg()
+    mascota, (foto,) = _mascota_con_fotos(db, data)
+    assert client.get(f"/foto/{foto.id}").data == data
+    assert client.get(f"/foto/{foto.id}?w=160").status_code == 200
+    assert obtener_cache_fotos().estadisticas()["entradas"] == 2
+
+    client.post(f"/mascotas/{mascota.id}/eliminar")
+    assert obtener_cache_fotos().estadisticas()["entradas"] == 0
+    assert client.get(f"/foto/{foto.id}").status_code == 404
+
+
+def test_sustituir_una_foto_la_invalida(app, client):
+    from web.models import db
+    from web.routes import _purgar_blobs_pendientes, eliminar_foto_obj
+    from web.utils.cache_fotos import obtener_cache_fotos
+
+    _, (foto, otra) = _mascota_con_fotos(db, JPEG, b"otra")
+    client.get(f"/foto/{foto.id}")
+    client.get(f"/foto/{otra.id}")
+
+    eliminar_foto_obj(foto)
+    db.session.commit()
+    _purgar_blobs_pendientes()
+
+    cache = obtener_cache_fotos()
+    assert cache.get((foto.id, None, None)) is None
+    assert cache.get((otra.id, None, None)) is not None
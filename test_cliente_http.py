@@ -0,0 +1,112 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from web.utils.cliente_http import ClienteHTTP, PlazoAgotado
+
+
+class _Servidor(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    respuestas: list = []
+    peticiones: list = []
+    conexiones: set = set()
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        type(self).peticiones.append(self.command)
+        type(self).conexiones.add(self.client_address)
+        codigo, cabeceras = self.respuestas.pop(0) if self.respuestas else (200, {})
+        self.send_response(codigo)
+        for nombre, valor in cabeceras.items():
+            self.send_header(nombre, valor)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    do_GET = do_POST = _responder
+
+
+@pytest.fixture
+def servidor():
+    _Servidor.respuestas = []
+    _Servidor.peticiones = []
+    _Servidor.conexiones = set()
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Servidor)
+    hilo = threading.Thread(target=srv.serve_forever, daemon=True)
+    hilo.start()
+    yield f"http://127.0.0.1:{srv.server_port}"
+    srv.shutdown()
+    srv.server_close()
+
+
+def _cliente(**opciones):
+    opciones.setdefault("espera_base", 0.001)
+    return ClienteHTTP("prueba", **opciones)
+
+
+def test_get_reintenta_errores_transitorios(servidor, caplog):
+    _Servidor.respuestas = [(503, {}), (502, {})]
+    cliente = _cliente(reintentos=2)
+    with caplog.at_level("WARNING", logger="web.utils.cliente_http"):
+        assert cliente.get(servidor).status_code == 200
+    assert [r.getMessage().split(" -> ")[1][:3] for r in caplog.records] == ["503", "502"]
+
+    metricas = cliente.metricas.estadisticas()
+    assert (metricas["peticiones"], metricas["reintentos"], metricas["errores"]) == (3, 2, 2)
+    assert metricas["por_estado"] == {"503": 1, "502": 1, "200": 1}
+
+
+def test_post_no_se_repite_salvo_429_o_503(servidor):
+    cliente = _cliente(reintentos=3)
+    _Servidor.respuestas = [(500, {})]
+    assert cliente.post(servidor, data={"a": 1}).status_code == 500
+    assert _Servidor.peticiones == ["POST"]
+
+    _Servidor.respuestas = [(429, {"Retry-After": "0"}), (503, {})]
+    assert cliente.post(servidor, data={"a": 1}).status_code == 200
+    assert _Servidor.peticiones == ["POST"] * 4
+
+
+def test_reintentos_agotados_devuelven_la_ultima_respuesta(servidor):
+    _Servidor.respuestas = [(503, {})] * 5
+    assert _cliente(reintentos=1).get(servidor).status_code == 503
+    assert len(_Servidor.peticiones) == 2
+
+
+def test_limite_corta_reintentos_y_no_envia_si_ya_paso(servidor):
+    cliente = _cliente(reintentos=5, espera_base=0.2, espera_max=0.2)
+    _Servidor.respuestas = [(503, {"Retry-After": "1"})] * 5
+    inicio = time.monotonic()
+    # La espera del reintento (0,2 s) no cabe en el plazo: se devuelve el 503
+    assert cliente.get(servidor, limite=time.monotonic() + 0.1).status_code == 503
+    assert time.monotonic() - inicio < 0.2
+    assert _Servidor.peticiones == ["GET"]
+
+    with pytest.raises(PlazoAgotado):
+        cliente.post(servidor, limite=time.monotonic() - 1)
+    assert _Servidor.peticiones == ["GET"]
+
+
+def test_conexion_rechazada_se_reintenta_y_propaga():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+    cliente = _cliente(reintentos=2)
+    with pytest.raises(requests.ConnectionError):
+        cliente.post(f"http://127.0.0.1:{puerto}/")
+    metricas = cliente.metricas.estadisticas()
+    assert (metricas["peticiones"], metricas["por_estado"]) == (3, {"error_red": 3})
+
+
+def test_keep_alive_reutiliza_la_conexion(servidor):
+    cliente = _cliente()
+    for _ in range(5):
+        cliente.get(servidor)
+    assert len(_Servidor.conexiones) == 1
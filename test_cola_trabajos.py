@@ -0,0 +1,385 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+from test_almacen_blobs import _mascota_con_fotos
+from test_envia_mail import EXTRA, brevo  # noqa: F401 (fixture)
+from test_publicar_fb import graph  # noqa: F401 (fixture)
+from test_variantes_foto import _jpeg
+from web import cola_trabajos
+from web.cola_trabajos import (
+    EN_CURSO, FALLIDO, HECHO, PENDIENTE, TrabajadorCola, encolar, manejador, reclamar,
+)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # Los hilos del pool necesitan una BD compartida: SQLite en fichero
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'cola.db'}")
+    from web import create_app
+    from web.models import db
+
+    app = create_app()
+    app.config.update(
+        TESTING=True,
+        EXTERNAL_BASE_URL="http://testserver",
+        FOTOS_STORAGE_DIR=str(tmp_path / "blobs"),
+        COLA_TRABAJADOR_EMBEBIDO=False,
+        COLA_BACKOFF_BASE=60,
+        COLA_MAX_INTENTOS=2,
+    )
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def llamadas(monkeypatch):
+    registro = []
+    monkeypatch.setattr(cola_trabajos, "MANEJADORES", dict(cola_trabajos.MANEJADORES))
+
+    @manejador("ok")
+    def _ok(mascota_id):
+        registro.append(("ok", mascota_id))
+
+    @manejador("falla")
+    def _falla(mascota_id):
+        registro.append(("falla", mascota_id))
+        return False
+
+    @manejador("explota")
+    def _explota(mascota_id):
+        raise RuntimeError("sin conexión")
+
+    return registro
+
+
+def _trabajo(clave):
+    from web.models import Trabajo, db
+
+    db.session.expire_all()
+    return Trabajo.query.filter_by(clave=clave).one()
+
+
+def test_encolar_es_idempotente(app):
+    from web.models import Trabajo, db
+
+    encolar("ok", 1)
+    encolar("ok", 1)
+    db.session.commit()
+    assert Trabajo.query.count() == 1
+    assert _trabajo("ok:1").version == 2
+
+
+def test_exito_fallo_y_reintento_con_espera(app, llamadas):
+    from web.models import db
+
+    for tipo in ("ok", "falla", "explota"):
+        encolar(tipo, 7)
+    db.session.commit()
+
+    assert TrabajadorCola(app, concurrencia=3).vaciar() == 3
+    assert _trabajo("ok:7").estado == HECHO
+
+    falla = _trabajo("falla:7")
+    assert (falla.estado, falla.intentos) == (PENDIENTE, 1)
+    espera = (falla.ejecutar_despues - datetime.utcnow()).total_seconds()
+    assert 40 < espera < 75
+    assert "RuntimeError: sin conexión" in _trabajo("explota:7").ultimo_error
+
+    # Todavía no toca: el reintento no se ejecuta antes de tiempo
+    assert TrabajadorCola(app).vaciar() == 0
+
+    falla.ejecutar_despues = datetime.utcnow()
+    db.session.commit()
+    TrabajadorCola(app).vaciar()
+    assert (_trabajo("falla:7").estado, _trabajo("falla:7").intentos) == (FALLIDO, 2)
+    assert llamadas.count(("falla", 7)) == 2
+
+
+def test_reclamar_es_exclusivo_y_recupera_abandonados(app, llamadas):
+    from web.models import db
+
+    encolar("ok", 1)
+    db.session.commit()
+    assert len(reclamar(5)) == 1
+    assert reclamar(5) == []
+
+    # Un worker que murió deja el trabajo 'en_curso': al vencer el lease se reclama
+    trabajo = _trabajo("ok:1")
+    assert trabajo.estado == EN_CURSO
+    trabajo.bloqueado_hasta = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert reclamar(5) == [trabajo.id]
+
+
+def test_reencolar_durante_la_ejecucion_la_repite(app, monkeypatch):
+    from web.models import db
+
+    monkeypatch.setattr(cola_trabajos, "MANEJADORES", {})
+    ejecuciones = []
+
+    @manejador("lento")
+    def _lento(mascota_id):
+        ejecuciones.append(mascota_id)
+        if len(ejecuciones) == 1:
+            encolar("lento", mascota_id)
+            db.session.commit()
+
+    encolar("lento", 3)
+    db.session.commit()
+    TrabajadorCola(app).vaciar()
+    assert ejecuciones == [3, 3]
+    assert _trabajo("lento:3").estado == HECHO
+
+
+def test_concurrencia_acotada(app, monkeypatch):
+    from web.models import db
+
+    monkeypatch.setattr(cola_trabajos, "MANEJADORES", {})
+    activos, maximo, lock = [0], [0], threading.Lock()
+
+    @manejador("espera")
+    def _espera(mascota_id):
+        with lock:
+            activos[0] += 1
+            maximo[0] = max(maximo[0], activos[0])
+        time.sleep(0.05)
+        with lock:
+            activos[0] -= 1
+
+    for mascota_id in range(8):
+        encolar("espera", mascota_id)
+    db.session.commit()
+
+    assert TrabajadorCola(app, concurrencia=3).vaciar() == 8
+    assert maximo[0] == 3
+
+
+def test_crear_mascota_encola_un_trabajo_por_canal(app, monkeypatch):
+    from web.models import Mascota, Trabajo, db
+    from web.utils.envia_mail import InformeEnvio
+
+    enviados = []
+    monkeypatch.setattr(
+        "web.routes.send_pet_email", lambda *a, **k: enviados.append("email") or InformeEnvio(enviados=["a@x.es"])
+    )
+    monkeypatch.setattr("web.routes.publish_pet_fb_post", lambda *a, **k: enviados.append("facebook") or False)
+    monkeypatch.setattr(
+        "web.routes.publicar_en_instagram", lambda *a, **k: enviados.append("instagram") or {"id": "ig_1"}
+    )
+
+    resp = app.test_client().post("/crear_mascota?tipo_registro=desaparecida", data={
+        "tipo_registro": "desaparecida", "nombre": "Toby", "especie": "perro",
+        "propietario_email": "a@x.es", "propietario_telefono": "600000000",
+        "zona": "Pinto", "codigo_postal": "28320", "color": "marron",
+        "sexo": "macho", "tamano": "mediano",
+    })
+    assert resp.status_code == 302
+    mascota_id = Mascota.query.one().id
+    assert sorted(t.clave for t in Trabajo.query) == [
+        f"{canal}:{mascota_id}" for canal in ("email", "facebook", "instagram")
+    ]
+
+    TrabajadorCola(app).vaciar()
+    assert sorted(enviados) == ["email", "facebook", "instagram"]
+    # Facebook falla y se reintentará; los demás canales no se ven afectados
+    assert _trabajo(f"facebook:{mascota_id}").estado == PENDIENTE
+    assert _trabajo(f"email:{mascota_id}").estado == HECHO
+    assert _trabajo(f"instagram:{mascota_id}").estado == HECHO
+    assert _trabajo(f"instagram:{mascota_id}").id_externo == "ig_1"
+
+
+def test_publicacion_registrada_no_se_repite(app, monkeypatch):
+    from web.models import db
+
+    monkeypatch.setattr(cola_trabajos, "MANEJADORES", {})
+    publicaciones = []
+
+    @manejador("facebook")
+    def _publicar(mascota_id):
+        if cola_trabajos.publicacion_registrada():
+            return True
+        publicaciones.append(mascota_id)
+        cola_trabajos.registrar_publicacion("post_1")
+        raise RuntimeError("falló después de publicar")
+
+    @manejador("instagram")
+    def _publicar_con_5xx(mascota_id):
+        respuesta = requests.Response()
+        respuesta.status_code = 502
+        raise requests.HTTPError("502 Bad Gateway", response=respuesta)
+
+    encolar("facebook", 5)
+    encolar("instagram", 5)
+    db.session.commit()
+    TrabajadorCola(app).vaciar()
+    trabajo = _trabajo("facebook:5")
+    assert (trabajo.estado, trabajo.id_externo) == (PENDIENTE, "post_1")
+    # Un 5xx al publicar no dice si se creó: no se reintenta
+    assert _trabajo("instagram:5").estado == FALLIDO
+
+    trabajo.ejecutar_despues = datetime.utcnow()
+    db.session.commit()
+    TrabajadorCola(app).vaciar()
+    assert _trabajo("facebook:5").estado == HECHO
+    assert publicaciones == [5]
+
+    # Volver a encolar (la mascota cambió) sí publica otra vez
+    encolar("facebook", 5)
+    db.session.commit()
+    assert _trabajo("facebook:5").id_externo is None
+    TrabajadorCola(app).vaciar()
+    assert publicaciones == [5, 5]
+
+
+def test_reintento_de_correo_solo_a_los_pendientes(app, monkeypatch):
+    from web.models import db
+    from web.routes import _notificar_email
+    from web.utils.envia_mail import InformeEnvio
+
+    llamadas = []
+
+    def _enviar(*args, solo_destinatarios=None, **kwargs):
+        llamadas.append(solo_destinatarios)
+        if solo_destinatarios is None:
+            return InformeEnvio(enviados=["a@x.es"], fallidos=["b@x.es"])
+        return InformeEnvio(enviados=list(solo_destinatarios))
+
+    monkeypatch.setattr("web.routes.send_pet_email", _enviar)
+    monkeypatch.setattr("web.routes._mascota_a_notificar", lambda mascota_id: object())
+    for nombre in ("_construir_datos_email", "_obtener_rutas_fotos", "_calcular_destinatarios_extra"):
+        monkeypatch.setattr(f"web.routes.{nombre}", lambda mascota: [])
+    monkeypatch.setattr("web.routes._asunto_notificacion", lambda mascota: "Perdido")
+    monkeypatch.setattr(cola_trabajos, "MANEJADORES", {"email": _notificar_email})
+
+    encolar("email", 6)
+    db.session.commit()
+    TrabajadorCola(app).vaciar()
+    trabajo = _trabajo("email:6")
+    assert trabajo.estado == PENDIENTE and trabajo.progreso == '["b@x.es"]'
+
+    trabajo.ejecutar_despues = datetime.utcnow()
+    db.session.commit()
+    TrabajadorCola(app).vaciar()
+    assert _trabajo("email:6").estado == HECHO
+    assert llamadas == [None, ["b@x.es"]]
+
+
+def test_plazo_por_canal_y_registro_de_intentos(app, llamadas):
+    from web.models import EjecucionTrabajo, db
+
+    plazos = []
+
+    @manejador("colgado")
+    def _colgado(mascota_id):
+        plazos.append(cola_trabajos.tiempo_restante())
+        time.sleep(0.1)
+        raise TimeoutError("sin respuesta")
+
+    @manejador("facebook")
+    def _publicar(mascota_id):
+        raise requests.ReadTimeout("sin respuesta")
+
+    app.config["COLA_TIMEOUT_COLGADO"] = 0.5
+    for tipo in ("ok", "falla", "colgado", "facebook"):
+        encolar(tipo, 4)
+    db.session.commit()
+
+    TrabajadorCola(app, concurrencia=4).vaciar()
+    assert 0 < plazos[0] <= 0.5
+    assert cola_trabajos.tiempo_restante(7) == 7
+
+    colgado = _trabajo("colgado:4")
+    assert colgado.estado == PENDIENTE
+    assert "Tiempo agotado" in colgado.ultimo_error
+    # Una publicación sin confirmar no se repite: queda para revisarla
+    publicacion = _trabajo("facebook:4")
+    assert (publicacion.estado, publicacion.intentos) == (FALLIDO, 1)
+    assert "comprobar si se publicó" in publicacion.ultimo_error
+
+    resultados = {e.tipo: e.resultado for e in EjecucionTrabajo.query}
+    assert resultados == {"ok": "ok", "falla": "error", "colgado": "timeout", "facebook": "timeout"}
+    assert all(e.duracion_ms >= 0 and e.intento == 1 for e in EjecucionTrabajo.query)
+
+    estadisticas = cola_trabajos.estadisticas_canales()
+    assert estadisticas["colgado"]["timeout"] == 1
+    assert estadisticas["colgado"]["media_ms"] >= 100
+
+
+def test_correo_no_empieza_lotes_tras_el_plazo(app, brevo, monkeypatch):
+    from web.models import EjecucionTrabajo, db
+    from web.routes import _notificar_email
+
+    mascota, _ = _mascota_con_fotos(db)
+    monkeypatch.setattr("web.routes._calcular_destinatarios_extra", lambda mascota: EXTRA)
+    # El manejador relee la configuración SMTP del entorno
+    for nombre in ("SMTP_USERNAME", "SMTP_PASSWORD", "SMTP_TO_EMAIL"):
+        monkeypatch.setenv(nombre, app.config[nombre])
+    monkeypatch.setattr(cola_trabajos, "MANEJADORES", {"email": _notificar_email})
+    # 25 destinatarios en lotes de 10 y 0,3 s por petición: el tercero ya no cabe
+    brevo.retardo = 0.3
+    app.config["COLA_TIMEOUT_EMAIL"] = 0.5
+
+    encolar("email", mascota.id)
+    db.session.commit()
+    TrabajadorCola(app).vaciar()
+
+    assert len(brevo.peticiones) == 2
+    trabajo = _trabajo(f"email:{mascota.id}")
+    assert trabajo.estado == PENDIENTE
+    assert len(json.loads(trabajo.progreso)) == 15
+    assert EjecucionTrabajo.query.one().duracion_ms < 800
+
+
+def test_facebook_no_publica_tras_el_plazo(app, graph, monkeypatch):
+    from web.models import EjecucionTrabajo, db
+    from web.routes import _notificar_facebook
+
+    mascota, _ = _mascota_con_fotos(db, *(_jpeg(100 + i, 100) for i in range(6)))
+    monkeypatch.setattr(cola_trabajos, "MANEJADORES", {"facebook": _notificar_facebook})
+    # 6 fotos de 0,2 s, 3 a la vez: la segunda tanda no termina en plazo
+    app.config["COLA_TIMEOUT_FACEBOOK"] = 0.3
+
+    encolar("facebook", mascota.id)
+    db.session.commit()
+    TrabajadorCola(app).vaciar()
+
+    assert not any(ruta.endswith("/feed") for ruta, _ in graph.peticiones)
+    trabajo = _trabajo(f"facebook:{mascota.id}")
+    # No llegó a publicar: se puede reintentar
+    assert (trabajo.estado, trabajo.id_externo) == (PENDIENTE, None)
+    assert EjecucionTrabajo.query.one().duracion_ms < 600
+
+
+def test_instagram_informa_del_fallo_como_los_demas_canales(app, monkeypatch):
+    from web.models import db
+    from web.routes import _notificar_instagram
+    from web.utils.publicar_en_instagram import ErrorContenedorInstagram
+
+    mascota, _ = _mascota_con_fotos(db, _jpeg())
+    monkeypatch.setattr(cola_trabajos, "MANEJADORES", {"instagram": _notificar_instagram})
+
+    def _contenedor_con_error(*args, **kwargs):
+        raise ErrorContenedorInstagram("Contenedor c1 en estado ERROR")
+
+    monkeypatch.setattr("web.routes.publicar_en_instagram", _contenedor_con_error)
+    encolar("instagram", mascota.id)
+    db.session.commit()
+    TrabajadorCola(app).vaciar()
+    trabajo = _trabajo(f"instagram:{mascota.id}")
+    # No llegó a publicar: se reintenta como un fallo de correo o Facebook
+    assert (trabajo.estado, trabajo.ultimo_error) == (PENDIENTE, "El canal devolvió un error")
+
+    monkeypatch.setattr("web.routes.publicar_en_instagram", lambda *a, **k: {"id": "ig_1"})
+    trabajo.ejecutar_despues = datetime.utcnow()
+    db.session.commit()
+    TrabajadorCola(app).vaciar()
+    trabajo = _trabajo(f"instagram:{mascota.id}")
+    assert (trabajo.estado, trabajo.id_externo) == (HECHO, "ig_1")
@@ -0,0 +1,110 @@
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+
+@contextmanager
+def _capturar_sql(db):
+    sentencias = []
+
+    def _registrar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", _registrar)
+    try:
+        yield sentencias
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _registrar)
+
+
+def _selecciona_data(sentencias):
+    return [s for s in sentencias if "fotos_mascotas_desaparecidas.data" in s]
+
+
+@pytest.fixture
+def mascotas(app):
+    from web.models import FotoMascotaDesaparecida as Foto, Mascota, db
+
+    creadas = []
+    for i, tipo in enumerate(["desaparecida", "encontrada", "encontrada"]):
+        mascota = Mascota(
+            nombre=f"toby{i}", especie="perro", propietario_email="a@x.es",
+            propietario_telefono="600000000", zona="pinto", codigo_postal="28320",
+            tipo_registro=tipo, color="marron", sexo="macho", tamano="mediano",
+            fecha_registro=date(2024, 5, 1 + i), longitud=-3.6999, latitud=40.2415,
+        )
+        db.session.add(mascota)
+        db.session.flush()
+        # Filas antiguas con el binario en la tabla: el peor caso
+        for tipo_foto in ("cara", "lateral"):
+            db.session.add(Foto(
+                mascota_id=mascota.id, tipo_foto=tipo_foto, ruta="fotos/x.jpg",
+                data=b"x" * 10000, mime_type="image/jpeg",
+            ))
+        creadas.append(mascota)
+    db.session.commit()
+    ids = [m.id for m in creadas]
+    db.session.expunge_all()
+    return ids
+
+
+def test_listados_no_cargan_binarios(app, client, mascotas):
+    from web.models import db
+
+    with _capturar_sql(db) as sentencias:
+        assert client.post("/buscar_mascotas", data={"nombre": "toby"}).status_code == 200
+        assert client.post("/modificar_mascotas", data={}).status_code == 200
+        assert client.get("/comparar_mascotas/desaparecidas").status_code == 200
+        assert client.get(f"/comparar_mascotas/{mascotas[0]}/candidatas").status_code == 200
+        assert client.get(f"/comparar_mascotas/{mascotas[0]}/con/{mascotas[1]}").status_code == 200
+
+    assert sentencias
+    assert _selecciona_data(sentencias) == []
+
+
+def test_caminos_con_binarios_los_piden_explicitamente(app, client, mascotas):
+    from web.models import db
+    from web.routes import _obtener_rutas_fotos
+    from web.models import Mascota
+
+    with _capturar_sql(db) as sentencias:
+        fotos = _obtener_rutas_fotos(db.session.get(Mascota, mascotas[0]))
+
+    assert [f["data"] for f in fotos] == [b"x" * 10000] * 2
+    assert len(_selecciona_data(sentencias)) == 1
+
+
+def _contar_consultas(db, client, metodo, url, **kwargs):
+    with _capturar_sql(db) as sentencias:
+        resp = getattr(client, metodo)(url, **kwargs)
+    assert resp.status_code == 200
+    return len(sentencias)
+
+
+def test_listados_sin_consultas_por_mascota(app, client, mascotas):
+    from web.models import FotoMascotaDesaparecida as Foto, Mascota, db
+
+    paginas = [
+        ("post", "/buscar_mascotas", {"data": {"nombre": "toby"}}),
+        ("post", "/modificar_mascotas", {"data": {}}),
+        ("get", f"/comparar_mascotas/{mascotas[0]}/candidatas", {}),
+    ]
+    antes = [_contar_consultas(db, client, m, url, **kw) for m, url, kw in paginas]
+
+    for i in range(10):
+        mascota = Mascota(
+            nombre=f"extra{i}", especie="perro", propietario_email="b@x.es",
+            propietario_telefono="600000000", zona="pinto", codigo_postal="28320",
+            tipo_registro="encontrada", color="negro", sexo="hembra", tamano="grande",
+            fecha_registro=date(2024, 6, 1 + i), longitud=-3.6999, latitud=40.2415,
+        )
+        db.session.add(mascota)
+        db.session.flush()
+        db.session.add(Foto(mascota_id=mascota.id, tipo_foto="cara", ruta="fotos/y.jpg"))
+    db.session.commit()
+    db.session.expunge_all()
+
+    despues = [_contar_consultas(db, client, m, url, **kw) for m, url, kw in paginas]
+    assert despues == antes
@@ -0,0 +1,122 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from web.utils.calcula_KM_con_CP import dentro_de_radio, distancia_km, distancias_km
+
+
+def _mascota(**campos):
+    from web.models import Mascota
+
+    datos = dict(
+        nombre="toby", especie="perro", propietario_telefono="600000000",
+        color="marron", sexo="macho", tamano="mediano",
+    )
+    datos.update(campos)
+    return Mascota(**datos)
+
+
+def test_distancias_km_coincide_con_escalar():
+    destinos = [(-3.7026, 40.4165), (2.1734, 41.3851), (-2.4597, 36.8381)]
+    lons, lats = zip(*destinos)
+    lote = distancias_km(-3.6999, 40.2415, lons, lats)
+    for (lon, lat), d in zip(destinos, lote):
+        assert d == pytest.approx(distancia_km(-3.6999, 40.2415, lon, lat))
+
+
+def test_dentro_de_radio_con_desconocidos():
+    lons = np.array([-3.7026, 2.1734, np.nan])
+    lats = np.array([40.4165, 41.3851, np.nan])
+    radios = np.array([50, 50, 50])
+    assert dentro_de_radio(-3.6999, 40.2415, lons, lats, radios).tolist() == [True, False, False]
+    assert dentro_de_radio(
+        -3.6999, 40.2415, lons, lats, radios, incluir_desconocidos=True
+    ).tolist() == [True, False, True]
+
+
+def test_destinatarios_filtrados_por_radio(app):
+    from web.models import db
+    from web.routes import _calcular_destinatarios_extra
+
+    db.session.add_all([
+        _mascota(propietario_email="cerca@x.es", zona="pinto", codigo_postal="28320",
+                 tipo_registro="desaparecida", fecha_registro=date(2025, 1, 1)),
+        _mascota(propietario_email="lejos@x.es", zona="barcelona", codigo_postal="08001",
+                 tipo_registro="desaparecida", fecha_registro=date(2025, 1, 1)),
+        _mascota(propietario_email="desconocido@x.es", zona="nada", codigo_postal="99999",
+                 tipo_registro="desaparecida", fecha_registro=date(2025, 1, 1)),
+        _mascota(propietario_email="posterior@x.es", zona="pinto", codigo_postal="28320",
+                 tipo_registro="desaparecida", fecha_registro=date(2025, 3, 1)),
+    ])
+    encontrada = _mascota(propietario_email="finder@x.es", zona="madrid", codigo_postal="28001",
+                          tipo_registro="encontrada", fecha_registro=date(2025, 1, 5))
+    db.session.add(encontrada)
+    db.session.commit()
+
+    destinatarios = _calcular_destinatarios_extra(encontrada)
+    assert destinatarios[0] == "finder@x.es"
+    assert sorted(destinatarios[1:]) == ["cerca@x.es", "desconocido@x.es"]
+
+
+def test_filtro_por_cp_solo_consulta_los_cercanos(app):
+    from test_consultas_fotos import _capturar_sql
+    from web.models import db
+    from web.routes import _calcular_destinatarios_extra
+
+    cerca = _mascota(propietario_email="cerca@x.es", zona="pinto", codigo_postal=" 28320",
+                     tipo_registro="desaparecida", fecha_registro=date(2025, 1, 1))
+    lejos = _mascota(propietario_email="lejos@x.es", zona="barcelona", codigo_postal="8001",
+                     tipo_registro="desaparecida", fecha_registro=date(2025, 1, 1),
+                     longitud=2.1734, latitud=41.3851)
+    # Sin zona no hay distancia fiable: se incluye aunque esté lejos
+    sin_zona = _mascota(propietario_email="sinzona@x.es", zona="", codigo_postal="08001",
+                        tipo_registro="desaparecida", fecha_registro=date(2025, 1, 1),
+                        longitud=2.1734, latitud=41.3851)
+    db.session.add_all([cerca, lejos, sin_zona])
+    encontrada = _mascota(propietario_email="finder@x.es", zona="madrid", codigo_postal="28001",
+                          tipo_registro="encontrada", fecha_registro=date(2025, 1, 5))
+    db.session.add(encontrada)
+    db.session.commit()
+    assert (cerca.codigo_postal, lejos.codigo_postal) == ("28320", "08001")
+
+    with _capturar_sql(db) as sentencias:
+        destinatarios = _calcular_destinatarios_extra(encontrada)
+    assert sorted(destinatarios[1:]) == ["cerca@x.es", "sinzona@x.es"]
+    assert not [s for s in sentencias if "DISTINCT mascota.codigo_postal" in s]
+
+
+def test_indice_espacial_equivale_a_fuerza_bruta():
+    from web.utils.indice_espacial_cp import obtener_indice_espacial
+
+    indice = obtener_indice_espacial()
+    for lon, lat, radio in [(-3.6999, 40.2415, 100), (2.1734, 41.3851, 20), (-16.25, 28.46, 60)]:
+        dist = distancias_km(lon, lat, indice.lons, indice.lats)
+        esperado = set(indice.cps[dist <= radio].tolist())
+        assert indice.cps_en_radio_lonlat(lon, lat, radio) == esperado
+    assert indice.cps_en_radio("99999", "", 50) is None
+
+
+def test_geocodificar_mascotas_cli_y_coordenadas_guardadas(app):
+    from web.comandos import geocodificar_mascotas_cmd
+    from web.models import Mascota, db
+    from web.routes import _calcular_destinatarios_extra
+
+    desap = _mascota(propietario_email="cerca@x.es", zona="pinto", codigo_postal="28320",
+                     tipo_registro="desaparecida", fecha_registro=date(2025, 1, 1))
+    db.session.add(desap)
+    db.session.commit()
+    assert desap.latitud is None
+
+    resultado = app.test_cli_runner().invoke(geocodificar_mascotas_cmd)
+    assert "Geocodificadas: 1" in resultado.output
+    desap = db.session.get(Mascota, desap.id)
+    assert desap.latitud == pytest.approx(40.24, abs=0.05)
+
+    # Las coordenadas guardadas mandan sobre el código postal
+    desap.longitud, desap.latitud = 2.1734, 41.3851
+    encontrada = _mascota(propietario_email="finder@x.es", zona="pinto", codigo_postal="28320",
+                          tipo_registro="encontrada", fecha_registro=date(2025, 1, 2))
+    db.session.add(encontrada)
+    db.session.commit()
+    assert _calcular_destinatarios_extra(encontrada) == ["finder@x.es"]
@@ -0,0 +1,143 @@
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from web.utils import envia_mail
+
+
+class _BrevoFalso(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    peticiones: list = []
+    fallan: set = set()
+    retardo = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).peticiones.append((time.monotonic(), self.headers["api-key"], cuerpo))
+        numero = len(self.peticiones)
+        time.sleep(self.retardo)
+        codigo = 400 if numero in self.fallan else 201
+        respuesta = json.dumps({"messageIds": [f"<{numero}@brevo>"]}).encode()
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(respuesta)))
+        self.end_headers()
+        self.wfile.write(respuesta)
+
+
+@pytest.fixture
+def brevo(app, monkeypatch):
+    _BrevoFalso.peticiones = []
+    _BrevoFalso.fallan = set()
+    _BrevoFalso.retardo = 0.0
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _BrevoFalso)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    monkeypatch.setattr(envia_mail, "BREVO_URL", f"http://127.0.0.1:{servidor.server_port}/v3/smtp/email")
+    app.config.update(
+        SMTP_USERNAME="avisos@buscarmascotas.com",
+        SMTP_PASSWORD="clave-brevo",
+        SMTP_TO_EMAIL="admin@buscarmascotas.com",
+        BREVO_LOTE_DESTINATARIOS=10,
+        BREVO_PAUSA_LOTES=0.05,
+    )
+    yield _BrevoFalso
+    servidor.shutdown()
+    servidor.server_close()
+
+
+FOTOS = [{"id": 1, "data": b"\xff\xd8jpeg", "nombre_archivo": "foto_1.jpg", "mime_type": "image/jpeg"}]
+EXTRA = [f"vecino{i}@x.es" for i in range(23)]
+
+
+def test_envio_por_lotes_con_una_version_por_destinatario(brevo):
+    assert envia_mail.send_pet_email("Encontrado", {"Nombre": "Toby"}, FOTOS, destinatarios_extra=EXTRA)
+
+    # admin + buzón fijo + 23 vecinos = 25 destinatarios -> lotes de 10, 10 y 5
+    cuerpos = [cuerpo for _, _, cuerpo in brevo.peticiones]
+    assert [len(c["messageVersions"]) for c in cuerpos] == [10, 10, 5]
+    assert all(len(v["to"]) == 1 for c in cuerpos for v in c["messageVersions"])
+    enviados = [v["to"][0]["email"] for c in cuerpos for v in c["messageVersions"]]
+    assert enviados[:2] == ["admin@buscarmascotas.com", "encontrar.mi.mascota@gmail.com"]
+    assert enviados[2:] == EXTRA
+    assert all("to" not in c for c in cuerpos)
+
+    # Mismos adjuntos en todos los lotes
+    adjunto = {"name": "foto_1.jpg", "content": base64.b64encode(b"\xff\xd8jpeg").decode()}
+    assert all(c["attachment"] == [adjunto] for c in cuerpos)
+    assert {clave for _, clave, _ in brevo.peticiones} == {"clave-brevo"}
+
+    # Pausa entre lotes
+    instantes = [t for t, _, _ in brevo.peticiones]
+    assert all(b - a >= 0.05 for a, b in zip(instantes, instantes[1:]))
+
+
+def test_adjuntos_se_codifican_una_vez(brevo, monkeypatch):
+    codificados = []
+    original = base64.b64encode
+    monkeypatch.setattr(envia_mail.base64, "b64encode", lambda d: codificados.append(d) or original(d))
+
+    envia_mail.send_pet_email("Encontrado", {"Nombre": "Toby"}, FOTOS, destinatarios_extra=EXTRA)
+    assert len(brevo.peticiones) == 3
+    assert len(codificados) == 1
+
+
+def test_fallo_parcial_devuelve_los_pendientes(brevo):
+    brevo.fallan = {2}
+    informe = envia_mail.send_pet_email("Encontrado", {"Nombre": "Toby"}, FOTOS, destinatarios_extra=EXTRA)
+    assert informe and not informe.completo
+    assert len(brevo.peticiones) == 3
+    assert informe.fallidos == EXTRA[8:18]
+
+    # El reintento va solo a quienes no lo recibieron
+    brevo.peticiones = []
+    brevo.fallan = set()
+    reintento = envia_mail.send_pet_email(
+        "Encontrado", {"Nombre": "Toby"}, FOTOS, destinatarios_extra=EXTRA, solo_destinatarios=informe.fallidos,
+    )
+    assert reintento.completo and reintento.enviados == EXTRA[8:18]
+    assert [v["to"][0]["email"] for v in brevo.peticiones[0][2]["messageVersions"]] == EXTRA[8:18]
+
+    brevo.peticiones = []
+    brevo.fallan = {1}
+    assert not envia_mail.send_pet_email("Encontrado", {"Nombre": "Toby"}, FOTOS)
+
+
+def test_fotos_sin_datos_se_resuelven_en_proceso(brevo, monkeypatch):
+    from test_almacen_blobs import JPEG, _mascota_con_fotos
+    from web.models import db
+
+    _, (foto,) = _mascota_con_fotos(db, JPEG)
+
+    def _sin_http(*args, **kwargs):
+        raise AssertionError("No debe pedirse la foto a la propia app por HTTP")
+
+    monkeypatch.setattr(envia_mail.obtener_cliente("app_local"), "request", _sin_http)
+
+    data, mime = envia_mail.descargar_url_local(f"http://testserver/foto/{foto.id}.jpg")
+    assert isinstance(data, memoryview) and data == JPEG and mime == "image/jpeg"
+
+    fotos = [{"id": foto.id, "url": f"/foto/{foto.id}", "nombre_archivo": "foto.jpg"}]
+    assert envia_mail.send_pet_email("Encontrado", {"Nombre": "Toby"}, fotos)
+    adjunto = brevo.peticiones[0][2]["attachment"][0]
+    assert base64.b64decode(adjunto["content"]) == JPEG
+
+
+def test_solo_se_resuelven_urls_de_la_propia_app(app):
+    from web.utils.resolver_fotos import id_foto_de_url
+
+    app.config["IG_MEDIA_BASE_URL"] = "https://mascotas.onrender.com"
+    assert id_foto_de_url("/foto/5") == 5
+    assert id_foto_de_url("/foto/5.jpg?w=320") == 5
+    assert id_foto_de_url("http://testserver/foto/5.jpg") == 5
+    assert id_foto_de_url("https://mascotas.onrender.com/foto/6") == 6
+    assert id_foto_de_url("https://otro.example/foto/5.jpg") is None
+    assert id_foto_de_url("ftp://testserver/foto/5") is None
+    assert id_foto_de_url("/foto/5/otra") is None
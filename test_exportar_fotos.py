@@ -0,0 +1,130 @@
+import json
+
+import pytest
+
+from test_almacen_blobs import _mascota_con_fotos
+from test_variantes_foto import _jpeg
+from web.utils.almacen_blobs import calcular_hash
+
+
+@pytest.fixture
+def media(app, tmp_path):
+    app.config.update(MEDIA_DIR=str(tmp_path / "media"), MEDIA_BASE_URL="https://cdn.example/media/")
+    return tmp_path / "media"
+
+
+def _manifiesto(media):
+    return json.loads((media / "manifest.json").read_text("utf-8"))["fotos"]
+
+
+def test_exportacion_incremental_e_idempotente(app, media):
+    from web.models import FotoMascotaDesaparecida as Foto, db
+
+    data = _jpeg()
+    mascota, (foto,) = _mascota_con_fotos(db, data)
+    # Fila antigua: el nombre sale del hash de su binario
+    antigua_data = _jpeg(600, 400)
+    antigua = Foto(mascota_id=mascota.id, tipo_foto="antigua", ruta="fotos/x.jpg",
+                   data=antigua_data, mime_type="image/jpeg")
+    db.session.add(antigua)
+    db.session.commit()
+
+    resultado = app.test_cli_runner().invoke(args=["exportar-fotos"])
+    assert "Exportadas: 2. Sin cambios: 0" in resultado.output
+
+    huella = foto.hash_contenido
+    assert (media / f"{huella}.jpg").read_bytes() == data
+    for nombre in (f"{huella}-320.jpg", f"{huella}-320.webp", f"{huella}-1024.jpg", f"{huella}-1024.webp"):
+        assert (media / nombre).is_file()
+    manifiesto = _manifiesto(media)
+    assert manifiesto[str(foto.id)]["original"] == f"{huella}.jpg"
+    assert manifiesto[str(antigua.id)]["original"] == f"{calcular_hash(antigua_data)}.jpg"
+
+    escrito = (media / f"{huella}.jpg").stat().st_mtime_ns
+    resultado = app.test_cli_runner().invoke(args=["exportar-fotos"])
+    assert "Exportadas: 0. Sin cambios: 2" in resultado.output
+    assert (media / f"{huella}.jpg").stat().st_mtime_ns == escrito
+
+
+def test_foto_url_apunta_a_la_cdn_si_esta_exportada(app, media):
+    from web.models import db
+    from web.routes import _foto_url
+    from web.utils.exportar_fotos import obtener_exportador
+
+    _, (foto,) = _mascota_con_fotos(db, _jpeg())
+    assert _foto_url(foto.id) == f"http://testserver/foto/{foto.id}.jpg"
+
+    obtener_exportador().exportar([foto])
+    assert _foto_url(foto.id) == f"https://cdn.example/media/{foto.hash_contenido}.jpg"
+    assert _foto_url(foto.id, for_instagram=True) == f"https://cdn.example/media/{foto.hash_contenido}.jpg"
+
+
+def test_las_plantillas_usan_las_variantes_exportadas(app, media):
+    from web.models import db
+    from web.utils.exportar_fotos import obtener_exportador
+
+    _, (foto,) = _mascota_con_fotos(db, _jpeg())
+    foto_url = app.jinja_env.globals["foto_url"]
+    with app.test_request_context():
+        assert foto_url(foto.id, variante="thumb") == f"/foto/{foto.id}?variante=thumb"
+
+        obtener_exportador().exportar([foto])
+        huella = foto.hash_contenido
+        assert foto_url(foto.id, variante="thumb") == f"https://cdn.example/media/{huella}-320.jpg"
+        assert foto_url(foto.id, ancho=300) == f"https://cdn.example/media/{huella}-320.jpg"
+        assert foto_url(foto.id, variante="medium") == f"https://cdn.example/media/{huella}-1024.jpg"
+        # 160 px no se exporta: se sigue sirviendo desde /foto
+        assert foto_url(foto.id, ancho=160) == f"/foto/{foto.id}?w=160"
+
+
+def test_subida_encola_la_exportacion(app, media):
+    from web.models import Trabajo, db
+    from web.routes import _exportar_fotos_mascota, _programar_envio_correo
+
+    mascota, (foto,) = _mascota_con_fotos(db, _jpeg())
+    _programar_envio_correo(mascota.id)
+    assert Trabajo.query.filter_by(clave=f"media:{mascota.id}").count() == 1
+
+    assert _exportar_fotos_mascota(mascota.id) is True
+    assert str(foto.id) in _manifiesto(media)
+
+
+def test_borrar_despublica_sin_tocar_ficheros_compartidos(app, client, media):
+    from web.models import db
+    from web.utils.exportar_fotos import obtener_exportador
+
+    compartida, propia = _jpeg(), _jpeg(500, 500)
+    _, (foto_a,) = _mascota_con_fotos(db, compartida)
+    mascota_b, (foto_b, foto_propia) = _mascota_con_fotos(db, compartida, propia, nombre="luna")
+    obtener_exportador().exportar([foto_a, foto_b, foto_propia])
+
+    client.post(f"/mascotas/{mascota_b.id}/eliminar")
+
+    assert set(_manifiesto(media)) == {str(foto_a.id)}
+    assert (media / f"{calcular_hash(compartida)}.jpg").is_file()
+    assert not (media / f"{calcular_hash(propia)}.jpg").exists()
+    assert not (media / f"{calcular_hash(propia)}-320.webp").exists()
+
+
+def test_rollback_al_editar_no_despublica_las_fotos(app, client, media, monkeypatch):
+    from web.models import db
+    from web.utils.exportar_fotos import obtener_exportador
+
+    mascota, (foto,) = _mascota_con_fotos(db, _jpeg())
+    obtener_exportador().exportar([foto])
+
+    def commit_fallido():
+        raise RuntimeError("BD caída")
+
+    monkeypatch.setattr(db.session, "commit", commit_fallido)
+    resp = client.post(f"/mascotas/{mascota.id}/editar", data={
+        "tipo_registro": "desaparecida", "nombre": "Toby", "especie": "perro",
+        "propietario_email": "a@x.es", "propietario_telefono": "600000000",
+        "zona": "Pinto", "codigo_postal": "28320", "color": "marron",
+        "sexo": "macho", "tamano": "mediano", "fotos_eliminar_id": str(foto.id),
+    })
+    monkeypatch.undo()
+
+    assert resp.status_code == 302
+    assert str(foto.id) in _manifiesto(media)
+    assert (media / f"{foto.hash_contenido}.jpg").is_file()
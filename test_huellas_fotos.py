@@ -0,0 +1,113 @@
+import io
+import random
+from datetime import date
+
+import numpy as np
+from PIL import Image
+
+from web.utils.huellas_fotos import ArbolBK, calcular_huellas, distancia
+
+
+def _imagen(semilla, ancho=400, alto=300, calidad=90):
+    # Ruido suavizado: estructura a gran escala, como una foto
+    rng = np.random.default_rng(semilla)
+    base = Image.fromarray(rng.integers(0, 255, (6, 8, 3), dtype=np.uint8))
+    salida = io.BytesIO()
+    base.resize((ancho, alto), Image.BICUBIC).save(salida, "JPEG", quality=calidad)
+    return salida.getvalue()
+
+
+def _combinada(data):
+    return calcular_huellas(data).combinada
+
+
+def test_huellas_resisten_reescalado_y_recompresion():
+    original = _combinada(_imagen(1))
+    assert distancia(original, _combinada(_imagen(1, 200, 150, calidad=40))) <= 16
+    assert distancia(original, _combinada(_imagen(2))) > 48
+
+    huellas = calcular_huellas(_imagen(1))
+    assert len(huellas.a_hex()[2]) == 16
+    assert type(huellas).de_hex(*huellas.a_hex()) == huellas
+
+
+def test_arbol_bk_coincide_con_la_busqueda_exhaustiva():
+    aleatorio = random.Random(7)
+    huellas = [aleatorio.getrandbits(64) for _ in range(500)]
+    arbol = ArbolBK()
+    for i, huella in enumerate(huellas):
+        arbol.insertar(huella, i)
+    arbol.insertar(huellas[0], "duplicada")
+
+    for consulta in huellas[:20] + [aleatorio.getrandbits(64) for _ in range(20)]:
+        for radio in (0, 10, 24):
+            esperados = sorted(
+                (distancia(consulta, h), i) for i, h in enumerate(huellas) if distancia(consulta, h) <= radio
+            )
+            encontrados = [(d, v) for d, v in arbol.buscar(consulta, radio) if v != "duplicada"]
+            assert sorted(encontrados) == esperados
+    assert (0, "duplicada") in arbol.buscar(huellas[0], 0)
+
+
+def _mascota(db, tipo, nombre, *contenidos):
+    from web.models import FotoMascotaDesaparecida as Foto, Mascota
+    from web.utils.almacen_blobs import obtener_almacen
+
+    mascota = Mascota(
+        nombre=nombre, especie="perro", propietario_email="a@x.es",
+        propietario_telefono="600000000", zona="pinto", codigo_postal="",
+        tipo_registro=tipo, color="marron",
+        sexo="macho", tamano="mediano", fecha_registro=date(2024, 5, 1),
+    )
+    db.session.add(mascota)
+    db.session.flush()
+    for i, contenido in enumerate(contenidos):
+        clave = obtener_almacen().guardar(contenido)
+        db.session.add(Foto(
+            mascota_id=mascota.id, tipo_foto=f"tipo{i}", ruta=f"blobs/{clave}",
+            hash_contenido=clave, mime_type="image/jpeg", tamano_bytes=len(contenido),
+        ))
+    db.session.commit()
+    return mascota
+
+
+def test_candidatas_ordenadas_por_parecido(app, client):
+    from web.models import FotoMascotaDesaparecida as Foto, db
+
+    desaparecida_id = _mascota(db, "desaparecida", "toby", _imagen(1)).id
+    _mascota(db, "encontrada", "rex", _imagen(2))
+    sin_huella_id = _mascota(db, "encontrada", "nala", _imagen(3)).id
+    _mascota(db, "encontrada", "lucas", _imagen(1, 200, 150, calidad=40))
+    fechas = dict(db.session.query(Foto.id, Foto.fecha_modificacion))
+
+    resultado = app.test_cli_runner().invoke(args=["huellas-fotos"])
+    assert "Fotos con huellas: 4" in resultado.output
+    # Calcular huellas no cambia el contenido: Last-Modified se conserva
+    db.session.expire_all()
+    assert dict(db.session.query(Foto.id, Foto.fecha_modificacion)) == fechas
+
+    db.session.query(Foto).filter(Foto.mascota_id == sin_huella_id).update({"phash": None})
+    db.session.commit()
+
+    html = client.get(f"/comparar_mascotas/{desaparecida_id}/candidatas").get_data(as_text=True)
+    posicion = {nombre: html.index(f"<b>Nombre:</b> {nombre}") for nombre in ("lucas", "rex", "nala")}
+    assert posicion["lucas"] < posicion["rex"] and posicion["lucas"] < posicion["nala"]
+    assert html.count("Fotos parecidas:") == 1
+
+
+def test_recalcular_huellas_renueva_el_indice_de_otros_workers(app):
+    from web.models import db
+    from web.utils.huellas_fotos import obtener_indice_huellas
+
+    _mascota(db, "encontrada", "rex", _imagen(2))
+    app.test_cli_runner().invoke(args=["huellas-fotos"])
+    obtener_indice_huellas()
+    # Otro worker conserva el índice que tenía antes del recálculo
+    de_otro_worker = app.extensions["indice_huellas"]
+
+    resultado = app.test_cli_runner().invoke(args=["huellas-fotos", "--todas"])
+    assert "Fotos con huellas: 1" in resultado.output
+    assert "indice_huellas" not in app.extensions
+
+    app.extensions["indice_huellas"] = de_otro_worker
+    assert obtener_indice_huellas() is not de_otro_worker[1]
@@ -0,0 +1,124 @@
+import os
+import random
+
+import pytest
+
+from web.utils.bench_indice_cp import EJEMPLOS, cp_localidad_a_lonlat_scan
+from web.utils.calcula_KM_con_CP import calcula_KM_con_CP, cp_localidad_a_lonlat
+from web.utils.cp_binario import AlmacenCPBinario, abrir_binario, compilar_cp
+from web.utils.cp_localidades import cp_localidades
+from web.utils.indice_cp import FICHERO_CP, _cargar_fichero, obtener_indice_cp
+
+
+def test_indice_se_construye_una_vez():
+    assert obtener_indice_cp() is obtener_indice_cp()
+
+
+def test_indice_coincide_con_scan():
+    indice = obtener_indice_cp()
+    azar = random.Random(1234)
+    muestra = list(EJEMPLOS)
+    for cp in azar.sample(sorted(indice), 15):
+        entrada = indice[cp]
+        muestra.append((cp, azar.choice(entrada.nombres)))
+        muestra.append((cp, entrada.nombres[0][:4]))
+
+    for cp, loc in muestra:
+        esperado = cp_localidad_a_lonlat_scan(cp, loc)
+        obtenido = cp_localidad_a_lonlat(cp, loc)
+        if esperado is None:
+            assert obtenido is None
+        else:
+            assert obtenido == pytest.approx(esperado, abs=1e-4)
+
+
+def test_cp_localidades_y_distancia():
+    assert "Pinto" in cp_localidades("28320")
+    assert cp_localidades("99999") == []
+    assert cp_localidades("abc") == []
+
+    dist = calcula_KM_con_CP("28001", "Madrid", "08001", "Barcelona")
+    assert 490 < dist < 520
+    assert calcula_KM_con_CP("99999", "", "28001", "Madrid") is None
+
+
+def test_binario_equivale_al_tsv(tmp_path):
+    destino = compilar_cp(FICHERO_CP, tmp_path / "cp.bin")
+    almacen = AlmacenCPBinario(destino)
+    en_memoria = _cargar_fichero(FICHERO_CP, "ES")
+
+    assert len(almacen) == len(en_memoria)
+    assert list(almacen) == sorted(en_memoria)
+    assert "99999" not in almacen
+    for cp in ("01001", "28320", "52006"):
+        a, b = almacen[cp], en_memoria[cp]
+        assert a.nombres == b.nombres
+        assert a.nombres_norm == b.nombres_norm
+        assert list(a.lat) == pytest.approx(list(b.lat), abs=1e-4)
+        assert list(a.acc) == list(b.acc)
+
+
+def test_binario_obsoleto_se_recompila(tmp_path):
+    origen = tmp_path / "cp.txt"
+    origen.write_text(
+        "ES\t28320\tPinto\tMadrid\tMD\tMadrid\tM\tPinto\t28113\t40.2415\t-3.6999\t4\n",
+        encoding="utf-8",
+    )
+    destino = tmp_path / "cp.bin"
+    assert abrir_binario(origen, destino, compilar=False) is None
+
+    assert list(abrir_binario(origen, destino)) == ["28320"]
+
+    with origen.open("a", encoding="utf-8") as fh:
+        fh.write("ES\t28001\tMadrid\tMadrid\tMD\tMadrid\tM\tMadrid\t28079\t40.4165\t-3.7026\t4\n")
+    os.utime(origen, ns=(0, 10**18))
+    assert abrir_binario(origen, destino, compilar=False) is None
+    assert list(abrir_binario(origen, destino)) == ["28001", "28320"]
+
+
+def test_cache_guarda_fallos_y_claves_normalizadas():
+    from web.utils.calcula_KM_con_CP import estadisticas_cache_cp, limpiar_cache_cp
+
+    limpiar_cache_cp()
+    assert cp_localidad_a_lonlat("99999", "Nada") is None
+    assert cp_localidad_a_lonlat("99999", " nada ") is None
+    assert cp_localidad_a_lonlat("4001", "ALMERÍA") == cp_localidad_a_lonlat("04001", "almeria")
+    stats = estadisticas_cache_cp()["lonlat"]
+    assert stats["fallos"] == 2
+    assert stats["aciertos"] == 2
+
+    calcula_KM_con_CP("28001", "Madrid", "08001", "Barcelona")
+    calcula_KM_con_CP("08001", "barcelona", "28001", "madrid")
+    assert estadisticas_cache_cp()["km"]["aciertos"] == 1
+
+
+def test_cache_lru_expulsa_y_caduca(monkeypatch):
+    from web.utils import cache_lru
+
+    cache = cache_lru.CacheLRU(max_entradas=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", None)
+    assert cache.obtener("b", lambda: 99) is None
+    cache.set("c", 3)
+    assert cache.get("a") is None
+    assert cache.expulsiones == 1
+
+    reloj = [cache_lru.time.monotonic() + 11]
+    monkeypatch.setattr(cache_lru.time, "monotonic", lambda: reloj[0])
+    assert cache.obtener("c", lambda: 4) == 4
+
+
+def test_localidad_con_erratas():
+    from web.utils.calcula_KM_con_CP import cp_localidad_a_coincidencia
+
+    exacta = cp_localidad_a_coincidencia("28801", "Alcalá de Henares")
+    assert (exacta.tipo, exacta.confianza) == ("exacta", 1.0)
+
+    errata = cp_localidad_a_coincidencia("28801", "Alcala de Henres")
+    assert errata.tipo == "difusa"
+    assert errata.nombre == exacta.nombre
+    assert 0.6 < errata.confianza < 1
+
+    assert cp_localidad_a_lonlat("28801", "Alcala de Henres") == (exacta.lon, exacta.lat)
+    assert cp_localidad_a_coincidencia("28801", "qwxz").tipo == "cp"
+    assert cp_localidad_a_coincidencia("99999", "Alcala") is None
@@ -0,0 +1,97 @@
+import io
+
+import pytest
+from PIL import Image
+
+from web.utils.ingesta_fotos import FotoNoValida, OpcionesIngesta, procesar_foto
+
+
+def _imagen(formato="JPEG", size=(4000, 3000), modo="RGB", exif=None):
+    img = Image.new(modo, size, (10, 120, 200, 128)[: len(modo)])
+    salida = io.BytesIO()
+    kwargs = {"exif": exif.tobytes()} if exif is not None else {}
+    img.save(salida, formato, **kwargs)
+    return salida.getvalue()
+
+
+def test_procesar_foto_orienta_acota_y_quita_metadatos():
+    exif = Image.Exif()
+    exif[0x0112] = 6                    # girar 90º
+    exif[0x010F] = "Fabricante móvil"   # Make
+    data = _imagen(exif=exif)
+
+    procesada = procesar_foto(data, OpcionesIngesta(lado_maximo=1000))
+    img = Image.open(io.BytesIO(procesada.data))
+    assert img.format == "JPEG"
+    assert img.size == (procesada.ancho, procesada.alto) == (750, 1000)
+    assert not img.getexif()
+    assert procesada.mime_type == "image/jpeg"
+    assert procesada.bytes_ahorrados == len(data) - len(procesada.data)
+
+
+def test_procesar_png_con_transparencia_y_webp():
+    data = _imagen("PNG", size=(300, 200), modo="RGBA")
+    assert Image.open(io.BytesIO(procesar_foto(data).data)).mode == "RGB"
+
+    webp = procesar_foto(data, OpcionesIngesta(formato="webp"))
+    assert (webp.mime_type, webp.extension) == ("image/webp", "webp")
+    assert Image.open(io.BytesIO(webp.data)).size == (300, 200)
+
+    with pytest.raises(FotoNoValida):
+        procesar_foto(b"esto no es una imagen")
+
+
+def _formulario(**fotos):
+    datos = {
+        "tipo_registro": "desaparecida", "nombre": "Toby", "especie": "perro",
+        "propietario_email": "a@x.es", "propietario_telefono": "600000000",
+        "zona": "Pinto", "codigo_postal": "28320", "color": "marron",
+        "sexo": "macho", "tamano": "mediano",
+    }
+    datos["fotos"] = [(io.BytesIO(contenido), nombre) for nombre, contenido in fotos.items()]
+    datos["fotos_tipo"] = ["cara"] * len(fotos)
+    return datos
+
+
+@pytest.fixture
+def sin_envios(monkeypatch):
+    monkeypatch.setattr("web.routes._programar_envio_correo", lambda mascota_id: None)
+
+
+def test_crear_mascota_guarda_la_foto_normalizada(app, client, sin_envios):
+    from web.models import FotoMascotaDesaparecida as Foto
+    from web.utils.almacen_blobs import obtener_almacen
+
+    original = _imagen()
+    resp = client.post(
+        "/crear_mascota?tipo_registro=desaparecida",
+        data=_formulario(**{"IMG_0001.JPG": original}),
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 302
+
+    foto = Foto.query.one()
+    guardada = obtener_almacen().leer(foto.hash_contenido)
+    assert foto.tamano_bytes == len(guardada) < len(original)
+    assert (foto.mime_type, foto.nombre_archivo) == ("image/jpeg", "IMG_0001.jpg")
+    assert max(Image.open(io.BytesIO(guardada)).size) == 2048
+    assert foto.hash_original is None
+    # Huellas perceptuales calculadas al subirla
+    assert all(len(h) == 16 for h in (foto.ahash, foto.dhash, foto.phash))
+
+
+def test_crear_mascota_con_copia_original_e_imagen_invalida(app, client, sin_envios):
+    from web.models import FotoMascotaDesaparecida as Foto
+    from web.utils.almacen_blobs import calcular_hash, obtener_almacen
+
+    app.config["FOTOS_GUARDAR_ORIGINAL"] = "1"
+    original = _imagen(size=(800, 600))
+    client.post(
+        "/crear_mascota?tipo_registro=desaparecida",
+        data=_formulario(**{"buena.jpg": original, "rota.jpg": b"no es imagen"}),
+        content_type="multipart/form-data",
+    )
+
+    foto = Foto.query.one()
+    assert foto.hash_original == calcular_hash(original)
+    assert obtener_almacen().leer(foto.hash_original) == original
@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from web.utils import publicar_en_instagram as ig
+
+
+class _GraphFalso(BaseHTTPRequestHandler):
+    """
+    Imita /media, /media_publish y la consulta de status_code: cada
+    contenedor pasa a FINISHED tras `consultas_hasta_listo` consultas.
+    """
+    protocol_version = "HTTP/1.1"
+    consultas_hasta_listo = 2
+    estado_final = "FINISHED"
+    retardo_creacion = 0.1
+    contenedores: dict = {}
+    publicados: list = []
+    activos = 0
+    maximo = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, codigo, cuerpo):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_GET(self):
+        container_id = urlparse(self.path).path.rsplit("/", 1)[-1]
+        with self.lock:
+            contenedor = self.contenedores[container_id]
+            contenedor["consultas"] += 1
+            listo = contenedor["consultas"] >= self.consultas_hasta_listo
+        self._responder(200, {"status_code": self.estado_final if listo else "IN_PROGRESS", "id": container_id})
+
+    def do_POST(self):
+        campos = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+        ruta = urlparse(self.path).path
+
+        if ruta.endswith("/media_publish"):
+            contenedor = self.contenedores[campos["creation_id"][0]]
+            if contenedor["consultas"] < self.consultas_hasta_listo:
+                self._responder(400, {"error": {"message": "Media ID is not available"}})
+                return
+            self.publicados.append(campos["creation_id"][0])
+            self._responder(200, {"id": "publicado_1"})
+            return
+
+        with self.lock:
+            type(self).activos += 1
+            type(self).maximo = max(type(self).maximo, type(self).activos)
+        time.sleep(self.retardo_creacion)
+        with self.lock:
+            type(self).activos -= 1
+            container_id = f"c{len(self.contenedores) + 1}"
+            self.contenedores[container_id] = {
+                "consultas": 0, "url": campos.get("image_url", [None])[0],
+                "children": campos.get("children", [""])[0],
+            }
+        self._responder(200, {"id": container_id})
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    _GraphFalso.consultas_hasta_listo = 2
+    _GraphFalso.estado_final = "FINISHED"
+    _GraphFalso.contenedores = {}
+    _GraphFalso.publicados = []
+    _GraphFalso.activos = _GraphFalso.maximo = 0
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _GraphFalso)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    monkeypatch.setattr(ig, "API", f"http://127.0.0.1:{servidor.server_port}/v18.0")
+    monkeypatch.setattr(ig, "ESPERA_INICIAL", 0.01)
+    monkeypatch.setattr(ig, "ESPERA_MAXIMA", 0.05)
+    yield _GraphFalso
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def test_carrusel_hijos_concurrentes_y_publica_al_terminar(graph):
+    urls = [f"https://x/foto/{i}" for i in range(1, 5)]
+    inicio = time.monotonic()
+    assert ig.publicar_en_instagram("Perdido", urls) == {"id": "publicado_1"}
+
+    assert time.monotonic() - inicio < 2
+    assert graph.maximo > 1
+    carrusel = graph.contenedores[graph.publicados[0]]
+    hijos = carrusel["children"].split(",")
+    assert [graph.contenedores[h]["url"] for h in hijos] == urls
+    assert all(graph.contenedores[h]["consultas"] >= 2 for h in hijos)
+
+
+def test_una_foto_espera_a_finished(graph):
+    graph.consultas_hasta_listo = 4
+    ig.publicar_en_instagram("Perdido", ["https://x/foto/1"])
+    assert graph.publicados == ["c1"]
+    assert graph.contenedores["c1"]["consultas"] == 4
+
+
+def test_contenedor_con_error_no_se_publica(graph):
+    graph.estado_final = "ERROR"
+    with pytest.raises(ig.ErrorContenedorInstagram):
+        ig.publicar_en_instagram("Perdido", ["https://x/foto/1"])
+    assert graph.publicados == []
+
+
+def test_plazo_agotado(graph):
+    graph.consultas_hasta_listo = 10_000
+    inicio = time.monotonic()
+    with pytest.raises(TimeoutError):
+        ig.publicar_en_instagram("Perdido", ["https://x/foto/1", "https://x/foto/2"], plazo=0.3)
+    assert time.monotonic() - inicio < 1.5
+    assert graph.publicados == []
+
+
+def test_plazo_del_trabajo_no_amplia_ig_plazo_publicacion(graph, monkeypatch):
+    graph.consultas_hasta_listo = 10_000
+    monkeypatch.setattr(ig, "PLAZO_PUBLICACION", 0.3)
+    inicio = time.monotonic()
+    with pytest.raises(TimeoutError):
+        ig.publicar_en_instagram("Perdido", ["https://x/foto/1"], plazo=300)
+    assert time.monotonic() - inicio < 1.5
@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from web.utils import publicar_fb
+
+
+class _GraphFalso(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    retardo = 0.2
+    fallan: set = set()
+    peticiones: list = []
+    conexiones: set = set()
+    activos = 0
+    maximo = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, codigo, cuerpo):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_POST(self):
+        cuerpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        ruta = urlparse(self.path).path
+        with self.lock:
+            type(self).peticiones.append((ruta, cuerpo))
+            type(self).conexiones.add(self.client_address)
+
+        if ruta.endswith("/feed"):
+            self._responder(200, {"id": "post_1"})
+            return
+
+        with self.lock:
+            type(self).activos += 1
+            type(self).maximo = max(type(self).maximo, type(self).activos)
+        time.sleep(self.retardo)
+        with self.lock:
+            type(self).activos -= 1
+
+        nombre = next((n for n in self.fallan if n.encode() in cuerpo), None)
+        if nombre:
+            self._responder(400, {"error": {"message": f"{nombre} rechazada"}})
+        else:
+            numero = cuerpo.split(b"foto_", 1)[1][:1].decode()
+            self._responder(200, {"id": f"media_{numero}"})
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    _GraphFalso.fallan = set()
+    _GraphFalso.peticiones = []
+    _GraphFalso.conexiones = set()
+    _GraphFalso.activos = _GraphFalso.maximo = 0
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _GraphFalso)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    base = f"http://127.0.0.1:{servidor.server_port}/v18.0/123"
+    monkeypatch.setattr(publicar_fb, "GRAPH_API_PHOTOS", f"{base}/photos")
+    monkeypatch.setattr(publicar_fb, "GRAPH_API_FEED", f"{base}/feed")
+    monkeypatch.setattr(publicar_fb, "SUBIDAS_CONCURRENTES", 3)
+    yield _GraphFalso
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def _fotos(n):
+    return [
+        {"id": i, "data": memoryview(b"jpeg" * 10), "mime_type": "image/jpeg", "nombre_archivo": f"foto_{i}.jpg"}
+        for i in range(1, n + 1)
+    ]
+
+
+def test_subidas_concurrentes_en_orden(app, graph):
+    inicio = time.monotonic()
+    informe = publicar_fb._resolver_media_ids(_fotos(6))
+    transcurrido = time.monotonic() - inicio
+
+    assert informe.completo
+    assert informe.media_ids == [f"media_{i}" for i in range(1, 7)]
+    assert graph.maximo == 3
+    # 6 fotos de 0,2 s con 3 a la vez: dos tandas, no seis
+    assert transcurrido < 6 * graph.retardo
+
+
+def test_fallo_parcial_y_post_con_las_demas(app, graph):
+    graph.fallan = {"foto_2"}
+    assert publicar_fb.publish_pet_fb_post("Perdido", {"Nombre": "Toby"}, _fotos(3)) == "post_1"
+
+    ruta, cuerpo = graph.peticiones[-1]
+    assert ruta.endswith("/feed")
+    campos = parse_qs(cuerpo.decode())
+    assert [json.loads(campos[f"attached_media[{i}]"][0])["media_fbid"] for i in range(2)] == [
+        "media_1", "media_3",
+    ]
+    assert "attached_media[2]" not in campos
+
+    informe = publicar_fb._resolver_media_ids(_fotos(3))
+    assert informe.media_ids == ["media_1", "media_3"]
+    assert informe.fallos[0][0] == 2
+    assert "foto_2 rechazada" in informe.fallos[0][1]
+
+
+def test_sesion_reutiliza_conexiones(app, graph):
+    for _ in range(3):
+        publicar_fb._resolver_media_ids(_fotos(1))
+    assert len(graph.conexiones) == 1
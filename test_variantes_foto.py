@@ -0,0 +1,96 @@
+import io
+from datetime import date
+
+import pytest
+from PIL import Image
+
+from web.utils.variantes_foto import resolver_ancho
+
+
+def _jpeg(ancho=1200, alto=800, orientacion=None):
+    img = Image.new("RGB", (ancho, alto), (200, 30, 30))
+    salida = io.BytesIO()
+    exif = Image.Exif()
+    if orientacion:
+        exif[0x0112] = orientacion
+    img.save(salida, "JPEG", quality=95, exif=exif.tobytes())
+    return salida.getvalue()
+
+
+@pytest.fixture
+def foto(app):
+    from web.models import FotoMascotaDesaparecida as Foto, Mascota, db
+    from web.utils.almacen_blobs import obtener_almacen
+
+    mascota = Mascota(
+        nombre="toby", especie="perro", propietario_email="a@x.es",
+        propietario_telefono="600000000", zona="pinto", codigo_postal="28320",
+        tipo_registro="desaparecida", color="marron", sexo="macho",
+        tamano="mediano", fecha_registro=date(2024, 5, 1),
+    )
+    db.session.add(mascota)
+    db.session.flush()
+    # Foto en horizontal con EXIF "girar 90º": debe servirse en vertical
+    data = _jpeg(orientacion=6)
+    clave = obtener_almacen().guardar(data)
+    foto = Foto(
+        mascota_id=mascota.id, tipo_foto="cara", ruta=f"blobs/{clave}",
+        hash_contenido=clave, mime_type="image/jpeg", tamano_bytes=len(data),
+    )
+    db.session.add(foto)
+    db.session.commit()
+    return foto
+
+
+def test_resolver_ancho():
+    assert resolver_ancho() is None
+    assert resolver_ancho(variante="full") is None
+    assert resolver_ancho(variante="THUMB") == 320
+    assert resolver_ancho("100") == 160
+    assert resolver_ancho("321") == 640
+    assert resolver_ancho("99999") == 1600
+    for malo in ("0", "-5", "abc"):
+        with pytest.raises(ValueError):
+            resolver_ancho(malo)
+    with pytest.raises(ValueError):
+        resolver_ancho(variante="gigante")
+
+
+def test_variante_reducida_orientada_y_cacheada(app, client, foto):
+    from web.utils.variantes_foto import obtener_almacen_variantes
+
+    resp = client.get(f"/foto/{foto.id}?w=100")
+    assert resp.status_code == 200
+    assert resp.mimetype == "image/jpeg"
+    img = Image.open(io.BytesIO(resp.data))
+    assert img.size == (160, 240)
+    assert not img.getexif()
+    assert len(resp.data) < foto.tamano_bytes
+
+    ruta = obtener_almacen_variantes().ruta(foto.hash_contenido, 160, "jpeg")
+    assert ruta.is_file()
+    etag = resp.headers["ETag"]
+    assert client.get(f"/foto/{foto.id}?w=160", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_variante_webp_por_accept(app, client, foto):
+    resp = client.get(f"/foto/{foto.id}?variante=thumb", headers={"Accept": "image/webp,*/*"})
+    assert resp.mimetype == "image/webp"
+    assert "Accept" in resp.headers["Vary"]
+    assert Image.open(io.BytesIO(resp.data)).size == (320, 480)
+
+    resp = client.get(f"/foto/{foto.id}?variante=thumb&formato=jpeg", headers={"Accept": "image/webp"})
+    assert resp.mimetype == "image/jpeg"
+
+
+def test_original_y_errores(app, client, foto):
+    from web.models import FotoMascotaDesaparecida as Foto, db
+
+    assert client.get(f"/foto/{foto.id}?variante=full").headers["ETag"] == f'"{foto.hash_contenido}"'
+    assert client.get(f"/foto/{foto.id}?variante=enorme").status_code == 400
+
+    # Si el binario no es una imagen decodificable se sirve tal cual
+    rara = Foto(mascota_id=foto.mascota_id, tipo_foto="otra", ruta="fotos/x", data=b"no es imagen")
+    db.session.add(rara)
+    db.session.commit()
+    assert client.get(f"/foto/{rara.id}?w=320").data == b"no es imagen"
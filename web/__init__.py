@@ -26,4 +26,7 @@ def create_app():
     from .routes import main as main_bp
     app.register_blueprint(main_bp)
 
+    from .comandos import registrar_comandos
+    registrar_comandos(app)
+
     return app
\ No newline at end of file
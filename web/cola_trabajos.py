@@ -0,0 +1,495 @@
+"""
+Cola de trabajos persistente para las notificaciones (correo, Facebook,
+Instagram) que se lanzan al registrar o modificar una mascota.
+
+Los trabajos viven en la tabla `trabajo`, así que sobreviven a reinicios. Un
+worker con un pool de hilos acotado los reclama con un UPDATE condicional
+(válido con varios procesos a la vez) y los ejecuta. Si un trabajo falla, se
+reintenta con espera exponencial hasta COLA_MAX_INTENTOS.
+
+El worker puede ejecutarse aparte:
+    flask --app app trabajos-worker [--concurrencia N] [--una-vez]
+o embebido en el proceso web (COLA_TRABAJADOR_EMBEBIDO=1, por defecto).
+
+Configuración (app.config o variables de entorno):
+    COLA_CONCURRENCIA        hilos del pool (por defecto 4)
+    COLA_MAX_INTENTOS        intentos antes de marcarlo fallido (por defecto 5)
+    COLA_BACKOFF_BASE        espera tras el primer fallo, en s (por defecto 30)
+    COLA_BACKOFF_MAX         espera máxima entre intentos, en s (por defecto 3600)
+    COLA_LEASE               s tras los que un trabajo 'en_curso' se da por
+                             abandonado y se puede reclamar (por defecto 600)
+    COLA_INTERVALO           s entre sondeos de la tabla (por defecto 2)
+    COLA_TRABAJADOR_EMBEBIDO '0' para no arrancar el worker en el proceso web
+    COLA_TIMEOUT_<TIPO>      plazo por canal, en s (EMAIL 60, FACEBOOK 120,
+                             INSTAGRAM 300); COLA_LEASE debe ser mayor que
+                             todos ellos
+
+Un hilo no se puede interrumpir, así que el plazo no se impone desde fuera:
+cada manejador pasa tiempo_restante() a su canal, que deja de empezar lotes o
+subidas cuando vence y recorta a lo que quede el timeout de cada petición (y,
+en Instagram, el sondeo). Así ningún trabajo sigue en marcha cuando vence su
+COLA_LEASE y otro worker lo reclama. Si el plazo vence antes de enviar nada
+(PlazoAgotado), se reintenta como cualquier fallo. Si un canal de publicación
+(Facebook, Instagram) agota el tiempo o falla sin que se sepa si llegó a
+publicar, el trabajo queda 'fallido' para revisarlo, sin reintento. Cuando publica, el manejador guarda el id del post con
+registrar_publicacion(): un reintento posterior lo ve con
+publicacion_registrada() y no publica otra vez. Del mismo modo, un envío que
+solo llega a una parte (correo a varios destinatarios) guarda lo que falta
+con registrar_progreso() y el reintento se limita a eso. Volver a encolar el
+trabajo (p. ej. al modificar la mascota) borra ambos.
+
+Cada intento queda registrado en `ejecucion_trabajo` (duración y resultado),
+y `flask --app app trabajos-estado` resume tiempos y fallos por canal.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from flask import Flask, current_app, g
+from sqlalchemy import and_, case, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from .models import EjecucionTrabajo, Trabajo, db
+from .utils.cliente_http import PlazoAgotado, resultado_desconocido
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+HECHO = "hecho"
+FALLIDO = "fallido"
+
+# tipo -> función(mascota_id). Debe devolver True/None si todo fue bien;
+# False o una excepción provocan un reintento.
+MANEJADORES: Dict[str, Callable[[int], Optional[bool]]] = {}
+
+TIMEOUTS_POR_DEFECTO = {"email": 60.0, "facebook": 120.0, "instagram": 300.0}
+TIMEOUT_GENERICO = 120.0
+
+# Canales cuyo efecto no se puede repetir sin duplicarlo
+CANALES_PUBLICACION = frozenset({"facebook", "instagram"})
+
+
+def manejador(tipo: str):
+    def _registrar(func):
+        MANEJADORES[tipo] = func
+        return func
+    return _registrar
+
+
+def _config(nombre: str, defecto, app: Optional[Flask] = None):
+    app = app or current_app
+    valor = app.config.get(nombre)
+    if valor is None:
+        valor = os.getenv(nombre)
+    if valor in (None, ""):
+        return defecto
+    if isinstance(defecto, bool):
+        return str(valor).strip().lower() in ("1", "true", "si", "sí")
+    return type(defecto)(valor)
+
+
+def _ahora() -> datetime:
+    return datetime.utcnow()
+
+
+def clave_trabajo(tipo: str, mascota_id: int) -> str:
+    return f"{tipo}:{mascota_id}"
+
+
+def encolar(tipo: str, mascota_id: int) -> Trabajo:
+    """
+    Encola (o reprograma) el trabajo `tipo` de la mascota. No hace commit.
+    """
+    ahora = _ahora()
+    clave = clave_trabajo(tipo, mascota_id)
+    trabajo = Trabajo.query.filter_by(clave=clave).first()
+    if trabajo is None:
+        trabajo = Trabajo(
+            clave=clave, tipo=tipo, mascota_id=mascota_id, estado=PENDIENTE,
+            version=1, intentos=0, ejecutar_despues=ahora, creado=ahora, actualizado=ahora,
+        )
+        try:
+            with db.session.begin_nested():
+                db.session.add(trabajo)
+            return trabajo
+        except IntegrityError:
+            # Otro proceso lo creó a la vez: se reprograma el suyo
+            trabajo = Trabajo.query.filter_by(clave=clave).one()
+
+    # Si está en curso, el worker verá la nueva versión al terminar y lo repetirá
+    db.session.execute(
+        update(Trabajo)
+        .where(Trabajo.id == trabajo.id)
+        .values(
+            version=Trabajo.version + 1,
+            intentos=0,
+            ultimo_error=None,
+            id_externo=None,
+            progreso=None,
+            ejecutar_despues=ahora,
+            actualizado=ahora,
+            estado=case((Trabajo.estado == EN_CURSO, EN_CURSO), else_=PENDIENTE),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.expire(trabajo)
+    return trabajo
+
+
+def _condicion_reclamable(ahora: datetime):
+    return or_(
+        and_(Trabajo.estado == PENDIENTE, Trabajo.ejecutar_despues <= ahora),
+        and_(Trabajo.estado == EN_CURSO, Trabajo.bloqueado_hasta < ahora),
+    )
+
+
+def reclamar(limite: int) -> List[int]:
+    """
+    Marca como 'en_curso' hasta `limite` trabajos vencidos y devuelve sus ids.
+    El UPDATE condicional garantiza que cada trabajo lo reclama un solo worker.
+    """
+    if limite <= 0:
+        return []
+    ahora = _ahora()
+    lease = timedelta(seconds=_config("COLA_LEASE", 600))
+    candidatos = [
+        trabajo_id for (trabajo_id,) in db.session.query(Trabajo.id)
+        .filter(_condicion_reclamable(ahora))
+        .order_by(Trabajo.ejecutar_despues, Trabajo.id)
+        .limit(limite)
+    ]
+    reclamados = []
+    for trabajo_id in candidatos:
+        resultado = db.session.execute(
+            update(Trabajo)
+            .where(Trabajo.id == trabajo_id, _condicion_reclamable(ahora))
+            .values(
+                estado=EN_CURSO,
+                bloqueado_hasta=ahora + lease,
+                intentos=Trabajo.intentos + 1,
+                actualizado=ahora,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if resultado.rowcount == 1:
+            reclamados.append(trabajo_id)
+    db.session.commit()
+    return reclamados
+
+
+def timeout_canal(tipo: str) -> float:
+    return _config(f"COLA_TIMEOUT_{tipo.upper()}", TIMEOUTS_POR_DEFECTO.get(tipo, TIMEOUT_GENERICO))
+
+
+def tiempo_restante(defecto: Optional[float] = None) -> Optional[float]:
+    """
+    Segundos que le quedan al trabajo en curso para agotar su plazo
+    (COLA_TIMEOUT_<TIPO>), o `defecto` si no se llama desde un trabajo.
+    """
+    limite = g.get("limite_trabajo")
+    if limite is None:
+        return defecto
+    return max(limite - time.monotonic(), 0.0)
+
+
+def _columna_en_curso(columna):
+    en_curso = g.get("trabajo_en_curso")
+    if en_curso is None:
+        return None
+    trabajo_id, version = en_curso
+    return db.session.query(columna).filter(Trabajo.id == trabajo_id, Trabajo.version == version).scalar()
+
+
+def _guardar_en_curso(**valores) -> None:
+    # Si entretanto se volvió a encolar, no se guarda: la nueva versión empieza de cero
+    en_curso = g.get("trabajo_en_curso")
+    if en_curso is None:
+        return
+    trabajo_id, version = en_curso
+    db.session.execute(
+        update(Trabajo)
+        .where(Trabajo.id == trabajo_id, Trabajo.version == version)
+        .values(**valores)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def publicacion_registrada() -> Optional[str]:
+    """
+    Id de lo que ya publicó la versión del trabajo en curso, o None.
+    """
+    return _columna_en_curso(Trabajo.id_externo)
+
+
+def registrar_publicacion(id_externo: str) -> None:
+    """
+    Guarda (con commit) el id de lo que el trabajo en curso acaba de publicar.
+    """
+    _guardar_en_curso(id_externo=str(id_externo))
+
+
+def progreso_registrado() -> Any:
+    """
+    Progreso que dejó un intento anterior de la versión en curso (p. ej. los
+    destinatarios de correo que faltan), o None.
+    """
+    progreso = _columna_en_curso(Trabajo.progreso)
+    return json.loads(progreso) if progreso else None
+
+
+def registrar_progreso(progreso: Any) -> None:
+    """
+    Guarda (con commit) lo que falta por hacer, para que el reintento solo
+    haga eso. Debe poder serializarse a JSON.
+    """
+    _guardar_en_curso(progreso=json.dumps(progreso))
+
+
+def _tiempo_agotado(exc: BaseException) -> bool:
+    # ConnectTimeout: la petición no llegó a enviarse, se puede repetir
+    return isinstance(exc, (TimeoutError, requests.Timeout)) and not isinstance(exc, requests.ConnectTimeout)
+
+
+def espera_reintento(intentos: int) -> float:
+    base = _config("COLA_BACKOFF_BASE", 30.0)
+    maximo = _config("COLA_BACKOFF_MAX", 3600.0)
+    return min(base * 2 ** max(intentos - 1, 0), maximo) * random.uniform(0.8, 1.2)
+
+
+def ejecutar_trabajo(trabajo_id: int) -> str:
+    """
+    Ejecuta un trabajo ya reclamado y deja registrado el resultado.
+    Devuelve el estado final.
+    """
+    trabajo = db.session.get(Trabajo, trabajo_id)
+    version, intentos = trabajo.version, trabajo.intentos
+    tipo, mascota_id = trabajo.tipo, trabajo.mascota_id
+    db.session.commit()
+
+    error = None
+    resultado_canal = "ok"
+    reintentar = True
+    func = MANEJADORES.get(tipo)
+    inicio, t0 = _ahora(), time.perf_counter()
+    g.limite_trabajo = time.monotonic() + timeout_canal(tipo)
+    g.trabajo_en_curso = (trabajo_id, version)
+    try:
+        if func is None:
+            raise LookupError(f"No hay manejador para el tipo {tipo!r}")
+        if func(mascota_id) is False:
+            error, resultado_canal = "El canal devolvió un error", "error"
+    except Exception as exc:
+        if _tiempo_agotado(exc):
+            current_app.logger.warning("Trabajo %s (%s): tiempo agotado: %s", trabajo_id, tipo, exc)
+            error, resultado_canal = f"Tiempo agotado: {exc}", "timeout"
+        else:
+            current_app.logger.error("Trabajo %s (%s) falló", trabajo_id, tipo, exc_info=exc)
+            error, resultado_canal = f"{type(exc).__name__}: {exc}", "error"
+        sin_enviar = isinstance(exc, PlazoAgotado)
+        if tipo in CANALES_PUBLICACION and not sin_enviar and (resultado_canal == "timeout" or resultado_desconocido(exc)):
+            error += " (sin confirmar: comprobar si se publicó antes de volver a encolarlo)"
+            reintentar = False
+    finally:
+        g.pop("limite_trabajo", None)
+        g.pop("trabajo_en_curso", None)
+        # Lo que el manejador dejó sin confirmar no se mezcla con el registro
+        db.session.rollback()
+    duracion_ms = int((time.perf_counter() - t0) * 1000)
+
+    current_app.logger.info(
+        "Canal %s mascota %s: %s en %d ms (intento %d)", tipo, mascota_id, resultado_canal, duracion_ms, intentos
+    )
+    db.session.add(EjecucionTrabajo(
+        trabajo_id=trabajo_id, tipo=tipo, mascota_id=mascota_id, intento=intentos,
+        inicio=inicio, duracion_ms=duracion_ms, resultado=resultado_canal, error=error,
+    ))
+
+    ahora = _ahora()
+    if error is None:
+        valores = dict(estado=HECHO, ultimo_error=None, bloqueado_hasta=None)
+    elif not reintentar or intentos >= _config("COLA_MAX_INTENTOS", 5):
+        valores = dict(estado=FALLIDO, ultimo_error=error, bloqueado_hasta=None)
+    else:
+        valores = dict(
+            estado=PENDIENTE, ultimo_error=error, bloqueado_hasta=None,
+            ejecutar_despues=ahora + timedelta(seconds=espera_reintento(intentos)),
+        )
+
+    resultado = db.session.execute(
+        update(Trabajo)
+        .where(Trabajo.id == trabajo_id, Trabajo.version == version)
+        .values(actualizado=ahora, **valores)
+        .execution_options(synchronize_session=False)
+    )
+    estado = valores["estado"]
+    if resultado.rowcount == 0:
+        # Se volvió a encolar mientras se ejecutaba: repetir con los datos nuevos
+        db.session.execute(
+            update(Trabajo)
+            .where(Trabajo.id == trabajo_id)
+            .values(estado=PENDIENTE, bloqueado_hasta=None, actualizado=ahora)
+            .execution_options(synchronize_session=False)
+        )
+        estado = PENDIENTE
+    db.session.commit()
+
+    if error and estado == FALLIDO:
+        current_app.logger.error("Trabajo %s (%s) descartado tras %d intentos: %s", trabajo_id, tipo, intentos, error)
+    return estado
+
+
+def estadisticas_canales(desde: Optional[datetime] = None) -> Dict[str, Dict[str, float]]:
+    """
+    Por canal: intentos, resultados y duración media / p95 en ms.
+    """
+    query = db.session.query(EjecucionTrabajo.tipo, EjecucionTrabajo.resultado, EjecucionTrabajo.duracion_ms)
+    if desde is not None:
+        query = query.filter(EjecucionTrabajo.inicio >= desde)
+
+    por_tipo: Dict[str, Dict[str, list]] = {}
+    for tipo, resultado, duracion_ms in query:
+        datos = por_tipo.setdefault(tipo, {"duraciones": [], "resultados": []})
+        datos["duraciones"].append(duracion_ms)
+        datos["resultados"].append(resultado)
+
+    estadisticas = {}
+    for tipo, datos in sorted(por_tipo.items()):
+        duraciones = sorted(datos["duraciones"])
+        estadisticas[tipo] = {
+            "intentos": len(duraciones),
+            "ok": datos["resultados"].count("ok"),
+            "error": datos["resultados"].count("error"),
+            "timeout": datos["resultados"].count("timeout"),
+            "media_ms": sum(duraciones) / len(duraciones),
+            "p95_ms": duraciones[min(len(duraciones) - 1, int(0.95 * len(duraciones)))],
+        }
+    return estadisticas
+
+
+class TrabajadorCola:
+    """
+    Pool de hilos acotado que consume la cola.
+    """
+
+    def __init__(self, app: Flask, concurrencia: Optional[int] = None, intervalo: Optional[float] = None):
+        self.app = app
+        self.concurrencia = max(1, concurrencia or _config("COLA_CONCURRENCIA", 4, app))
+        self.intervalo = intervalo if intervalo is not None else _config("COLA_INTERVALO", 2.0, app)
+        self._pool = ThreadPoolExecutor(self.concurrencia, thread_name_prefix="cola")
+        self._lock = threading.Lock()
+        self._activos = 0
+        self._despertar = threading.Event()
+        self._parar = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def _ejecutar(self, trabajo_id: int) -> None:
+        try:
+            with self.app.app_context():
+                try:
+                    ejecutar_trabajo(trabajo_id)
+                finally:
+                    db.session.remove()
+        except Exception:
+            self.app.logger.exception("Error inesperado ejecutando el trabajo %s", trabajo_id)
+        finally:
+            with self._lock:
+                self._activos -= 1
+            self._despertar.set()
+
+    def procesar_pendientes(self) -> List:
+        """
+        Reclama tantos trabajos vencidos como hilos libres y los lanza.
+        Devuelve los futures de los trabajos lanzados.
+        """
+        with self._lock:
+            libres = self.concurrencia - self._activos
+        if libres <= 0:
+            return []
+        with self.app.app_context():
+            try:
+                ids = reclamar(libres)
+            finally:
+                db.session.remove()
+        futuros = []
+        for trabajo_id in ids:
+            with self._lock:
+                self._activos += 1
+            futuros.append(self._pool.submit(self._ejecutar, trabajo_id))
+        return futuros
+
+    def vaciar(self) -> int:
+        """
+        Ejecuta todos los trabajos vencidos y espera a que terminen
+        (útil en la CLI con --una-vez y en pruebas).
+        """
+        total = 0
+        while True:
+            futuros = self.procesar_pendientes()
+            if not futuros:
+                return total
+            total += len(futuros)
+            for futuro in futuros:
+                futuro.result()
+
+    def despertar(self) -> None:
+        self._despertar.set()
+
+    def ejecutar_en_bucle(self) -> None:
+        while not self._parar.is_set():
+            try:
+                self.procesar_pendientes()
+            except Exception:
+                self.app.logger.exception("Error al reclamar trabajos de la cola")
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+
+    def iniciar_en_segundo_plano(self) -> None:
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self.ejecutar_en_bucle, name="cola-sondeo", daemon=True)
+            self._hilo.start()
+
+    def parar(self, esperar: bool = True) -> None:
+        self._parar.set()
+        self._despertar.set()
+        self._pool.shutdown(wait=esperar)
+
+
+_lock_embebido = threading.Lock()
+
+
+def iniciar_trabajador_embebido() -> Optional[TrabajadorCola]:
+    """
+    Arranca (una vez por app) el worker dentro del proceso web, salvo que
+    COLA_TRABAJADOR_EMBEBIDO lo desactive. Al arrancar recoge también lo que
+    quedó pendiente antes de un reinicio.
+    """
+    app = current_app._get_current_object()
+    trabajador = app.extensions.get("cola_trabajos")
+    if trabajador is not None or not _config("COLA_TRABAJADOR_EMBEBIDO", True, app):
+        return trabajador
+    with _lock_embebido:
+        trabajador = app.extensions.get("cola_trabajos")
+        if trabajador is None:
+            trabajador = TrabajadorCola(app)
+            app.extensions["cola_trabajos"] = trabajador
+            trabajador.iniciar_en_segundo_plano()
+    return trabajador
+
+
+def despertar_trabajador() -> None:
+    """
+    Avisa al worker embebido de que hay trabajo nuevo. Si el worker corre en
+    otro proceso, lo recogerá en su siguiente sondeo.
+    """
+    trabajador = iniciar_trabajador_embebido()
+    if trabajador is not None:
+        trabajador.despertar()
@@ -0,0 +1,210 @@
+"""
+Comandos de mantenimiento para la CLI de Flask (`flask --app app <comando>`).
+"""
+
+from datetime import datetime, timedelta
+
+import click
+from flask import Flask, current_app
+from sqlalchemy import or_, update
+
+from .models import db, Mascota
+from .utils.calcula_KM_con_CP import geocodificar_mascota
+
+
+@click.command("geocodificar-mascotas")
+@click.option("--todas", is_flag=True, help="Recalcula también las que ya tienen coordenadas.")
+@click.option("--lote", default=500, show_default=True, help="Filas por commit.")
+def geocodificar_mascotas_cmd(todas: bool, lote: int) -> None:
+    """Rellena latitud/longitud de las mascotas existentes."""
+    query = Mascota.query.order_by(Mascota.id)
+    if not todas:
+        query = query.filter(or_(Mascota.latitud.is_(None), Mascota.longitud.is_(None)))
+
+    ok = fallidas = 0
+    ultimo_id = 0
+    while True:
+        mascotas = query.filter(Mascota.id > ultimo_id).limit(lote).all()
+        if not mascotas:
+            break
+        for mascota in mascotas:
+            if geocodificar_mascota(mascota):
+                ok += 1
+            else:
+                fallidas += 1
+        ultimo_id = mascotas[-1].id
+        db.session.commit()
+
+    click.echo(f"Geocodificadas: {ok}. Sin coordenadas: {fallidas}.")
+
+
+@click.command("trabajos-worker")
+@click.option("--concurrencia", type=int, default=None, help="Hilos del pool (por defecto COLA_CONCURRENCIA).")
+@click.option("--una-vez", is_flag=True, help="Procesa lo pendiente y termina.")
+def trabajos_worker_cmd(concurrencia: int | None, una_vez: bool) -> None:
+    """Consume la cola de notificaciones (correo, Facebook, Instagram)."""
+    from .cola_trabajos import TrabajadorCola
+
+    trabajador = TrabajadorCola(current_app._get_current_object(), concurrencia=concurrencia)
+    try:
+        if una_vez:
+            click.echo(f"Trabajos ejecutados: {trabajador.vaciar()}.")
+        else:
+            click.echo(f"Worker de la cola en marcha ({trabajador.concurrencia} hilos). Ctrl+C para salir.")
+            trabajador.ejecutar_en_bucle()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        trabajador.parar()
+
+
+@click.command("trabajos-estado")
+@click.option("--dias", default=7, show_default=True, help="Intentos de los últimos N días.")
+def trabajos_estado_cmd(dias: int) -> None:
+    """Tiempos y resultados de las notificaciones por canal."""
+    from .cola_trabajos import estadisticas_canales
+
+    desde = datetime.utcnow() - timedelta(days=dias)
+    estadisticas = estadisticas_canales(desde)
+    if not estadisticas:
+        click.echo(f"Sin intentos en los últimos {dias} días.")
+        return
+    for tipo, datos in estadisticas.items():
+        click.echo(
+            f"{tipo:<10} intentos={datos['intentos']} ok={datos['ok']} error={datos['error']} "
+            f"timeout={datos['timeout']} media={datos['media_ms']:.0f} ms p95={datos['p95_ms']} ms"
+        )
+
+
+@click.command("exportar-fotos")
+@click.option("--lote", default=200, show_default=True, help="Fotos por consulta.")
+def exportar_fotos_cmd(lote: int) -> None:
+    """Publica las fotos y sus variantes en MEDIA_DIR (incremental)."""
+    from .models import FotoMascotaDesaparecida as Foto
+    from .utils.exportar_fotos import obtener_exportador
+
+    exportador = obtener_exportador()
+    escritas = sin_cambios = 0
+    fallos = []
+    ids = []
+    ultimo_id = 0
+    while True:
+        fotos = Foto.query.filter(Foto.id > ultimo_id).order_by(Foto.id).limit(lote).all()
+        if not fotos:
+            break
+        informe = exportador.exportar(fotos)
+        escritas += len(informe.escritas)
+        sin_cambios += informe.sin_cambios
+        fallos.extend(informe.fallos)
+        ids.extend(foto.id for foto in fotos)
+        ultimo_id = fotos[-1].id
+        # Libera los binarios del lote ya exportado
+        db.session.expunge_all()
+
+    retiradas = exportador.podar(ids)
+    click.echo(
+        f"Exportadas: {escritas}. Sin cambios: {sin_cambios}. Retiradas: {retiradas}. "
+        f"Fallidas: {len(fallos)}. Directorio: {exportador.raiz}"
+    )
+    for foto_id, motivo in fallos:
+        click.echo(f"  foto {foto_id}: {motivo}")
+
+
+@click.command("huellas-fotos")
+@click.option("--todas", is_flag=True, help="Recalcula también las que ya tienen huellas.")
+@click.option("--lote", default=200, show_default=True, help="Fotos por commit.")
+def huellas_fotos_cmd(todas: bool, lote: int) -> None:
+    """Calcula las huellas perceptuales de las fotos existentes."""
+    from sqlalchemy.orm import undefer
+
+    from .models import FotoMascotaDesaparecida as Foto
+    from .utils.huellas_fotos import calcular_huellas
+    from .utils.resolver_fotos import datos_de_foto
+
+    query = Foto.query.options(undefer(Foto.data)).order_by(Foto.id)
+    if not todas:
+        query = query.filter(Foto.phash.is_(None))
+
+    ok = fallidas = 0
+    ultimo_id = 0
+    while True:
+        fotos = query.filter(Foto.id > ultimo_id).limit(lote).all()
+        if not fotos:
+            break
+        for foto in fotos:
+            data = datos_de_foto(foto)
+            try:
+                ahash, dhash, phash = calcular_huellas(data).a_hex()
+            except Exception as exc:
+                click.echo(f"  foto {foto.id}: {exc if data is not None else 'sin datos'}")
+                fallidas += 1
+                continue
+            # El contenido no cambia: se conserva fecha_modificacion (Last-Modified).
+            # fecha_huellas sí cambia, para que los workers reconstruyan su índice.
+            db.session.execute(
+                update(Foto)
+                .where(Foto.id == foto.id)
+                .values(
+                    ahash=ahash, dhash=dhash, phash=phash,
+                    fecha_huellas=datetime.utcnow(), fecha_modificacion=Foto.fecha_modificacion,
+                )
+            )
+            ok += 1
+        ultimo_id = fotos[-1].id
+        db.session.commit()
+        db.session.expunge_all()
+
+    current_app.extensions.pop("indice_huellas", None)
+    click.echo(f"Fotos con huellas: {ok}. Fallidas: {fallidas}.")
+
+
+@click.command("fotos-vaciar-data")
+@click.option("--lote", default=200, show_default=True, help="Fotos por commit.")
+def fotos_vaciar_data_cmd(lote: int) -> None:
+    """Vacía la columna data de las fotos cuyo blob ya está en el almacén."""
+    from .models import FotoMascotaDesaparecida as Foto
+    from .utils.almacen_blobs import almacen_persistente, obtener_almacen
+
+    if not almacen_persistente(current_app.config):
+        raise click.ClickException(
+            "El almacén es el directorio por defecto (instance/fotos), que no sobrevive a un "
+            "despliegue. Configura FOTOS_STORAGE=s3 o FOTOS_STORAGE_DIR."
+        )
+
+    almacen = obtener_almacen()
+    query = (
+        db.session.query(Foto.id, Foto.hash_contenido)
+        .filter(Foto.hash_contenido.isnot(None), Foto.data.isnot(None))
+        .order_by(Foto.id)
+    )
+    vaciadas = 0
+    sin_blob = []
+    ultimo_id = 0
+    while True:
+        filas = query.filter(Foto.id > ultimo_id).limit(lote).all()
+        if not filas:
+            break
+        comprobadas = [foto_id for foto_id, clave in filas if almacen.existe(clave)]
+        sin_blob.extend(foto_id for foto_id, _ in filas if foto_id not in comprobadas)
+        if comprobadas:
+            db.session.execute(
+                update(Foto)
+                .where(Foto.id.in_(comprobadas))
+                .values(data=None, fecha_modificacion=Foto.fecha_modificacion)
+            )
+        ultimo_id = filas[-1][0]
+        db.session.commit()
+        vaciadas += len(comprobadas)
+
+    click.echo(f"Fotos vaciadas: {vaciadas}. Sin blob en el almacén: {len(sin_blob)}.")
+    for foto_id in sin_blob:
+        click.echo(f"  foto {foto_id}: conserva data")
+
+
+def registrar_comandos(app: Flask) -> None:
+    app.cli.add_command(geocodificar_mascotas_cmd)
+    app.cli.add_command(trabajos_worker_cmd)
+    app.cli.add_command(trabajos_estado_cmd)
+    app.cli.add_command(exportar_fotos_cmd)
+    app.cli.add_command(huellas_fotos_cmd)
+    app.cli.add_command(fotos_vaciar_data_cmd)
@@ -1,6 +1,10 @@
+from datetime import datetime
+
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import UniqueConstraint, CheckConstraint
-from sqlalchemy.orm import validates
+from sqlalchemy.orm import deferred, validates
+
+from .utils.indice_cp import normalizar_cp
 
 db = SQLAlchemy()
 
@@ -22,7 +26,11 @@ class Mascota(db.Model):
 
     # Zona y código postal de desaparición
     zona = db.Column(db.String(50), nullable=False)             # localidad
-    codigo_postal = db.Column(db.String(5), nullable=False)     # nuevo campo
+    codigo_postal = db.Column(db.String(5), nullable=False, index=True)  # filtro por radio
+
+    # Coordenadas geocodificadas desde (codigo_postal, zona) al guardar
+    latitud = db.Column(db.Float, index=True)  # NULL = sin distancia calculable (filtro por radio)
+    longitud = db.Column(db.Float)
 
     # Estado del registro
     tipo_registro = db.Column(db.String(12), nullable=False)    # 'desaparecida' | 'encontrada'
@@ -54,11 +62,16 @@ class Mascota(db.Model):
     )
 
     @validates('propietario_email', 'tipo_registro', 'nombre', 'zona',
-               'codigo_postal', 'especie', 'color', 'tamano', 'sexo')
+               'especie', 'color', 'tamano', 'sexo')
     def _val_lower_strip(self, key, value):
         v = (value or "").strip()
         return v.lower()
 
+    @validates('codigo_postal')
+    def _val_codigo_postal(self, key, value):
+        # Como las claves del índice de CPs ("8001" -> "08001"): el filtro por radio compara con ellas
+        return normalizar_cp(value)
+
     @validates('propietario_telefono')
     def _val_tel(self, key, value):
         return (value or "").strip()
@@ -88,10 +101,25 @@ class FotoMascotaDesaparecida(db.Model):
 
     ruta = db.Column(db.String(200), nullable=False)
 
-    data = db.Column(db.LargeBinary, nullable=True)
+    # SHA-256 del contenido: clave en el almacén de blobs (web/utils/almacen_blobs.py)
+    hash_contenido = db.Column(db.String(64), nullable=True, index=True)
+    # Fichero tal como se subió, solo si FOTOS_GUARDAR_ORIGINAL (copia en frío)
+    hash_original = db.Column(db.String(64), nullable=True, index=True)
+
+    # Solo filas antiguas sin migrar. Diferida: los listados nunca traen los
+    # bytes; quien los necesite los pide con undefer(Foto.data).
+    data = deferred(db.Column(db.LargeBinary, nullable=True))
     mime_type = db.Column(db.String(50), nullable=True)
     nombre_archivo = db.Column(db.String(120), nullable=True)
     tamano_bytes = db.Column(db.Integer, nullable=True)
+    # Last-Modified de /foto/<id> (el ETag es hash_contenido)
+    fecha_modificacion = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Huellas perceptuales de 64 bits en hex (web/utils/huellas_fotos.py)
+    ahash = db.Column(db.String(16), nullable=True)
+    dhash = db.Column(db.String(16), nullable=True)
+    phash = db.Column(db.String(16), nullable=True)
+    # Cuándo se calcularon: el índice de huellas se reconstruye si cambia
+    fecha_huellas = db.Column(db.DateTime, nullable=True, index=True)
 
     __table_args__ = (
         UniqueConstraint('mascota_id', 'tipo_foto', name='uix_foto_mascota_tipo'),
@@ -100,4 +128,67 @@ class FotoMascotaDesaparecida(db.Model):
     mascota = db.relationship("Mascota", backref=db.backref("fotos", lazy=True))
 
     def __repr__(self):
-        return f"<Foto id={self.id} tipo_foto={self.tipo_foto!r} mascota_id={self.mascota_id}>"
\ No newline at end of file
+        return f"<Foto id={self.id} tipo_foto={self.tipo_foto!r} mascota_id={self.mascota_id}>"
+
+class Trabajo(db.Model):
+    """
+    Trabajo de la cola persistente (web/cola_trabajos.py). Hay una fila por
+    clave de idempotencia '<tipo>:<mascota_id>': volver a encolar la misma
+    clave no duplica el envío, solo sube `version` para que se repita con
+    los datos nuevos.
+    """
+    __tablename__ = "trabajo"
+
+    id = db.Column(db.Integer, primary_key=True)
+    clave = db.Column(db.String(80), nullable=False, unique=True)
+    tipo = db.Column(db.String(20), nullable=False)             # 'email' | 'facebook' | 'instagram'
+    mascota_id = db.Column(db.Integer, nullable=False, index=True)
+
+    estado = db.Column(db.String(10), nullable=False, default="pendiente")
+    version = db.Column(db.Integer, nullable=False, default=1)
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    ejecutar_despues = db.Column(db.DateTime, nullable=False)
+    bloqueado_hasta = db.Column(db.DateTime)                    # lease del worker que lo ejecuta
+    ultimo_error = db.Column(db.Text)
+    id_externo = db.Column(db.String(100))                      # post/medio publicado por esta versión
+    progreso = db.Column(db.Text)                               # JSON: lo que falta tras un envío parcial
+
+    creado = db.Column(db.DateTime, nullable=False)
+    actualizado = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_trabajo_estado_ejecutar_despues", "estado", "ejecutar_despues"),
+        CheckConstraint(
+            "estado IN ('pendiente','en_curso','hecho','fallido')", name="chk_trabajo_estado_valido"
+        ),
+    )
+
+    def __repr__(self):
+        return f"<Trabajo id={self.id} clave={self.clave!r} estado={self.estado!r} intentos={self.intentos}>"
+
+
+class EjecucionTrabajo(db.Model):
+    """
+    Un intento de ejecución de un Trabajo: duración y resultado por canal.
+    """
+    __tablename__ = "ejecucion_trabajo"
+
+    id = db.Column(db.Integer, primary_key=True)
+    trabajo_id = db.Column(db.Integer, db.ForeignKey("trabajo.id", ondelete="CASCADE"), nullable=False, index=True)
+    tipo = db.Column(db.String(20), nullable=False)
+    mascota_id = db.Column(db.Integer, nullable=False)
+    intento = db.Column(db.Integer, nullable=False)
+    inicio = db.Column(db.DateTime, nullable=False)
+    duracion_ms = db.Column(db.Integer, nullable=False)
+    resultado = db.Column(db.String(10), nullable=False)        # 'ok' | 'error' | 'timeout'
+    error = db.Column(db.Text)
+
+    __table_args__ = (
+        db.Index("ix_ejecucion_trabajo_tipo_inicio", "tipo", "inicio"),
+    )
+
+    def __repr__(self):
+        return (
+            f"<EjecucionTrabajo trabajo_id={self.trabajo_id} tipo={self.tipo!r} "
+            f"resultado={self.resultado!r} duracion_ms={self.duracion_ms}>"
+        )
@@ -3,26 +3,34 @@ import re
 import uuid
 import base64
 from collections import defaultdict
-from datetime import datetime, date
-from threading import Thread
+from datetime import datetime, date, timezone
 from typing import List, Dict
+from urllib.parse import urlencode
 
-import io
 import mimetypes
 
+import numpy as np
+
 from flask import (
     Blueprint, render_template, request, redirect,
     url_for, flash, jsonify, current_app,
-    send_file, abort, make_response  # <-- añade make_response aquí
+    send_file, abort, make_response,  # <-- añade make_response aquí
+    Response, stream_with_context,
 )
 
 from flask import has_request_context
 
 from sqlalchemy import or_, func
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
 from werkzeug.utils import secure_filename
+from werkzeug.http import is_resource_modified
 
 from .models import db, Mascota, FotoMascotaDesaparecida as Foto
+from .cola_trabajos import (
+    despertar_trabajador, encolar, iniciar_trabajador_embebido, manejador,
+    progreso_registrado, publicacion_registrada, registrar_progreso, registrar_publicacion, tiempo_restante,
+)
 from .utils.envia_mail import send_pet_email
 
 # from .utils.prueba_envio_facebook import send_pet_fb_message
@@ -35,9 +43,20 @@ from .utils.comparar_fotos_todas import comparar_fotos_todas
 from .utils.identificar_raza import identificar_raza
 from openai import OpenAI
 
-from .utils.cp_localidades import cp_localidades
-
-from .utils.calcula_KM_con_CP import calcula_KM_con_CP  # nuevo import
+from .utils.cp_localidades import cp_localidades, localidades_por_prefijo
+
+from .utils.calcula_KM_con_CP import cp_localidad_a_lonlat, dentro_de_radio, geocodificar_mascota
+from .utils.indice_espacial_cp import cps_en_radio
+from .utils.almacen_blobs import BlobNoEncontrado, obtener_almacen
+from .utils.cliente_http import resultado_desconocido
+from .utils.variantes_foto import FORMATOS, obtener_almacen_variantes, resolver_ancho
+from .utils.ingesta_fotos import FotoNoValida, OpcionesIngesta, procesar_foto
+from .utils.resolver_fotos import datos_de_foto
+from .utils.cache_fotos import FotoCacheada, obtener_cache_fotos
+from .utils.exportar_fotos import obtener_exportador, url_base_media
+from .utils.huellas_fotos import (
+    calcular_huellas, huellas_de_mascota, obtener_indice_huellas, radio_huellas, similitud,
+)
 
 
 
@@ -65,15 +84,33 @@ CODIGO_POSTAL_REGEX = re.compile(r"^\d{5}$")
 RADIO_MAX_KM = 100
 KM_POR_DIA = 20
 RADIO_MINIMO_KM  = 20  # mínimo radio permitido
+CACHE_LOCALIDADES_SEGUNDOS = 86400
 
 @main.route("/api/localidades/<codigo_postal>")
 def api_localidades(codigo_postal: str):
+    """
+    - 5 dígitos: localidades del código postal.
+    - 2 a 4 dígitos: sugerencias agrupadas por CP para autocompletar.
+    Las respuestas solo dependen del fichero de CPs: se sirven con ETag y
+    Cache-Control para que navegador/CDN las reutilicen.
+    """
     codigo_postal = (codigo_postal or "").strip()
-    if len(codigo_postal) != 5 or not codigo_postal.isdigit():
-        return jsonify({"error": "El código postal debe tener 5 dígitos."}), 400
+    if not codigo_postal.isdigit() or not 2 <= len(codigo_postal) <= 5:
+        return jsonify({"error": "El código postal debe tener 5 dígitos (o entre 2 y 4 para sugerencias)."}), 400
+
+    if len(codigo_postal) == 5:
+        datos = {"localidades": cp_localidades(codigo_postal)}
+    else:
+        limite = min(max(request.args.get("limite", 50, type=int), 1), 200)
+        datos = {
+            "prefijo": codigo_postal,
+            "sugerencias": localidades_por_prefijo(codigo_postal, limite),
+        }
 
-    localidades = cp_localidades(codigo_postal)
-    return jsonify({"localidades": localidades})
+    resp = jsonify(datos)
+    resp.add_etag()
+    resp.headers["Cache-Control"] = f"public, max-age={CACHE_LOCALIDADES_SEGUNDOS}"
+    return resp.make_conditional(request)
 
 def normalizar_codigo_postal(valor: str | None) -> str:
     if not valor:
@@ -147,7 +184,7 @@ def _extraer_ruta_absoluta_payload(info: dict | None) -> str | None:
 def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def image_bytes_to_data_url(data: bytes, mime_type: str | None = None, nombre_archivo: str | None = None) -> str:
+def image_bytes_to_data_url(data: bytes | memoryview, mime_type: str | None = None, nombre_archivo: str | None = None) -> str:
     if not mime_type and nombre_archivo:
         mime_type = mimetypes.guess_type(nombre_archivo)[0]
     mime = mime_type or "application/octet-stream"
@@ -218,60 +255,434 @@ def eliminar_archivo_relativo(ruta_rel: str | None) -> None:
 def eliminar_foto_obj(foto: Foto | None) -> None:
     if not foto:
         return
-    # Ya no borramos el archivo del sistema de ficheros, solo el registro en BD
+    # El blob puede estar compartido con otras fotos (mismo contenido): solo se
+    # marca para revisar tras el commit (_purgar_blobs_pendientes).
+    for clave in (foto.hash_contenido, foto.hash_original):
+        if clave:
+            _marcar_blob_para_revisar(clave)
+    db.session.info.setdefault("fotos_a_invalidar", set()).add(foto.id)
     db.session.delete(foto)
 
 
+def _marcar_blob_para_revisar(clave: str) -> None:
+    db.session.info.setdefault("blobs_a_revisar", set()).add(clave)
+
+
+def _purgar_blobs_pendientes() -> None:
+    """
+    Tras un commit, saca de la caché y de la exportación estática las fotos
+    borradas y borra del almacén los blobs marcados que ya no referencia
+    ninguna foto.
+    """
+    borradas = db.session.info.pop("fotos_a_invalidar", set())
+    cache = obtener_cache_fotos()
+    for foto_id in borradas:
+        cache.invalidar_foto(foto_id)
+    if borradas:
+        try:
+            obtener_exportador().despublicar(borradas)
+        except Exception:
+            current_app.logger.warning("No se pudieron despublicar las fotos %s", borradas, exc_info=True)
+    _purgar_blobs_huerfanos()
+
+
+def _descartar_pendientes() -> None:
+    """
+    Tras un rollback: las fotos marcadas siguen existiendo, así que no se
+    invalidan ni se despublican. Solo se purgan los blobs recién subidos que
+    han quedado sin referencias.
+    """
+    db.session.info.pop("fotos_a_invalidar", None)
+    _purgar_blobs_huerfanos()
+
+
+def _purgar_blobs_huerfanos() -> None:
+    claves = db.session.info.pop("blobs_a_revisar", set())
+    if not claves:
+        return
+    en_uso = {
+        clave
+        for columna in (Foto.hash_contenido, Foto.hash_original)
+        for (clave,) in db.session.query(columna).filter(columna.in_(claves)).distinct()
+    }
+    almacen = obtener_almacen()
+    for clave in claves - en_uso:
+        try:
+            almacen.eliminar(clave)
+            obtener_almacen_variantes().eliminar(clave)
+        except Exception:
+            current_app.logger.warning("No se pudo eliminar el blob %s", clave, exc_info=True)
+
+
+def _guardar_datos_foto(data: bytes) -> str:
+    clave = obtener_almacen().guardar(data)
+    # Si el commit falla, el blob recién subido queda sin referencias y se purga
+    _marcar_blob_para_revisar(clave)
+    return clave
+
+
+def _fotos_con_datos(mascota: Mascota) -> List[Foto]:
+    """
+    Fotos de la mascota con la columna `data` ya cargada (una sola consulta),
+    para los caminos que sí necesitan los binarios.
+    """
+    return (
+        Foto.query.options(undefer(Foto.data))
+        .filter_by(mascota_id=mascota.id)
+        .order_by(Foto.id)
+        .all()
+    )
+
+
+def _foto_con_datos(foto_id) -> Foto | None:
+    return Foto.query.options(undefer(Foto.data)).get(foto_id)
+
+
+def _tiene_datos_foto(foto: Foto | None) -> bool:
+    return bool(foto and (foto.hash_contenido or foto.data))
+
+
 from flask import has_request_context, url_for, current_app  # current_app ya lo importas arriba
 
-def _foto_url(foto_id: int, for_instagram: bool = False) -> str:
+def _foto_url(
+    foto_id: int,
+    for_instagram: bool = False,
+    ancho: int | None = None,
+    variante: str | None = None,
+    externa: bool = True,
+) -> str:
     """
     Devuelve la URL absoluta del endpoint de la foto, siempre con .jpg.
 
     Si for_instagram=True, se intenta usar IG_MEDIA_BASE_URL (p.ej. tu host
     onrender.com) antes que EXTERNAL_BASE_URL. Así los usuarios seguirán
     viendo buscarmascotas.com y solo IG usará la base alternativa.
+
+    Con MEDIA_BASE_URL, las fotos ya exportadas (flask exportar-fotos) se
+    sirven directamente desde nginx o la CDN. Instagram solo admite JPEG.
+
+    `ancho`/`variante` piden una copia reducida (como ?w= y ?variante= en
+    /foto); si está exportada se usa el fichero publicado en JPEG. Con
+    externa=False, la URL de /foto es relativa (plantillas).
     """
+    base_media = url_base_media()
+    if base_media:
+        ancho_publicado = resolver_ancho(str(ancho) if ancho else None, variante)
+        publicada = obtener_exportador().ruta_publicada(foto_id, ancho_publicado)
+        if publicada and (not for_instagram or publicada.endswith(".jpg")):
+            return f"{base_media}/{publicada}"
+
+    parametros = {"variante": variante} if variante else ({"w": ancho} if ancho else {})
+    if not externa:
+        return url_for("main.ver_foto", foto_id=foto_id, **parametros)
+
     base = None
     if for_instagram:
         base = current_app.config.get("IG_MEDIA_BASE_URL")
     if not base:
         base = current_app.config.get("EXTERNAL_BASE_URL")
     if base:
-        return f"{base.rstrip('/')}/foto/{foto_id}.jpg"
+        url = f"{base.rstrip('/')}/foto/{foto_id}.jpg"
+        return f"{url}?{urlencode(parametros)}" if parametros else url
 
     if has_request_context():
-        return url_for("main.ver_foto_jpg", foto_id=foto_id, _external=True)
+        return url_for("main.ver_foto_jpg", foto_id=foto_id, _external=True, **parametros)
 
     raise RuntimeError(
         "No hay contexto de petición y no se definió EXTERNAL_BASE_URL ni IG_MEDIA_BASE_URL; "
         "no se puede construir la URL de la foto."
     )
 
+
+@main.app_template_global("foto_url")
+def _foto_url_plantilla(foto_id: int, ancho: int | None = None, variante: str | None = None) -> str:
+    """
+    _foto_url para las plantillas: CDN si la foto está exportada y, si no,
+    la URL relativa de /foto.
+    """
+    return _foto_url(foto_id, ancho=ancho, variante=variante, externa=False)
+
 @main.route("/foto/<int:foto_id>")
 def ver_foto(foto_id: int):
     """
     Sirve la foto con cabeceras de caché/CORS/seguridad.
+    Con ?w=<px> o ?variante=thumb|medium|full devuelve una copia reducida.
     """
+    try:
+        ancho = resolver_ancho(request.args.get("w"), request.args.get("variante"))
+    except ValueError as exc:
+        abort(400, str(exc))
+    formato, negociado = _formato_variante() if ancho is not None else (None, False)
+
+    # Fotos calientes: se sirven sin leer binarios de la BD ni del almacén
+    clave_cache = (foto_id, ancho, formato)
+    cacheada = _cacheada_vigente(clave_cache)
+    if cacheada is not None:
+        resp = _respuesta_cacheada(cacheada)
+    else:
+        resp = _respuesta_foto(foto_id, ancho, formato, clave_cache)
+    if negociado:
+        resp.vary.add("Accept")
+    return _cabeceras_foto(resp)
+
+
+def _cacheada_vigente(clave_cache) -> FotoCacheada | None:
+    """
+    Entrada de la caché si la foto sigue existiendo sin cambios. Otro worker
+    pudo borrarla o sustituirla sin que esta caché (en memoria) lo sepa: se
+    comprueba su fila, solo la fecha de modificación.
+    """
+    cache = obtener_cache_fotos()
+    cacheada = cache.get(clave_cache)
+    if cacheada is None:
+        return None
+    fila = db.session.query(Foto.fecha_modificacion).filter(Foto.id == clave_cache[0]).first()
+    if fila is None or fila[0] != cacheada.ultima_modificacion:
+        cache.invalidar_foto(clave_cache[0])
+        return None
+    return cacheada
+
+
+def _respuesta_foto(foto_id: int, ancho: int | None, formato: str | None, clave_cache):
+    # Solo metadatos: una revalidación (304) no toca los binarios
     foto = Foto.query.get_or_404(foto_id)
-    if not foto.data:
-        abort(404)
 
-    resp = make_response(
+    if ancho is not None:
+        origen = foto.hash_contenido or f"foto-{foto.id}"
+        _, mimetype, extension, _ = FORMATOS[formato]
+        etag = f"{origen}-{ancho}.{extension}"
+        no_modificada = _no_modificada(etag, foto.fecha_modificacion)
+        if no_modificada is not None:
+            return no_modificada
+        ruta = _ruta_variante(foto, ancho, formato)
+        if ruta is not None:
+            return _respuesta_fichero(
+                ruta, mimetype, f"{foto.id}_{ancho}.{extension}", etag, foto.fecha_modificacion, clave_cache
+            )
+        # Sin variante se sirve el original
+        clave_cache = (foto_id, None, None)
+
+    # El contenido no cambia para un hash dado: el propio hash es el ETag.
+    # Las filas antiguas (binario en la tabla) tampoco cambian: se sustituyen.
+    etag = foto.hash_contenido or f"foto-{foto.id}"
+    no_modificada = _no_modificada(etag, foto.fecha_modificacion)
+    if no_modificada is not None:
+        return no_modificada
+
+    mimetype = foto.mime_type or "image/jpeg"
+    nombre = foto.nombre_archivo or f"{foto_id}.jpg"
+
+    tamano = None
+    if foto.hash_contenido:
+        almacen = obtener_almacen()
+        ruta = almacen.ruta_local(foto.hash_contenido)
+        if ruta is not None:
+            return _respuesta_fichero(ruta, mimetype, nombre, etag, foto.fecha_modificacion, clave_cache)
+        try:
+            tamano = almacen.tamano(foto.hash_contenido)
+        except BlobNoEncontrado:
+            # Las filas migradas conservan `data` hasta `flask fotos-vaciar-data`
+            current_app.logger.warning("Blob %s de la foto %s no encontrado", foto.hash_contenido, foto.id)
+
+        def _leer():
+            return almacen.leer(foto.hash_contenido)
+
+        def _trozos(inicio: int, longitud: int):
+            return _trozos_flujo(almacen.abrir_rango(foto.hash_contenido, inicio, longitud), longitud)
+    if tamano is None:
+        tamano = db.session.query(func.length(Foto.data)).filter(Foto.id == foto.id).scalar()
+        if not tamano:
+            abort(404)
+
+        def _leer():
+            # La respuesta y la caché necesitan bytes
+            return bytes(datos_de_foto(foto))
+
+        def _trozos(inicio: int, longitud: int):
+            return _trozos_columna_data(foto.id, inicio, longitud)
+
+    cache = obtener_cache_fotos()
+    if tamano <= cache.max_objeto:
+        cacheada = FotoCacheada(_leer(), mimetype, etag, foto.fecha_modificacion, nombre)
+        cache.set(clave_cache, cacheada)
+        return _respuesta_cacheada(cacheada)
+    return _respuesta_por_trozos(_trozos, tamano, mimetype, nombre, etag, foto.fecha_modificacion)
+
+
+def _respuesta_fichero(ruta, mimetype: str, nombre: str, etag: str,
+                       ultima_modificacion: datetime | None, clave_cache):
+    """
+    Sirve un fichero local (blob o variante); si cabe en la caché, se guarda
+    allí para las siguientes peticiones.
+    """
+    cache = obtener_cache_fotos()
+    if ruta.stat().st_size <= cache.max_objeto:
+        cacheada = FotoCacheada(ruta.read_bytes(), mimetype, etag, ultima_modificacion, nombre)
+        cache.set(clave_cache, cacheada)
+        return _respuesta_cacheada(cacheada)
+    # send_file ya atiende Range y usa sendfile del servidor
+    return make_response(
         send_file(
-            io.BytesIO(foto.data),
-            mimetype=foto.mime_type or "image/jpeg",
+            ruta,
+            mimetype=mimetype,
             as_attachment=False,
-            download_name=foto.nombre_archivo or f"{foto_id}.jpg",
+            download_name=nombre,
             conditional=True,
+            etag=etag,
+            last_modified=ultima_modificacion,
         )
     )
+
+
+def _respuesta_cacheada(cacheada: FotoCacheada):
+    resp = Response(cacheada.data, mimetype=cacheada.mimetype)
+    resp.set_etag(cacheada.etag)
+    if cacheada.ultima_modificacion is not None:
+        resp.last_modified = cacheada.ultima_modificacion
+    resp.headers.set("Content-Disposition", "inline", filename=cacheada.nombre)
+    # 304, Range e If-Range como send_file
+    return resp.make_conditional(request, accept_ranges=True, complete_length=len(cacheada.data))
+
+
+TROZO_FOTO = 64 * 1024
+# Cada trozo de una fila antigua es una consulta: trozos grandes para hacer pocas
+TROZO_COLUMNA_DATA = 1024 * 1024
+
+
+def _trozos_flujo(flujo, longitud: int):
+    """
+    Lee `longitud` bytes de `flujo` en trozos de TROZO_FOTO y lo cierra.
+    """
+    with flujo:
+        while longitud > 0:
+            trozo = flujo.read(min(TROZO_FOTO, longitud))
+            if not trozo:
+                break
+            longitud -= len(trozo)
+            yield trozo
+
+
+def _trozos_columna_data(foto_id: int, inicio: int, longitud: int):
+    """
+    Lee la columna `data` de una fila antigua por trozos con substr(), sin
+    traer el binario entero a memoria.
+
+    Un cursor de servidor (stream_results / yield_per) trocea filas, no el
+    valor de una columna: el driver traería el bytea entero. Con substr() un
+    Range solo lee su rango. Son filas antiguas mayores que la caché, así que
+    una consulta por MB es un coste aceptable.
+    """
+    posicion, fin = inicio, inicio + longitud
+    while posicion < fin:
+        trozo = (
+            db.session.query(func.substr(Foto.data, posicion + 1, min(TROZO_COLUMNA_DATA, fin - posicion)))
+            .filter(Foto.id == foto_id)
+            .scalar()
+        )
+        if not trozo:
+            break
+        posicion += len(trozo)
+        yield bytes(trozo)
+
+
+def _if_range_coincide(etag: str, ultima_modificacion: datetime | None) -> bool:
+    """
+    Sin If-Range, o si coincide con la versión actual, se atiende el Range;
+    si no, se envía la foto completa.
+    """
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return (
+            ultima_modificacion is not None
+            and if_range.date == ultima_modificacion.replace(microsecond=0, tzinfo=timezone.utc)
+        )
+    return True
+
+
+def _respuesta_por_trozos(trozos, tamano: int, mimetype: str, nombre: str,
+                          etag: str, ultima_modificacion: datetime | None):
+    """
+    Respuesta en streaming (memoria constante) con soporte de Range.
+    `trozos(inicio, longitud)` devuelve un iterador con esos bytes.
+    """
+    inicio, longitud, estado = 0, tamano, 200
+    rango = request.range
+    if rango is not None and _if_range_coincide(etag, ultima_modificacion):
+        limites = rango.range_for_length(tamano)
+        if limites is not None:
+            inicio, fin = limites
+            longitud, estado = fin - inicio, 206
+        elif len(rango.ranges) == 1:
+            resp = make_response("", 416)
+            resp.headers["Content-Range"] = f"bytes */{tamano}"
+            return resp
+        # Varios rangos: se ignoran y se envía la foto completa
+
+    resp = Response(stream_with_context(trozos(inicio, longitud)), status=estado, mimetype=mimetype)
+    resp.content_length = longitud
+    if estado == 206:
+        resp.headers["Content-Range"] = f"bytes {inicio}-{inicio + longitud - 1}/{tamano}"
+    resp.accept_ranges = "bytes"
+    resp.set_etag(etag)
+    if ultima_modificacion is not None:
+        resp.last_modified = ultima_modificacion
+    resp.headers.set("Content-Disposition", "inline", filename=nombre)
+    return resp
+
+
+def _no_modificada(etag: str, ultima_modificacion: datetime | None):
+    """
+    Respuesta 304 si la petición condicional (If-None-Match /
+    If-Modified-Since) coincide con la versión actual; None si no.
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=ultima_modificacion):
+        return None
+    resp = make_response("", 304)
+    resp.set_etag(etag)
+    if ultima_modificacion is not None:
+        resp.last_modified = ultima_modificacion
+    return resp
+
+
+def _cabeceras_foto(resp):
     resp.headers["Cache-Control"] = "public, max-age=31536000"
     resp.headers["Access-Control-Allow-Origin"] = "*"
     resp.headers["Cross-Origin-Resource-Policy"] = "cross-origin"
     resp.headers["X-Content-Type-Options"] = "nosniff"
     return resp
 
+
+def _formato_variante() -> tuple[str, bool]:
+    """
+    Formato de la variante: ?formato=jpeg|webp, o WebP si el navegador lo
+    anuncia en Accept. El segundo valor indica si se negoció por Accept.
+    """
+    formato = (request.args.get("formato") or "").strip().lower()
+    if formato in FORMATOS:
+        return formato, False
+    acepta_webp = any(valor == "image/webp" for valor, _ in request.accept_mimetypes)
+    return ("webp" if acepta_webp else "jpeg"), True
+
+
+def _ruta_variante(foto: Foto, ancho: int, formato: str):
+    """
+    Ruta de la variante `ancho` de la foto (generada y guardada en disco la
+    primera vez). None si no se puede generar; entonces se sirve el original.
+    """
+    origen = foto.hash_contenido or f"foto-{foto.id}"
+    try:
+        return obtener_almacen_variantes().obtener(
+            origen, ancho, formato, lambda: datos_de_foto(foto) or b""
+        )
+    except Exception:
+        current_app.logger.warning(
+            "No se pudo generar la variante %spx de la foto %s", ancho, foto.id, exc_info=True
+        )
+        return None
+
+
 @main.route("/foto/<int:foto_id>.jpg")
 def ver_foto_jpg(foto_id: int):
     """
@@ -297,19 +708,26 @@ def obtener_fotos_existentes(mascota: Mascota) -> List[Dict[str, str]]:
     return fotos_serializadas
 
 def _construir_mascotas_con_fotos(mascotas):
-    resultado = []
-    for mascota in mascotas:
-        fotos = Foto.query.filter_by(mascota_id=mascota.id).all()
-        fotos_info = []
-        for foto in fotos:
-            fotos_info.append({
-                "id": foto.id,
-                "tipo_foto": foto.tipo_foto or "desconocido",
-                "url": _foto_url(foto.id),
+    """
+    Empareja cada mascota con los metadatos de sus fotos. Una sola consulta
+    IN (...) para todo el listado, solo con las columnas que se muestran.
+    """
+    ids = [mascota.id for mascota in mascotas]
+    fotos_por_mascota: Dict[int, List[Dict[str, str]]] = defaultdict(list)
+    if ids:
+        filas = (
+            db.session.query(Foto.id, Foto.mascota_id, Foto.tipo_foto)
+            .filter(Foto.mascota_id.in_(ids))
+            .order_by(Foto.mascota_id, Foto.id)
+        )
+        for foto_id, mascota_id, tipo_foto in filas:
+            fotos_por_mascota[mascota_id].append({
+                "id": foto_id,
+                "tipo_foto": tipo_foto or "desconocido",
+                "url": _foto_url(foto_id),
                 "ruta": None,  # si no necesitas esta clave, puedes eliminar esta línea
             })
-        resultado.append((mascota, fotos_info))
-    return resultado
+    return [(mascota, fotos_por_mascota.get(mascota.id, [])) for mascota in mascotas]
 
 
 def _es_mascota_desaparecida_valida(mascota: Mascota | None) -> bool:
@@ -372,97 +790,182 @@ def _cargar_smtp_env(app) -> None:
     app.config["SMTP_TO_EMAIL"] = os.getenv("SMTP_TO_EMAIL", "")
 
 
+CANALES_NOTIFICACION = ("email", "facebook", "instagram")
+
+
 def _programar_envio_correo(mascota_id: int) -> None:
+    """
+    Encola un trabajo por canal (correo, Facebook, Instagram). La cola los
+    persiste, los ejecuta en paralelo con concurrencia acotada y los reintenta
+    si fallan; un canal lento no bloquea a los demás.
+
+    Con MEDIA_BASE_URL se encola también la exportación estática de las fotos.
+    """
+    canales = CANALES_NOTIFICACION + (("media",) if url_base_media() else ())
     try:
-        app = current_app._get_current_object()
-        _cargar_smtp_env(app)
-        Thread(
-            target=_worker_enviar_correo,
-            args=(app, mascota_id),
-            daemon=True
-        ).start()
+        for canal in canales:
+            encolar(canal, mascota_id)
+        db.session.commit()
+        despertar_trabajador()
     except Exception:
+        db.session.rollback()
         current_app.logger.exception(
             "No se pudo programar el envío de correo para la mascota %s", mascota_id
         )
 
-def _worker_enviar_correo(app, mascota_id: int) -> None:
-    with app.app_context():
-        mascota = Mascota.query.get(mascota_id)
-        if not mascota:
-            current_app.logger.error(
-                "No se encontró la mascota %s para enviar correo.", mascota_id
-            )
-            return
 
-        subject = (
-            f"🐶🐱 mascota {(mascota.tipo_registro or '').strip()}".strip() or "Mascota"
+@main.before_app_request
+def _arrancar_cola_trabajos() -> None:
+    # Recoge también los trabajos que quedaron pendientes antes de un reinicio
+    iniciar_trabajador_embebido()
+
+
+def _asunto_notificacion(mascota: Mascota) -> str:
+    return f"🐶🐱 mascota {(mascota.tipo_registro or '').strip()}".strip() or "Mascota"
+
+
+def _mascota_a_notificar(mascota_id: int) -> Mascota | None:
+    mascota = Mascota.query.get(mascota_id)
+    if not mascota:
+        current_app.logger.error(
+            "No se encontró la mascota %s para enviar correo.", mascota_id
+        )
+    return mascota
+
+
+@manejador("media")
+def _exportar_fotos_mascota(mascota_id: int) -> bool:
+    fotos = Foto.query.filter(Foto.mascota_id == mascota_id).order_by(Foto.id).all()
+    informe = obtener_exportador().exportar(fotos)
+    current_app.logger.info(
+        "Fotos exportadas de la mascota %s: %s nuevas, %s sin cambios, %s fallidas",
+        mascota_id, len(informe.escritas), informe.sin_cambios, len(informe.fallos),
+    )
+    return not informe.fallos
+
+
+@manejador("email")
+def _notificar_email(mascota_id: int) -> bool:
+    mascota = _mascota_a_notificar(mascota_id)
+    if not mascota:
+        return True
+
+    _cargar_smtp_env(current_app)
+    # Tras un envío parcial, el reintento solo va a quienes no lo recibieron
+    pendientes = progreso_registrado()
+    informe = send_pet_email(
+        _asunto_notificacion(mascota),
+        _construir_datos_email(mascota),
+        _obtener_rutas_fotos(mascota),
+        destinatarios_extra=_calcular_destinatarios_extra(mascota),
+        solo_destinatarios=pendientes,
+        plazo=tiempo_restante(),
+    )
+
+    if not informe.completo:
+        current_app.logger.error(
+            "Fallo al enviar correo automático de mascota %s", mascota_id
         )
-        datos_email = _construir_datos_email(mascota)
-        fotos_detalle = _obtener_rutas_fotos(mascota)
-        destinatarios_extra = _calcular_destinatarios_extra(mascota)
-
-        ok_email = send_pet_email(
-            subject,
-            datos_email,
-            fotos_detalle,
-            destinatarios_extra=destinatarios_extra,
+    if informe.enviados and informe.fallidos:
+        registrar_progreso(informe.fallidos)
+    return informe.completo
+
+
+def _ya_publicada(mascota_id: int, red: str) -> bool:
+    # Un reintento tras publicar (p. ej. si falló el registro) no repite el post
+    publicado = publicacion_registrada()
+    if publicado:
+        current_app.logger.info(
+            "La mascota %s ya está publicada en %s (%s); no se repite", mascota_id, red, publicado
         )
+    return bool(publicado)
 
-        if not ok_email:
-            current_app.logger.error(
-                "Fallo al enviar correo automático de mascota %s", mascota_id
-            )
 
-        ok_fb_post = publish_pet_fb_post(
-            subject,
-            datos_email,
-            fotos_detalle,
+@manejador("facebook")
+def _notificar_facebook(mascota_id: int) -> bool:
+    mascota = _mascota_a_notificar(mascota_id)
+    if not mascota:
+        return True
+    if _ya_publicada(mascota_id, "Facebook"):
+        return True
+
+    post_id = publish_pet_fb_post(
+        _asunto_notificacion(mascota),
+        _construir_datos_email(mascota),
+        _obtener_rutas_fotos(mascota),
+        plazo=tiempo_restante(),
+    )
+
+    if not post_id:
+        current_app.logger.error(
+            "Fallo al publicar en el feed de Facebook de la mascota %s", mascota_id
         )
-              
-        if not ok_fb_post:
-            current_app.logger.error(
-                "Fallo al publicar en el feed de Facebook de la mascota %s", mascota_id
-            )
+        return False
+    registrar_publicacion(post_id)
+    return True
 
-        # NUEVO: publicar en Instagram con nueva variable
-        # construye las URLs con la base específica para IG (IG_MEDIA_BASE_URL)
-        try:
-            fotos_urls = [
-                _foto_url(foto.id, for_instagram=True)
-                for foto in getattr(mascota, "fotos", [])
-                if foto.data
-            ]
-            # Reutiliza el formato largo
-            caption_lines = [
-                f"🐶🐱 mascota {mascota.tipo_registro}",
-                "",
-                "Datos de la mascota:",
-                "--------------------",
-                f"ID: {mascota.id}",
-                f"Tipo de registro: {mascota.tipo_registro}",
-                f"Nombre: {mascota.nombre}",
-                f"Especie: {mascota.especie}",
-                f"Raza: {mascota.raza or 'N/D'}",
-                f"Edad: {mascota.edad or 'N/D'}",
-                f"Zona: {(mascota.zona or '').strip()}",
-                f"Código postal: {(mascota.codigo_postal or '').strip()}",
-                f"Email contacto: {mascota.propietario_email or 'N/D'}",
-                f"Teléfono contacto: {mascota.propietario_telefono or 'N/D'}",
-                f"Color: {mascota.color or 'N/D'}",
-                f"Sexo: {mascota.sexo or 'N/D'}",
-                f"Chip: {mascota.chip or 'N/D'}",
-                f"Peso: {mascota.peso or 'N/D'}",
-                f"Tamaño: {mascota.tamano or 'N/D'}",
-                f"Descripción: {mascota.descripcion or 'N/D'}",
-                f"Fecha registro: {mascota.fecha_registro or 'N/D'}",
-                f"Fecha aparecida: {mascota.fecha_aparecida or 'N/D'}",
-                f"Estado aparecida: {mascota.estado_aparecida or 'N/D'}",
-            ]
-            caption = "\n".join(caption_lines)
-            publicar_en_instagram(caption, fotos_urls)
-        except Exception as e:
-            current_app.logger.warning("No se pudo publicar en Instagram: %s", e)
+
+@manejador("instagram")
+def _notificar_instagram(mascota_id: int) -> bool:
+    mascota = _mascota_a_notificar(mascota_id)
+    if not mascota:
+        return True
+    if _ya_publicada(mascota_id, "Instagram"):
+        return True
+
+    # construye las URLs con la base específica para IG (IG_MEDIA_BASE_URL)
+    ids_con_datos = (
+        db.session.query(Foto.id)
+        .filter(
+            Foto.mascota_id == mascota.id,
+            or_(Foto.hash_contenido.isnot(None), Foto.data.isnot(None)),
+        )
+        .order_by(Foto.id)
+    )
+    fotos_urls = [
+        _foto_url(foto_id, for_instagram=True)
+        for (foto_id,) in ids_con_datos
+    ]
+    # Reutiliza el formato largo
+    caption_lines = [
+        f"🐶🐱 mascota {mascota.tipo_registro}",
+        "",
+        "Datos de la mascota:",
+        "--------------------",
+        f"ID: {mascota.id}",
+        f"Tipo de registro: {mascota.tipo_registro}",
+        f"Nombre: {mascota.nombre}",
+        f"Especie: {mascota.especie}",
+        f"Raza: {mascota.raza or 'N/D'}",
+        f"Edad: {mascota.edad or 'N/D'}",
+        f"Zona: {(mascota.zona or '').strip()}",
+        f"Código postal: {(mascota.codigo_postal or '').strip()}",
+        f"Email contacto: {mascota.propietario_email or 'N/D'}",
+        f"Teléfono contacto: {mascota.propietario_telefono or 'N/D'}",
+        f"Color: {mascota.color or 'N/D'}",
+        f"Sexo: {mascota.sexo or 'N/D'}",
+        f"Chip: {mascota.chip or 'N/D'}",
+        f"Peso: {mascota.peso or 'N/D'}",
+        f"Tamaño: {mascota.tamano or 'N/D'}",
+        f"Descripción: {mascota.descripcion or 'N/D'}",
+        f"Fecha registro: {mascota.fecha_registro or 'N/D'}",
+        f"Fecha aparecida: {mascota.fecha_aparecida or 'N/D'}",
+        f"Estado aparecida: {mascota.estado_aparecida or 'N/D'}",
+    ]
+    caption = "\n".join(caption_lines)
+    # El sondeo de los contenedores no pasa del plazo del trabajo
+    try:
+        publicado = publicar_en_instagram(caption, fotos_urls, plazo=tiempo_restante())
+    except Exception as exc:
+        # Plazo agotado o resultado desconocido: la cola decide si se repite
+        if isinstance(exc, TimeoutError) or resultado_desconocido(exc):
+            raise
+        current_app.logger.error(
+            "Fallo al publicar en Instagram la mascota %s: %s", mascota_id, exc
+        )
+        return False
+    registrar_publicacion(publicado["id"])
+    return True
 
 def _construir_datos_email(mascota: Mascota) -> Dict[str, object]:
     return {
@@ -497,7 +1000,7 @@ def _obtener_rutas_fotos(mascota: Mascota | None) -> List[Dict[str, object]]:
     if not mascota:
         return fotos_info
 
-    for foto in getattr(mascota, "fotos", []):
+    for foto in _fotos_con_datos(mascota):
         fotos_info.append(
             {
                 "id": foto.id,
@@ -505,7 +1008,7 @@ def _obtener_rutas_fotos(mascota: Mascota | None) -> List[Dict[str, object]]:
                 "ruta_rel": None,
                 "ruta_abs": None,
                 "url": _foto_url(foto.id),
-                "data": foto.data,
+                "data": datos_de_foto(foto),
                 "mime_type": foto.mime_type,
                 "nombre_archivo": foto.nombre_archivo,
                 "tamano_bytes": foto.tamano_bytes,
@@ -520,6 +1023,39 @@ def _calcular_radio_permitido(fecha_desaparecida: date, fecha_encontrada: date)
     return min(RADIO_MAX_KM, dias_efectivos * KM_POR_DIA)
 
 
+def _coordenadas_mascota(mascota: Mascota) -> tuple[float, float] | None:
+    """
+    (lon, lat) guardadas en la mascota; si aún no las tiene, se geocodifican.
+    """
+    if mascota.longitud is not None and mascota.latitud is not None:
+        return (mascota.longitud, mascota.latitud)
+    if not mascota.codigo_postal:
+        return None
+    return cp_localidad_a_lonlat(mascota.codigo_postal, mascota.zona or "")
+
+
+def _filtro_cp_cercano(cp: str, zona: str, radio_km: float = RADIO_MAX_KM):
+    """
+    Condición SQL que limita las mascotas a los códigos postales con centroide
+    a menos de `radio_km` de (cp, zona), usando el índice de codigo_postal.
+    Como antes, se siguen incluyendo las que no tienen distancia calculable:
+    sin coordenadas (CP desconocido en GeoNames o aún sin geocodificar), sin
+    zona o sin fecha. El filtro exacto por radio se hace después en Python.
+    Devuelve None si el origen no se puede geolocalizar.
+    """
+    cercanos = cps_en_radio(cp, zona, radio_km)
+    if cercanos is None:
+        return None
+    return or_(
+        Mascota.codigo_postal.in_(sorted(cercanos)),
+        Mascota.latitud.is_(None),
+        Mascota.longitud.is_(None),
+        Mascota.zona.is_(None),
+        Mascota.zona == "",
+        Mascota.fecha_registro.is_(None),
+    )
+
+
 def _calcular_destinatarios_extra(mascota: Mascota) -> List[str]:
     destinatarios: List[str] = []
     correo_propietario = (mascota.propietario_email or "").strip()
@@ -529,13 +1065,22 @@ def _calcular_destinatarios_extra(mascota: Mascota) -> List[str]:
     if (mascota.tipo_registro or "").lower() != "encontrada":
         return destinatarios
 
+    cp_encontrada = (mascota.codigo_postal or "").strip()
+    zona_encontrada = (mascota.zona or "").strip()
+
+    origen = None
+    if mascota.fecha_registro and cp_encontrada and zona_encontrada:
+        origen = _coordenadas_mascota(mascota)
+
     # Traemos todos los datos necesarios para el filtro de distancia
-    registros_previos = (
+    query = (
         Mascota.query.with_entities(
             Mascota.propietario_email,
             Mascota.codigo_postal,
             Mascota.zona,
             Mascota.fecha_registro,
+            Mascota.longitud,
+            Mascota.latitud,
         )
         .filter(
             Mascota.tipo_registro == "desaparecida",
@@ -544,35 +1089,52 @@ def _calcular_destinatarios_extra(mascota: Mascota) -> List[str]:
             Mascota.propietario_email.isnot(None),
             Mascota.propietario_email != "",
         )
-        .distinct()
-        .all()
     )
+    if origen is not None:
+        # Ningún radio permitido supera RADIO_MAX_KM: solo CPs cercanos
+        filtro_cp = _filtro_cp_cercano(cp_encontrada, zona_encontrada)
+        if filtro_cp is not None:
+            query = query.filter(filtro_cp)
+    registros_previos = query.distinct().all()
+
+    # Coordenadas y radio por fila; NaN = sin filtro de distancia (se incluye)
+    n = len(registros_previos)
+    lons = np.full(n, np.nan)
+    lats = np.full(n, np.nan)
+    radios = np.zeros(n)
+    coords_cache: Dict[tuple, tuple | None] = {}
+
+    if origen is not None:
+        for i, (_, cp_desap, zona_desap, fecha_desap, lon_desap, lat_desap) in enumerate(registros_previos):
+            if not (fecha_desap and cp_desap and zona_desap):
+                continue
+            radio_permitido = _calcular_radio_permitido(fecha_desap, mascota.fecha_registro)
+            if radio_permitido <= 0:
+                continue
+            if lon_desap is not None and lat_desap is not None:
+                coords = (lon_desap, lat_desap)
+            else:
+                # Registros aún sin geocodificar (ver `flask geocodificar-mascotas`)
+                clave = (cp_desap, zona_desap)
+                if clave not in coords_cache:
+                    coords_cache[clave] = cp_localidad_a_lonlat(cp_desap, zona_desap)
+                coords = coords_cache[clave]
+            if coords is None:
+                continue
+            lons[i], lats[i] = coords
+            radios[i] = radio_permitido
 
-    cp_encontrada = (mascota.codigo_postal or "").strip()
-    zona_encontrada = (mascota.zona or "").strip()
+        incluir = dentro_de_radio(
+            origen[0], origen[1], lons, lats, radios, incluir_desconocidos=True
+        )
+    else:
+        incluir = np.ones(n, dtype=bool)
 
-    for correo, cp_desap, zona_desap, fecha_desap in registros_previos:
+    for (correo, *_), incluir_fila in zip(registros_previos, incluir):
         correo_norm = (correo or "").strip()
         if not correo_norm or correo_norm in destinatarios:
             continue
-
-        incluir = True
-
-        if (
-            mascota.fecha_registro
-            and fecha_desap
-            and cp_encontrada
-            and zona_encontrada
-            and cp_desap
-            and zona_desap
-        ):
-            radio_permitido = _calcular_radio_permitido(fecha_desap, mascota.fecha_registro)
-            if radio_permitido > 0:
-                distancia = calcula_KM_con_CP(cp_encontrada, zona_encontrada, cp_desap, zona_desap)
-                if distancia is not None and distancia > radio_permitido:
-                    incluir = False
-
-        if incluir:
+        if incluir_fila:
             destinatarios.append(correo_norm)
 
     return destinatarios
@@ -857,6 +1419,11 @@ def crear_mascota(mascota_id=None):
             )
             db.session.add(mascota)
 
+        if not geocodificar_mascota(mascota):
+            current_app.logger.warning(
+                "No se pudo geolocalizar CP=%s zona=%s", codigo_postal, zona
+            )
+
         print("[DBG CREAR] Antes de flush: mascota.id=", getattr(mascota, "id", None))
         try:
             db.session.flush()
@@ -869,6 +1436,7 @@ def crear_mascota(mascota_id=None):
             except Exception:
                 pass
             db.session.rollback()
+            _descartar_pendientes()
             flash("Error de integridad al guardar la mascota (posible duplicado).", "error")
             return redirect(request.url)
 
@@ -894,7 +1462,7 @@ def crear_mascota(mascota_id=None):
               "tipos_foto len=", len(tipos_foto))
         print("[DBG CREAR] tipos_foto=", tipos_foto)
 
-        nuevas_rutas_guardadas: List[str] = []
+        opciones_ingesta = OpcionesIngesta.desde_config(current_app.config)
 
         for idx, archivo in enumerate(fotos):
             if not archivo or not archivo.filename:
@@ -906,36 +1474,48 @@ def crear_mascota(mascota_id=None):
             tipo_actual = tipos_foto[idx] if idx < len(tipos_foto) else ""
             tipo_actual = (tipo_actual or "desconocido").strip().lower()
 
-            if edit_mode and tipo_actual in existing_photos_by_type:
-                eliminar_foto_obj(existing_photos_by_type[tipo_actual])
-                existing_photos_by_type.pop(tipo_actual, None)
-
             # --- NUEVO: capturar contenido y metadatos ---
             data_bytes = archivo.read()
-            tamano_bytes = len(data_bytes)
-            mime_type = archivo.mimetype or mimetypes.guess_type(archivo.filename)[0] or "application/octet-stream"
             nombre_original = secure_filename(archivo.filename)  # guardamos el nombre original “limpio”
-            archivo.stream.seek(0)  # IMPORTANTÍSIMO para poder volver a guardar en disco
             # ------------------------------------------------
 
-            nombre_seguro = secure_filename(
-                f"{mascota.id}_{tipo_actual}_{uuid.uuid4().hex}_{archivo.filename}"
+            # Orientación EXIF, sin metadatos, lado largo acotado y recodificada
+            try:
+                procesada = procesar_foto(data_bytes, opciones_ingesta)
+            except FotoNoValida:
+                flash(f"Archivo '{archivo.filename}' ignorado: no es una imagen válida.", "warning")
+                continue
+            current_app.logger.info(
+                "Foto %s (%s): %d -> %d bytes, %dx%d, ahorro %d bytes (%.0f%%)",
+                nombre_original, tipo_actual, procesada.bytes_originales, len(procesada.data),
+                procesada.ancho, procesada.alto, procesada.bytes_ahorrados,
+                100 * procesada.bytes_ahorrados / max(procesada.bytes_originales, 1),
             )
-            ruta_fs = os.path.join(UPLOAD_FOLDER, nombre_seguro)
-            archivo.save(ruta_fs)
-            nuevas_rutas_guardadas.append(ruta_fs)
 
-            ruta_relativa = normalizar_ruta_foto(f"fotos/{nombre_seguro}")
+            if edit_mode and tipo_actual in existing_photos_by_type:
+                eliminar_foto_obj(existing_photos_by_type[tipo_actual])
+                existing_photos_by_type.pop(tipo_actual, None)
+
+            # El binario va al almacén de blobs; la fila solo guarda hash y metadatos
+            hash_contenido = _guardar_datos_foto(procesada.data)
+            hash_original = _guardar_datos_foto(data_bytes) if opciones_ingesta.guardar_original else None
+            # Para preseleccionar candidatas sin OpenAI (comparar_mascotas_candidatas)
+            ahash, dhash, phash = calcular_huellas(procesada.data).a_hex()
 
             db.session.add(
                 Foto(
                     mascota_id=mascota.id,
                     tipo_foto=tipo_actual,
-                    ruta=ruta_relativa,
-                    data=data_bytes,              # nuevo
-                    mime_type=mime_type,          # nuevo
-                    nombre_archivo=nombre_original,  # nuevo
-                    tamano_bytes=tamano_bytes,    # nuevo
+                    ruta=f"blobs/{hash_contenido}",
+                    hash_contenido=hash_contenido,
+                    hash_original=hash_original,
+                    mime_type=procesada.mime_type,
+                    nombre_archivo=f"{os.path.splitext(nombre_original)[0] or 'foto'}.{procesada.extension}",
+                    tamano_bytes=len(procesada.data),
+                    ahash=ahash,
+                    dhash=dhash,
+                    phash=phash,
+                    fecha_huellas=datetime.utcnow(),
                 )
             )
 
@@ -951,26 +1531,17 @@ def crear_mascota(mascota_id=None):
             except Exception:
                 pass
             db.session.rollback()
-            for ruta_guardada in nuevas_rutas_guardadas:
-                try:
-                    if os.path.isfile(ruta_guardada):
-                        os.remove(ruta_guardada)
-                except OSError:
-                    current_app.logger.warning("No se pudo eliminar archivo %s tras fallo de commit.", ruta_guardada)
+            _descartar_pendientes()
             flash("No se pudo guardar los datos de la mascota por un conflicto de integridad.", "error")
             return redirect(request.url)
         except Exception as exc:
             db.session.rollback()
-            for ruta_guardada in nuevas_rutas_guardadas:
-                try:
-                    if os.path.isfile(ruta_guardada):
-                        os.remove(ruta_guardada)
-                except OSError:
-                    current_app.logger.warning("No se pudo eliminar archivo %s tras fallo de commit.", ruta_guardada)
+            _descartar_pendientes()
             current_app.logger.exception("Error al guardar la mascota: %s", exc)
             flash("Ocurrió un error al guardar la mascota.", "error")
             return redirect(request.url)
 
+        _purgar_blobs_pendientes()
         print("[DBG CREAR] Mascota creada/actualizada OK. id=", mascota.id, "tipo=", mascota.tipo_registro)
 
         if edit_mode:
@@ -1011,10 +1582,12 @@ def eliminar_mascota(mascota_id):
         db.session.commit()
     except Exception as exc:
         db.session.rollback()
+        _descartar_pendientes()
         current_app.logger.exception("Error al eliminar mascota %s: %s", mascota_id, exc)
         flash("No se pudo eliminar la mascota.", "error")
         return redirect(url_for("main.modificar_mascotas"))
 
+    _purgar_blobs_pendientes()
     flash("Mascota eliminada correctamente.", "success")
     return redirect(url_for("main.modificar_mascotas"))
 
@@ -1218,11 +1791,12 @@ def identificar_raza_api(mascota_id: int):
         return jsonify({"ok": False, "mensaje": "Solo se pueden identificar razas de mascotas registradas como desaparecidas."}), 400
 
     # Genera data: URLs desde los binarios almacenados
-    fotos_obj = [f for f in mascota.fotos if f.data]
+    fotos_obj = [(f, datos_de_foto(f)) for f in _fotos_con_datos(mascota) if _tiene_datos_foto(f)][:5]  # opcional: límite de 5
     data_urls = [
-        image_bytes_to_data_url(f.data, f.mime_type, f.nombre_archivo)
-        for f in fotos_obj
-    ][:5]  # opcional: límite de 5
+        image_bytes_to_data_url(data, f.mime_type, f.nombre_archivo)
+        for f, data in fotos_obj
+        if data
+    ]
 
     if not data_urls:
         return jsonify({"ok": False, "mensaje": "Esta mascota no tiene fotos disponibles para identificar la raza."}), 400
@@ -1268,7 +1842,39 @@ def comparar_mascotas_candidatas(desaparecida_id: int):
             Mascota.fecha_registro >= desaparecida.fecha_registro
         )
 
+    # Solo encontradas dentro del radio máximo de búsqueda
+    cp_ref = (desaparecida.codigo_postal or "").strip()
+    zona_ref = (desaparecida.zona or "").strip()
+    if cp_ref and zona_ref:
+        filtro_cp = _filtro_cp_cercano(cp_ref, zona_ref)
+        if filtro_cp is not None:
+            candidatas_query = candidatas_query.filter(filtro_cp)
+
     candidatas = candidatas_query.order_by(Mascota.fecha_registro.asc()).all()
+
+    origen = _coordenadas_mascota(desaparecida)
+    if origen is not None and candidatas:
+        # Sin zona no hay distancia fiable: se incluyen, como en el filtro SQL
+        coords = [
+            (_coordenadas_mascota(c) if c.zona else None) or (np.nan, np.nan)
+            for c in candidatas
+        ]
+        lons, lats = zip(*coords)
+        cercanas = dentro_de_radio(
+            origen[0], origen[1], lons, lats, RADIO_MAX_KM, incluir_desconocidos=True
+        )
+        candidatas = [c for c, ok in zip(candidatas, cercanas) if ok]
+
+    # Preselección local por huellas perceptuales: las candidatas con fotos
+    # parecidas a las de la desaparecida van primero, de más a menos parecida
+    parecido: Dict[int, int] = {}
+    huellas = huellas_de_mascota(desaparecida.id)
+    if huellas and candidatas:
+        distancias = obtener_indice_huellas().parecidas(
+            huellas, radio_huellas(), mascota_ids=[c.id for c in candidatas]
+        )
+        parecido = {mascota_id: similitud(d) for mascota_id, d in distancias.items()}
+        candidatas.sort(key=lambda c: -parecido.get(c.id, -1))
     candidatas_con_fotos = _construir_mascotas_con_fotos(candidatas)
 
     if not candidatas:
@@ -1282,6 +1888,7 @@ def comparar_mascotas_candidatas(desaparecida_id: int):
         mascota_desaparecida=desaparecida,
         candidatas=candidatas,
         candidatas_con_fotos=candidatas_con_fotos,
+        parecido=parecido,
     )
 
 
@@ -1328,11 +1935,12 @@ def comparar_mascotas_detalle(desaparecida_id: int, encontrada_id: int):
     def _get_data_url_from_id(foto_id: int) -> str:
         if foto_id in data_url_cache:
             return data_url_cache[foto_id]
-        foto_obj = Foto.query.get(foto_id)
-        if not foto_obj or not foto_obj.data:
+        foto_obj = _foto_con_datos(foto_id)
+        data = datos_de_foto(foto_obj)
+        if not data:
             raise ValueError("No se encontró la foto en la base de datos.")
         data_url_cache[foto_id] = image_bytes_to_data_url(
-            foto_obj.data,
+            data,
             foto_obj.mime_type,
             foto_obj.nombre_archivo,
         )
@@ -1495,8 +2103,8 @@ def comparar_pareja_tipo_api(desaparecida_id: int, encontrada_id: int):
     foto_encon_id = foto_encon_payload.get("id")
 
     # Buscar las fotos en BD y validar tipo
-    foto_desap_obj = Foto.query.get(foto_desap_id) if foto_desap_id else None
-    foto_encon_obj = Foto.query.get(foto_encon_id) if foto_encon_id else None
+    foto_desap_obj = _foto_con_datos(foto_desap_id) if foto_desap_id else None
+    foto_encon_obj = _foto_con_datos(foto_encon_id) if foto_encon_id else None
 
     if not foto_desap_obj or foto_desap_obj.mascota_id != mascota_desaparecida.id:
         return jsonify({"ok": False, "mensaje": "No se encontró la foto desaparecida en la base de datos."}), 400
@@ -1508,12 +2116,14 @@ def comparar_pareja_tipo_api(desaparecida_id: int, encontrada_id: int):
     if (foto_encon_obj.tipo_foto or "").strip().lower() != tipo:
         return jsonify({"ok": False, "mensaje": "La foto encontrada no coincide con el tipo elegido."}), 400
 
-    if not foto_desap_obj.data or not foto_encon_obj.data:
+    bytes_desap = datos_de_foto(foto_desap_obj)
+    bytes_encon = datos_de_foto(foto_encon_obj)
+    if not bytes_desap or not bytes_encon:
         return jsonify({"ok": False, "mensaje": "No hay datos binarios de alguna foto."}), 400
 
     try:
-        data_desap = image_bytes_to_data_url(foto_desap_obj.data, foto_desap_obj.mime_type, foto_desap_obj.nombre_archivo)
-        data_encon = image_bytes_to_data_url(foto_encon_obj.data, foto_encon_obj.mime_type, foto_encon_obj.nombre_archivo)
+        data_desap = image_bytes_to_data_url(bytes_desap, foto_desap_obj.mime_type, foto_desap_obj.nombre_archivo)
+        data_encon = image_bytes_to_data_url(bytes_encon, foto_encon_obj.mime_type, foto_encon_obj.nombre_archivo)
     except Exception as exc:
         current_app.logger.exception("Error al convertir imágenes a data URL")
         return jsonify({"ok": False, "mensaje": f"No se pudieron procesar las imágenes: {exc}"}), 500
@@ -1574,8 +2184,8 @@ def comparar_pareja_todas_api(desaparecida_id: int, encontrada_id: int):
             "mensaje": "La mascota encontrada indicada no es válida."
         }), 400
 
-    fotos_desap_obj = [f for f in mascota_desaparecida.fotos if f.data]
-    fotos_encon_obj = [f for f in mascota_encontrada.fotos if f.data]
+    fotos_desap_obj = [(f, data) for f in _fotos_con_datos(mascota_desaparecida) if (data := datos_de_foto(f))]
+    fotos_encon_obj = [(f, data) for f in _fotos_con_datos(mascota_encontrada) if (data := datos_de_foto(f))]
 
     if not fotos_desap_obj:
         return jsonify({
@@ -1591,12 +2201,12 @@ def comparar_pareja_todas_api(desaparecida_id: int, encontrada_id: int):
 
     try:
         data_desap = [
-            image_bytes_to_data_url(f.data, f.mime_type, f.nombre_archivo)
-            for f in fotos_desap_obj
+            image_bytes_to_data_url(data, f.mime_type, f.nombre_archivo)
+            for f, data in fotos_desap_obj
         ]
         data_encon = [
-            image_bytes_to_data_url(f.data, f.mime_type, f.nombre_archivo)
-            for f in fotos_encon_obj
+            image_bytes_to_data_url(data, f.mime_type, f.nombre_archivo)
+            for f, data in fotos_encon_obj
         ]
     except Exception as exc:
         current_app.logger.exception("Error al convertir imágenes a data URL en comparar_todas")
@@ -0,0 +1,340 @@
+"""
+Almacenamiento de binarios (fotos) fuera de la base de datos.
+
+Los blobs se direccionan por contenido: la clave es el SHA-256 en hexadecimal,
+así que subir dos veces la misma imagen no ocupa el doble y la clave sirve
+también de ETag. La fila de la foto solo guarda la clave y los metadatos.
+
+Backends:
+  - AlmacenLocal: sistema de ficheros, repartido en subdirectorios
+    (ab/cd/abcdef...) para no tener miles de ficheros en una carpeta.
+  - AlmacenS3: cualquier servicio compatible con S3 (AWS, MinIO, R2...),
+    con peticiones firmadas SigV4 sobre `requests`; no requiere boto3.
+
+Configuración (app.config o variables de entorno):
+    FOTOS_STORAGE       'local' (por defecto) | 's3'
+    FOTOS_STORAGE_DIR   raíz del almacén local (por defecto instance/fotos)
+    FOTOS_S3_ENDPOINT, FOTOS_S3_BUCKET, FOTOS_S3_ACCESS_KEY,
+    FOTOS_S3_SECRET_KEY, FOTOS_S3_REGION, FOTOS_S3_PREFIX
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+from abc import ABC, abstractmethod
+import os
+import re
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Mapping, Optional
+from urllib.parse import quote, urlparse
+
+import requests
+from flask import current_app
+
+from .cache_lru import CacheLRU
+from .cliente_http import ClienteHTTP, obtener_cliente
+
+DIRECTORIO_POR_DEFECTO = Path(__file__).resolve().parents[2] / "instance" / "fotos"
+_CLAVE_VALIDA = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobNoEncontrado(KeyError):
+    pass
+
+
+def calcular_hash(data: bytes | memoryview) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _validar_clave(clave: str) -> str:
+    if not clave or not _CLAVE_VALIDA.match(clave):
+        raise ValueError(f"Clave de blob no válida: {clave!r}")
+    return clave
+
+
+class AlmacenBlobs(ABC):
+    """
+    Interfaz común de los backends.
+    """
+
+    @abstractmethod
+    def guardar(self, data: bytes) -> str:
+        ...
+
+    @abstractmethod
+    def abrir(self, clave: str) -> BinaryIO:
+        ...
+
+    @abstractmethod
+    def existe(self, clave: str) -> bool:
+        ...
+
+    @abstractmethod
+    def eliminar(self, clave: str) -> None:
+        ...
+
+    @abstractmethod
+    def tamano(self, clave: str) -> int:
+        ...
+
+    def abrir_rango(self, clave: str, inicio: int, longitud: int) -> BinaryIO:
+        """
+        Flujo posicionado en `inicio`; quien lo lea no debe pasar de `longitud`.
+        """
+        fh = self.abrir(clave)
+        fh.seek(inicio)
+        return fh
+
+    def leer(self, clave: str) -> bytes:
+        with self.abrir(clave) as fh:
+            return fh.read()
+
+    def leer_vista(self, clave: str) -> memoryview:
+        """
+        Contenido del blob como memoryview, para entregarlo sin más copias.
+        """
+        return memoryview(self.leer(clave))
+
+    def ruta_local(self, clave: str) -> Optional[Path]:
+        """
+        Ruta en disco del blob si el backend la tiene (permite servirlo con
+        send_file sin pasar por memoria). None en backends remotos.
+        """
+        return None
+
+
+class AlmacenLocal(AlmacenBlobs):
+    def __init__(self, raiz: str | os.PathLike):
+        self.raiz = Path(raiz)
+
+    def ruta(self, clave: str) -> Path:
+        clave = _validar_clave(clave)
+        return self.raiz / clave[:2] / clave[2:4] / clave
+
+    def ruta_local(self, clave: str) -> Optional[Path]:
+        ruta = self.ruta(clave)
+        return ruta if ruta.is_file() else None
+
+    def guardar(self, data: bytes) -> str:
+        clave = calcular_hash(data)
+        destino = self.ruta(clave)
+        if destino.exists():
+            return clave
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=destino.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, destino)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return clave
+
+    def abrir(self, clave: str) -> BinaryIO:
+        try:
+            return self.ruta(clave).open("rb")
+        except FileNotFoundError as exc:
+            raise BlobNoEncontrado(clave) from exc
+
+    def leer_vista(self, clave: str) -> memoryview:
+        # Se lee directamente en un buffer del tamaño del fichero (sin la
+        # copia intermedia de read() a bytes)
+        try:
+            with self.ruta(clave).open("rb", buffering=0) as fh:
+                buffer = bytearray(os.fstat(fh.fileno()).st_size)
+                leidos = fh.readinto(buffer)
+        except FileNotFoundError as exc:
+            raise BlobNoEncontrado(clave) from exc
+        return memoryview(buffer)[:leidos]
+
+    def existe(self, clave: str) -> bool:
+        return self.ruta(clave).is_file()
+
+    def tamano(self, clave: str) -> int:
+        try:
+            return self.ruta(clave).stat().st_size
+        except FileNotFoundError as exc:
+            raise BlobNoEncontrado(clave) from exc
+
+    def eliminar(self, clave: str) -> None:
+        try:
+            self.ruta(clave).unlink()
+        except FileNotFoundError:
+            pass
+
+
+class AlmacenS3(AlmacenBlobs):
+    """
+    Backend S3 (path-style: {endpoint}/{bucket}/{prefijo}{clave}).
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        prefijo: str = "",
+        timeout: float = 30,
+        cliente: Optional[ClienteHTTP] = None,
+    ):
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefijo = prefijo
+        self.timeout = timeout
+        # Todas las operaciones son idempotentes (clave = hash): se reintentan
+        self.cliente = cliente or obtener_cliente("s3", timeout=timeout)
+        # Un blob no cambia nunca: su tamaño se pregunta una sola vez
+        self._tamanos = CacheLRU(max_entradas=4096)
+
+    def _ruta(self, clave: str) -> str:
+        return quote(f"/{self.bucket}/{self.prefijo}{_validar_clave(clave)}")
+
+    def _cabeceras_firmadas(self, metodo: str, ruta: str, payload_hash: str) -> dict:
+        ahora = datetime.now(timezone.utc)
+        amz_date = ahora.strftime("%Y%m%dT%H%M%SZ")
+        fecha = ahora.strftime("%Y%m%d")
+        host = urlparse(self.endpoint).netloc
+
+        firmadas = "host;x-amz-content-sha256;x-amz-date"
+        peticion_canonica = "\n".join([
+            metodo,
+            ruta,
+            "",
+            f"host:{host}\nx-amz-content-sha256:{payload_hash}\nx-amz-date:{amz_date}\n",
+            firmadas,
+            payload_hash,
+        ])
+        ambito = f"{fecha}/{self.region}/s3/aws4_request"
+        texto_a_firmar = "\n".join([
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            ambito,
+            hashlib.sha256(peticion_canonica.encode("utf-8")).hexdigest(),
+        ])
+
+        clave_firma = ("AWS4" + self.secret_key).encode("utf-8")
+        for parte in (fecha, self.region, "s3", "aws4_request"):
+            clave_firma = hmac.new(clave_firma, parte.encode("utf-8"), hashlib.sha256).digest()
+        firma = hmac.new(clave_firma, texto_a_firmar.encode("utf-8"), hashlib.sha256).hexdigest()
+
+        return {
+            "x-amz-date": amz_date,
+            "x-amz-content-sha256": payload_hash,
+            "Authorization": (
+                f"AWS4-HMAC-SHA256 Credential={self.access_key}/{ambito}, "
+                f"SignedHeaders={firmadas}, Signature={firma}"
+            ),
+        }
+
+    def _peticion(self, metodo: str, clave: str, data: bytes | None = None,
+                  payload_hash: str = "UNSIGNED-PAYLOAD", **kwargs) -> requests.Response:
+        ruta = self._ruta(clave)
+        headers = self._cabeceras_firmadas(metodo, ruta, payload_hash)
+        headers.update(kwargs.pop("headers", None) or {})
+        return self.cliente.request(
+            metodo,
+            self.endpoint + ruta,
+            data=data,
+            headers=headers,
+            timeout=self.timeout,
+            **kwargs,
+        )
+
+    def guardar(self, data: bytes) -> str:
+        clave = calcular_hash(data)
+        if self.existe(clave):
+            return clave
+        # El SHA-256 del cuerpo es la propia clave
+        resp = self._peticion("PUT", clave, data=bytes(data), payload_hash=clave)
+        resp.raise_for_status()
+        return clave
+
+    def abrir(self, clave: str) -> BinaryIO:
+        return self._abrir(clave)
+
+    def abrir_rango(self, clave: str, inicio: int, longitud: int) -> BinaryIO:
+        # GET con Range: S3 solo envía los bytes pedidos
+        return self._abrir(clave, headers={"Range": f"bytes={inicio}-{inicio + longitud - 1}"})
+
+    def _abrir(self, clave: str, **kwargs) -> BinaryIO:
+        resp = self._peticion("GET", clave, stream=True, **kwargs)
+        if resp.status_code == 404:
+            resp.close()
+            raise BlobNoEncontrado(clave)
+        resp.raise_for_status()
+        resp.raw.decode_content = True
+        return resp.raw
+
+    def tamano(self, clave: str) -> int:
+        tamano = self._tamanos.get(clave)
+        if tamano is None:
+            resp = self._peticion("HEAD", clave)
+            if resp.status_code == 404:
+                raise BlobNoEncontrado(clave)
+            resp.raise_for_status()
+            tamano = int(resp.headers["Content-Length"])
+            self._tamanos.set(clave, tamano)
+        return tamano
+
+    def existe(self, clave: str) -> bool:
+        resp = self._peticion("HEAD", clave)
+        if resp.status_code == 404:
+            return False
+        resp.raise_for_status()
+        return True
+
+    def eliminar(self, clave: str) -> None:
+        resp = self._peticion("DELETE", clave)
+        if resp.status_code not in (200, 204, 404):
+            resp.raise_for_status()
+
+
+def crear_almacen(config: Mapping) -> AlmacenBlobs:
+    def _valor(nombre: str, defecto: str = "") -> str:
+        return str(config.get(nombre) or os.getenv(nombre) or defecto)
+
+    tipo = _valor("FOTOS_STORAGE", "local").strip().lower()
+    if tipo == "s3":
+        return AlmacenS3(
+            endpoint=_valor("FOTOS_S3_ENDPOINT", "https://s3.amazonaws.com"),
+            bucket=_valor("FOTOS_S3_BUCKET"),
+            access_key=_valor("FOTOS_S3_ACCESS_KEY"),
+            secret_key=_valor("FOTOS_S3_SECRET_KEY"),
+            region=_valor("FOTOS_S3_REGION", "us-east-1"),
+            prefijo=_valor("FOTOS_S3_PREFIX"),
+        )
+    if tipo != "local":
+        raise ValueError(f"FOTOS_STORAGE desconocido: {tipo!r}")
+    return AlmacenLocal(_valor("FOTOS_STORAGE_DIR", str(DIRECTORIO_POR_DEFECTO)))
+
+
+def almacen_persistente(config: Mapping) -> bool:
+    """
+    True si el almacén está configurado expresamente: S3 o un directorio
+    local indicado en FOTOS_STORAGE_DIR. El directorio por defecto está
+    dentro de instance/, que en Render se pierde en cada despliegue.
+    """
+    tipo = str(config.get("FOTOS_STORAGE") or os.getenv("FOTOS_STORAGE") or "local").strip().lower()
+    return tipo == "s3" or bool(config.get("FOTOS_STORAGE_DIR") or os.getenv("FOTOS_STORAGE_DIR"))
+
+
+def obtener_almacen() -> AlmacenBlobs:
+    """
+    Almacén configurado para la app actual (se crea una vez por app).
+    """
+    app = current_app._get_current_object()
+    almacen = app.extensions.get("almacen_fotos")
+    if almacen is None:
+        almacen = crear_almacen(app.config)
+        app.extensions["almacen_fotos"] = almacen
+    return almacen
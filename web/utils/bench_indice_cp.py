@@ -0,0 +1,135 @@
+"""
+Benchmark del índice de códigos postales frente al recorrido completo del TSV.
+
+Uso (desde la raíz del proyecto):
+    python web/utils/bench_indice_cp.py [repeticiones]
+
+Mide:
+  - scan: la implementación anterior, que relee `codigo_postal.txt` en cada llamada.
+  - frío: primera consulta con el índice (incluye la construcción).
+  - caliente: consultas posteriores contra el índice ya cargado (sin caché LRU).
+  - caché: consultas repetidas servidas por la caché LRU de `cp_localidad_a_lonlat`.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from web.utils.calcula_KM_con_CP import (  # noqa: E402
+    _buscar_lonlat,
+    _clave_cp_localidad,
+    _unquote,
+    cp_localidad_a_lonlat,
+    limpiar_cache_cp,
+)
+from web.utils.indice_cp import FICHERO_CP, _norm, reiniciar_indice_cp  # noqa: E402
+
+EJEMPLOS = [
+    ("28320", "Pinto"),
+    ("28231", "Las Rozas"),
+    ("04070", ""),
+    ("04118", "San Jose"),
+    ("28001", "Madrid"),
+    ("08001", "Barcelona"),
+    ("99999", "Inexistente"),
+]
+
+
+def cp_localidad_a_lonlat_scan(
+    cp: str,
+    localidad: str,
+    filename: Path = FICHERO_CP,
+) -> Optional[Tuple[float, float]]:
+    """
+    Implementación original: recorre el fichero completo en cada llamada.
+    Se mantiene solo como referencia para el benchmark y las pruebas.
+    """
+    cp = str(cp).strip()
+    if cp.isdigit() and len(cp) < 5:
+        cp = cp.zfill(5)
+
+    loc_raw = _unquote(localidad or "")
+    loc_clean = loc_raw.strip()
+    loc_norm = _norm(loc_raw) if loc_clean else ""
+
+    filas_cp = []
+    with filename.open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 12:
+                continue
+            if cols[1] != cp:
+                continue
+            name = cols[2]
+            try:
+                lat = float(cols[9])
+                lon = float(cols[10])
+                acc = int(cols[11])
+            except ValueError:
+                continue
+            filas_cp.append((name, lat, lon, acc))
+
+    if not filas_cp:
+        return None
+
+    candidatos = filas_cp
+    if loc_clean:
+        exactos = [fila for fila in filas_cp if _norm(fila[0]) == loc_norm]
+        if exactos:
+            candidatos = exactos
+        else:
+            parciales = [
+                fila
+                for fila in filas_cp
+                if loc_norm in _norm(fila[0]) or _norm(fila[0]) in loc_norm
+            ]
+            if parciales:
+                candidatos = parciales
+
+    mejor = max(candidatos, key=lambda fila: fila[3])
+    _, lat, lon, _ = mejor
+    return (lon, lat)
+
+
+def _medir(func, repeticiones: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for cp, loc in EJEMPLOS:
+            func(cp, loc)
+    return (time.perf_counter() - inicio) / (repeticiones * len(EJEMPLOS))
+
+
+def main(repeticiones: int = 20) -> None:
+    t_scan = _medir(cp_localidad_a_lonlat_scan, max(1, repeticiones // 10))
+
+    reiniciar_indice_cp()
+    limpiar_cache_cp()
+    inicio = time.perf_counter()
+    cp_localidad_a_lonlat(*EJEMPLOS[0])
+    t_frio = time.perf_counter() - inicio
+
+    def _sin_cache(cp: str, loc: str):
+        return _buscar_lonlat(*_clave_cp_localidad(cp, loc), FICHERO_CP)
+
+    t_caliente = _medir(_sin_cache, repeticiones * 100)
+    t_cache = _medir(cp_localidad_a_lonlat, repeticiones * 100)
+
+    print(f"scan (por consulta):      {t_scan * 1e3:10.3f} ms")
+    print(f"índice frío (1ª consulta): {t_frio * 1e3:10.3f} ms")
+    print(f"índice caliente:          {t_caliente * 1e6:10.3f} µs")
+    print(f"caché LRU:                {t_cache * 1e6:10.3f} µs")
+    print(f"aceleración caliente:     {t_scan / t_caliente:10.0f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,287 @@
+"""
+Caché de fotos servidas por /foto/<id>, delante de la BD y del almacén.
+
+Cuando una publicación se difunde, Facebook, Instagram y los clientes de
+correo piden una y otra vez las mismas pocas fotos. Con la caché, un acierto
+no lee binarios: solo comprueba la fila de la foto (consulta por clave
+primaria, sin `data`). La clave es (foto_id, ancho, formato); ancho None es
+la foto original.
+
+Modos:
+  - 'memoria': LRU acotada por bytes dentro del proceso (por defecto).
+  - 'disco': directorio compartido por todos los workers de la máquina; las
+    invalidaciones de un worker las ven los demás.
+  - 'no': sin caché.
+
+Las fotos se invalidan al borrarlas o sustituirlas. En modo memoria con
+varios workers, un worker no ve las invalidaciones de otro; por eso cada
+acierto comprueba que la fila sigue existiendo con la misma fecha de
+modificación antes de servirlo.
+
+Configuración (app.config o variables de entorno):
+    FOTOS_CACHE       'memoria' | 'disco' | 'no'
+    FOTOS_CACHE_MB    presupuesto en MB (por defecto 64)
+    FOTOS_CACHE_TTL   s que vive una entrada en memoria (por defecto 600)
+    FOTOS_CACHE_DIR   directorio del modo disco (por defecto instance/cache_fotos)
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from flask import current_app
+
+from .cache_lru import CacheLRU
+
+DIRECTORIO_POR_DEFECTO = Path(__file__).resolve().parents[2] / "instance" / "cache_fotos"
+MB = 1024 * 1024
+
+ClaveFoto = Tuple[int, Optional[int], Optional[str]]
+
+
+@dataclass(frozen=True)
+class FotoCacheada:
+    data: bytes
+    mimetype: str
+    etag: str
+    ultima_modificacion: Optional[datetime]
+    nombre: str
+
+
+class CacheLRUBytes(CacheLRU):
+    """
+    CacheLRU acotada además por el total de bytes de los valores. Los valores
+    más grandes que una octava parte del presupuesto no se guardan.
+    """
+
+    def __init__(self, max_bytes: int, max_entradas: int = 100_000, ttl: Optional[float] = None):
+        super().__init__(max_entradas=max_entradas, ttl=ttl)
+        self.max_bytes = max(1, int(max_bytes))
+        self.bytes = 0
+
+    @property
+    def max_objeto(self) -> int:
+        return self.max_bytes // 8
+
+    @staticmethod
+    def _tamano(valor: Any) -> int:
+        return len(valor.data) if isinstance(valor, FotoCacheada) else len(valor)
+
+    def set(self, clave: Hashable, valor: Any) -> None:
+        tamano = self._tamano(valor)
+        if tamano > self.max_objeto:
+            return
+        with self._lock:
+            anterior = self._datos.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= self._tamano(anterior[1])
+            self._datos[clave] = (time.monotonic(), valor)
+            self.bytes += tamano
+            while self._datos and (self.bytes > self.max_bytes or len(self._datos) > self.max_entradas):
+                _, (_, expulsado) = self._datos.popitem(last=False)
+                self.bytes -= self._tamano(expulsado)
+                self.expulsiones += 1
+
+    def get(self, clave: Hashable, defecto: Any = None) -> Any:
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is not None and self._caducado(item[0]):
+                del self._datos[clave]
+                self.bytes -= self._tamano(item[1])
+        return super().get(clave, defecto)
+
+    def invalidar(self, clave: Hashable) -> None:
+        with self._lock:
+            item = self._datos.pop(clave, None)
+            if item is not None:
+                self.bytes -= self._tamano(item[1])
+
+    def invalidar_foto(self, foto_id: int) -> None:
+        with self._lock:
+            for clave in [c for c in self._datos if c[0] == foto_id]:
+                self.bytes -= self._tamano(self._datos.pop(clave)[1])
+
+    def limpiar(self) -> None:
+        super().limpiar()
+        self.bytes = 0
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {**super().estadisticas(), "bytes": self.bytes, "max_bytes": self.max_bytes}
+
+
+class CacheFotosDisco:
+    """
+    Caché en disco: <raiz>/<foto_id>/<ancho>-<formato>.bin y su .json con los
+    metadatos. El orden LRU lo da la fecha de modificación (se toca en cada
+    acierto). Las escrituras son atómicas (fichero temporal + os.replace).
+    """
+
+    def __init__(self, raiz: str | os.PathLike, max_bytes: int):
+        self.raiz = Path(raiz)
+        self.max_bytes = max(1, int(max_bytes))
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    @property
+    def max_objeto(self) -> int:
+        return self.max_bytes // 8
+
+    def _rutas(self, clave: ClaveFoto) -> Tuple[Path, Path]:
+        foto_id, ancho, formato = clave
+        base = self.raiz / str(int(foto_id)) / f"{ancho or 'original'}-{formato or 'original'}"
+        return base.with_suffix(".bin"), base.with_suffix(".json")
+
+    def get(self, clave: ClaveFoto, defecto: Any = None) -> Any:
+        ruta_bin, ruta_meta = self._rutas(clave)
+        try:
+            meta = json.loads(ruta_meta.read_text("utf-8"))
+            data = ruta_bin.read_bytes()
+            os.utime(ruta_bin)
+        except (OSError, ValueError):
+            with self._lock:
+                self.fallos += 1
+            return defecto
+        with self._lock:
+            self.aciertos += 1
+        ultima = meta.get("ultima_modificacion")
+        return FotoCacheada(
+            data=data,
+            mimetype=meta["mimetype"],
+            etag=meta["etag"],
+            ultima_modificacion=datetime.fromisoformat(ultima) if ultima else None,
+            nombre=meta["nombre"],
+        )
+
+    @staticmethod
+    def _escribir(destino: Path, contenido: bytes) -> None:
+        fd, tmp = tempfile.mkstemp(dir=destino.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(contenido)
+            os.replace(tmp, destino)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def set(self, clave: ClaveFoto, valor: FotoCacheada) -> None:
+        if len(valor.data) > self.max_objeto:
+            return
+        ruta_bin, ruta_meta = self._rutas(clave)
+        meta = {
+            "mimetype": valor.mimetype,
+            "etag": valor.etag,
+            "ultima_modificacion": valor.ultima_modificacion.isoformat() if valor.ultima_modificacion else None,
+            "nombre": valor.nombre,
+        }
+        try:
+            ruta_bin.parent.mkdir(parents=True, exist_ok=True)
+            # Primero los metadatos: un .bin sin .json sería un fallo, no un dato erróneo
+            self._escribir(ruta_meta, json.dumps(meta).encode("utf-8"))
+            self._escribir(ruta_bin, valor.data)
+        except OSError:
+            current_app.logger.warning("No se pudo escribir la caché de la foto %s", clave, exc_info=True)
+            return
+        self._recortar()
+
+    def _ficheros(self):
+        ficheros = []
+        for ruta in self.raiz.glob("*/*.bin"):
+            try:
+                ficheros.append((ruta, ruta.stat()))
+            except FileNotFoundError:
+                pass  # lo acaba de borrar otro worker
+        return ficheros
+
+    def _recortar(self) -> None:
+        ficheros = self._ficheros()
+        total = sum(st.st_size for _, st in ficheros)
+        if total <= self.max_bytes:
+            return
+        for ruta, st in sorted(ficheros, key=lambda f: f[1].st_mtime):
+            for fichero in (ruta, ruta.with_suffix(".json")):
+                try:
+                    fichero.unlink()
+                except FileNotFoundError:
+                    pass
+            total -= st.st_size
+            with self._lock:
+                self.expulsiones += 1
+            if total <= self.max_bytes:
+                break
+
+    def invalidar_foto(self, foto_id: int) -> None:
+        shutil.rmtree(self.raiz / str(int(foto_id)), ignore_errors=True)
+
+    def limpiar(self) -> None:
+        shutil.rmtree(self.raiz, ignore_errors=True)
+        with self._lock:
+            self.aciertos = self.fallos = self.expulsiones = 0
+
+    def estadisticas(self) -> Dict[str, int]:
+        ficheros = self._ficheros() if self.raiz.is_dir() else []
+        return {
+            "entradas": len(ficheros),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "expulsiones": self.expulsiones,
+            "bytes": sum(st.st_size for _, st in ficheros),
+            "max_bytes": self.max_bytes,
+        }
+
+
+class SinCache:
+    max_objeto = 0
+
+    def get(self, clave, defecto=None):
+        return defecto
+
+    def set(self, clave, valor) -> None:
+        pass
+
+    def invalidar_foto(self, foto_id: int) -> None:
+        pass
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {}
+
+
+def crear_cache_fotos(config) -> CacheLRUBytes | CacheFotosDisco | SinCache:
+    def _valor(nombre: str, defecto: str) -> str:
+        valor = config.get(nombre)
+        if valor is None:
+            valor = os.getenv(nombre)
+        return defecto if valor in (None, "") else str(valor)
+
+    modo = _valor("FOTOS_CACHE", "memoria").strip().lower()
+    max_bytes = int(float(_valor("FOTOS_CACHE_MB", "64")) * MB)
+    if modo == "no":
+        return SinCache()
+    if modo == "disco":
+        return CacheFotosDisco(_valor("FOTOS_CACHE_DIR", str(DIRECTORIO_POR_DEFECTO)), max_bytes)
+    if modo != "memoria":
+        raise ValueError(f"FOTOS_CACHE desconocido: {modo!r}")
+    return CacheLRUBytes(max_bytes, ttl=float(_valor("FOTOS_CACHE_TTL", "600")))
+
+
+def obtener_cache_fotos():
+    """
+    Caché de fotos de la app actual (se crea una vez por app).
+    """
+    app = current_app._get_current_object()
+    cache = app.extensions.get("cache_fotos")
+    if cache is None:
+        cache = crear_cache_fotos(app.config)
+        app.extensions["cache_fotos"] = cache
+    return cache
@@ -0,0 +1,80 @@
+"""
+Caché LRU acotada, con caducidad opcional (TTL) y contadores de aciertos/fallos.
+
+Los resultados None también se guardan: así una clave desconocida (p. ej. un
+código postal que no está en GeoNames) no repite el cálculo en cada llamada.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_AUSENTE = object()
+
+
+class CacheLRU:
+    def __init__(self, max_entradas: int = 4096, ttl: Optional[float] = None):
+        self.max_entradas = max(1, int(max_entradas))
+        self.ttl = ttl
+        self._datos: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    def _caducado(self, instante: float) -> bool:
+        return self.ttl is not None and time.monotonic() - instante > self.ttl
+
+    def get(self, clave: Hashable, defecto: Any = None) -> Any:
+        with self._lock:
+            item = self._datos.get(clave, _AUSENTE)
+            if item is _AUSENTE or self._caducado(item[0]):
+                if item is not _AUSENTE:
+                    del self._datos[clave]
+                self.fallos += 1
+                return defecto
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return item[1]
+
+    def set(self, clave: Hashable, valor: Any) -> None:
+        with self._lock:
+            self._datos[clave] = (time.monotonic(), valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.expulsiones += 1
+
+    def obtener(self, clave: Hashable, calcular: Callable[[], Any]) -> Any:
+        """
+        Devuelve el valor cacheado para `clave` o lo calcula con `calcular()`
+        y lo guarda (incluido None).
+        """
+        valor = self.get(clave, _AUSENTE)
+        if valor is _AUSENTE:
+            valor = calcular()
+            self.set(clave, valor)
+        return valor
+
+    def invalidar(self, clave: Hashable) -> None:
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+            self.aciertos = self.fallos = self.expulsiones = 0
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {
+            "entradas": len(self._datos),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "expulsiones": self.expulsiones,
+        }
@@ -2,16 +2,23 @@ from __future__ import annotations
 
 from pathlib import Path
 import math
-import unicodedata
-from typing import Optional, Tuple
+import os
+from typing import TYPE_CHECKING, Dict, Optional, Sequence, Tuple
 
-FICHERO_CP = Path(__file__).resolve().parent / "codigo_postal.txt"
+import numpy as np
 
+from .cache_lru import CacheLRU
+from .indice_cp import FICHERO_CP, _norm, normalizar_cp
+from .localidad_difusa import Coincidencia, buscar_localidad
 
-def _norm(texto: str) -> str:
-    texto = texto.strip().lower()
-    texto = unicodedata.normalize("NFD", texto)
-    return "".join(c for c in texto if unicodedata.category(c) != "Mn")
+if TYPE_CHECKING:
+    from ..models import Mascota
+
+# Memoización de geocodificación y distancias; claves ya normalizadas
+# (CP con ceros a la izquierda + localidad sin acentos ni mayúsculas).
+_CACHE_TTL = float(os.getenv("CP_CACHE_TTL", "0")) or None
+_cache_lonlat = CacheLRU(int(os.getenv("CP_CACHE_ENTRADAS", "4096")), ttl=_CACHE_TTL)
+_cache_km = CacheLRU(int(os.getenv("CP_CACHE_ENTRADAS", "4096")), ttl=_CACHE_TTL)
 
 
 def _unquote(valor: str) -> str:
@@ -21,58 +28,54 @@ def _unquote(valor: str) -> str:
     return valor
 
 
+def _clave_cp_localidad(cp: str, localidad: str) -> Tuple[str, str]:
+    return normalizar_cp(cp), _norm(_unquote(localidad or ""))
+
+
+def _buscar_lonlat(cp: str, loc_norm: str, filename: Path) -> Optional[Tuple[float, float]]:
+    coincidencia = buscar_localidad(cp, loc_norm, filename)
+    if coincidencia is None:
+        return None
+    return (coincidencia.lon, coincidencia.lat)
+
+
+def cp_localidad_a_coincidencia(
+    cp: str,
+    localidad: str,
+    filename: Path = FICHERO_CP,
+) -> Optional[Coincidencia]:
+    """
+    Como `cp_localidad_a_lonlat`, pero devuelve la fila elegida con su nombre
+    y la confianza de la coincidencia (exacta, parcial, difusa o solo CP).
+    """
+    return buscar_localidad(*_clave_cp_localidad(cp, localidad), filename)
+
+
 def cp_localidad_a_lonlat(
     cp: str,
     localidad: str,
     filename: Path = FICHERO_CP,
 ) -> Optional[Tuple[float, float]]:
-    cp = str(cp).strip()
-    if cp.isdigit() and len(cp) < 5:
-        cp = cp.zfill(5)
-
-    loc_raw = _unquote(localidad or "")
-    loc_clean = loc_raw.strip()
-    loc_norm = _norm(loc_raw) if loc_clean else ""
-
-    filas_cp = []
-    with filename.open(encoding="utf-8") as f:
-        for line in f:
-            if not line.strip() or line.startswith("#"):
-                continue
-            cols = line.rstrip("\n").split("\t")
-            if len(cols) < 12:
-                continue
-            if cols[1] != cp:
-                continue
-            name = cols[2]
-            try:
-                lat = float(cols[9])
-                lon = float(cols[10])
-                acc = int(cols[11])
-            except ValueError:
-                continue
-            filas_cp.append((name, lat, lon, acc))
-
-    if not filas_cp:
-        return None
+    cp_norm, loc_norm = _clave_cp_localidad(cp, localidad)
+    return _cache_lonlat.obtener(
+        (cp_norm, loc_norm, filename),
+        lambda: _buscar_lonlat(cp_norm, loc_norm, filename),
+    )
+
 
-    candidatos = filas_cp
-    if loc_clean:
-        exactos = [fila for fila in filas_cp if _norm(fila[0]) == loc_norm]
-        if exactos:
-            candidatos = exactos
-        else:
-            parciales = [
-                fila
-                for fila in filas_cp
-                if loc_norm in _norm(fila[0]) or _norm(fila[0]) in loc_norm
-            ]
-            if parciales:
-                candidatos = parciales
-
-    mejor = max(candidatos, key=lambda fila: fila[3])
-    _, lat, lon, _ = mejor
-    return (lon, lat)
+def geocodificar_mascota(mascota: Mascota) -> bool:
+    """
+    Rellena latitud/longitud de la mascota a partir de (codigo_postal, zona).
+    Devuelve True si se pudo geolocalizar.
+    """
+    coords = None
+    if mascota.codigo_postal:
+        coords = cp_localidad_a_lonlat(mascota.codigo_postal, mascota.zona or "")
+    if coords is None:
+        mascota.longitud = mascota.latitud = None
+        return False
+    mascota.longitud, mascota.latitud = coords
+    return True
 
 
 def distancia_km(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
@@ -88,6 +91,67 @@ def distancia_km(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
     return 2 * R * math.asin(math.sqrt(a))
 
 
+def distancias_km(
+    lon0: float,
+    lat0: float,
+    lons: Sequence[float] | np.ndarray,
+    lats: Sequence[float] | np.ndarray,
+) -> np.ndarray:
+    """
+    Versión vectorizada de `distancia_km`: distancia en km desde (lon0, lat0)
+    a cada destino, en una sola pasada de NumPy. Los destinos NaN dan NaN.
+    """
+    R = 6371.0
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    phi1 = math.radians(lat0)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlmb = np.radians(lons - lon0)
+    a = (
+        np.sin(dphi / 2) ** 2
+        + math.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    )
+    return 2 * R * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def dentro_de_radio(
+    lon0: float,
+    lat0: float,
+    lons: Sequence[float] | np.ndarray,
+    lats: Sequence[float] | np.ndarray,
+    radios_km: Sequence[float] | np.ndarray | float,
+    incluir_desconocidos: bool = False,
+) -> np.ndarray:
+    """
+    Máscara booleana: True para cada destino cuya distancia al origen no supera
+    su radio (un radio por fila o uno común). Con `incluir_desconocidos`, los
+    destinos sin coordenadas (NaN) se consideran dentro.
+    """
+    dist = distancias_km(lon0, lat0, lons, lats)
+    mascara = dist <= np.asarray(radios_km, dtype=np.float64)
+    if incluir_desconocidos:
+        mascara |= np.isnan(dist)
+    return mascara
+
+
+def _calcular_km(
+    origen: Tuple[str, str],
+    destino: Tuple[str, str],
+) -> Optional[float]:
+    res1 = cp_localidad_a_lonlat(*origen)
+    if res1 is None:
+        return None
+    lon1, lat1 = res1
+
+    res2 = cp_localidad_a_lonlat(*destino)
+    if res2 is None:
+        return None
+    lon2, lat2 = res2
+
+    return distancia_km(lon1, lat1, lon2, lat2)
+
+
 def calcula_KM_con_CP(
     cp1: str,
     localidad1: str,
@@ -98,14 +162,21 @@ def calcula_KM_con_CP(
     Devuelve solo la distancia en km entre (cp1, localidad1) y (cp2, localidad2).
     Si alguno no se encuentra, retorna None.
     """
-    res1 = cp_localidad_a_lonlat(cp1, localidad1)
-    if res1 is None:
-        return None
-    lon1, lat1 = res1
+    # La distancia es simétrica: (A, B) y (B, A) comparten entrada
+    a, b = sorted([_clave_cp_localidad(cp1, localidad1), _clave_cp_localidad(cp2, localidad2)])
+    return _cache_km.obtener((a, b), lambda: _calcular_km(a, b))
+
+
+def estadisticas_cache_cp() -> Dict[str, Dict[str, int]]:
+    """
+    Contadores de aciertos/fallos/expulsiones de las cachés de geocodificación.
+    """
+    return {
+        "lonlat": _cache_lonlat.estadisticas(),
+        "km": _cache_km.estadisticas(),
+    }
 
-    res2 = cp_localidad_a_lonlat(cp2, localidad2)
-    if res2 is None:
-        return None
-    lon2, lat2 = res2
 
-    return distancia_km(lon1, lat1, lon2, lat2)
\ No newline at end of file
+def limpiar_cache_cp() -> None:
+    _cache_lonlat.limpiar()
+    _cache_km.limpiar()
@@ -0,0 +1,252 @@
+"""
+Cliente HTTP compartido para las integraciones externas (Brevo, Facebook,
+Instagram, Messenger, S3...).
+
+Cada integración tiene un ClienteHTTP con su propia requests.Session: pool de
+conexiones por host con keep-alive, de modo que las llamadas seguidas no
+repiten el handshake TCP+TLS. Los fallos transitorios se reintentan con espera
+exponencial y jitter, y se llevan contadores por integración.
+
+Los POST no son idempotentes (repetir uno que llegó puede duplicar un correo
+o una publicación): solo se reintentan si la conexión no llegó a abrirse o si
+el servidor respondió 429/503, que indican que no procesó la petición.
+
+El timeout admite, como en requests, un par (conexión, lectura): así una
+petición a un servidor caído falla pronto y una respuesta lenta tiene su
+propio límite. Con `limite` (un instante de time.monotonic(), p. ej. el plazo
+del trabajo de la cola) el timeout se recorta a lo que quede, no se reintenta
+si la espera no cabe y, si ya ha pasado, se lanza PlazoAgotado sin enviar nada.
+
+Configuración por integración (variables de entorno, con el nombre en
+mayúsculas, p. ej. HTTP_BREVO_TIMEOUT):
+    HTTP_<INTEGRACION>_TIMEOUT      s por petición (conexión y lectura)
+    HTTP_<INTEGRACION>_REINTENTOS   reintentos tras el primer intento
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+ESTADOS_REINTENTABLES = frozenset({429, 500, 502, 503, 504})
+ESTADOS_REINTENTABLES_POST = frozenset({429, 503})
+# Hijo del logger de la app ('web'): funciona también sin contexto de app,
+# en los hilos de las subidas concurrentes
+logger = logging.getLogger(__name__)
+
+METODOS_IDEMPOTENTES = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class PlazoAgotado(TimeoutError):
+    """
+    El plazo venció antes de enviar la petición: se puede repetir sin riesgo.
+    """
+
+
+def _recortar_timeout(timeout: Timeout, restante: float) -> Timeout:
+    if isinstance(timeout, tuple):
+        return tuple(min(t, restante) for t in timeout)
+    return min(timeout, restante)
+
+
+def _sin_conexion(exc: requests.RequestException) -> bool:
+    """
+    True si la conexión ni siquiera se abrió (DNS, conexión rechazada...).
+    """
+    motivo = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(motivo, NewConnectionError)
+
+
+def resultado_desconocido(exc: BaseException) -> bool:
+    """
+    True si tras `exc` no se sabe si el servidor procesó la petición: se envió
+    y no hubo respuesta (timeout de lectura, conexión cortada) o respondió con
+    un 5xx distinto de 503. Repetir un POST así puede duplicar su efecto.
+    """
+    if isinstance(exc, requests.HTTPError):
+        respuesta = exc.response
+        return respuesta is not None and respuesta.status_code >= 500 and respuesta.status_code != 503
+    if isinstance(exc, requests.ConnectTimeout) or (isinstance(exc, requests.RequestException) and _sin_conexion(exc)):
+        return False
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+class MetricasHTTP:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.peticiones = 0
+        self.reintentos = 0
+        self.errores = 0
+        self.tiempo_total_ms = 0.0
+        self.tiempo_max_ms = 0.0
+        self.por_estado: Counter = Counter()
+
+    def registrar(self, duracion_ms: float, estado: Optional[int], reintento: bool) -> None:
+        with self._lock:
+            self.peticiones += 1
+            self.reintentos += int(reintento)
+            self.tiempo_total_ms += duracion_ms
+            self.tiempo_max_ms = max(self.tiempo_max_ms, duracion_ms)
+            if estado is None:
+                self.errores += 1
+                self.por_estado["error_red"] += 1
+            else:
+                self.errores += int(estado >= 500)
+                self.por_estado[str(estado)] += 1
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "peticiones": self.peticiones,
+                "reintentos": self.reintentos,
+                "errores": self.errores,
+                "media_ms": self.tiempo_total_ms / self.peticiones if self.peticiones else 0.0,
+                "max_ms": self.tiempo_max_ms,
+                "por_estado": dict(self.por_estado),
+            }
+
+
+class ClienteHTTP:
+    def __init__(
+        self,
+        integracion: str,
+        timeout: Timeout = 15,
+        reintentos: int = 2,
+        espera_base: float = 0.5,
+        espera_max: float = 8.0,
+        pool_maxsize: int = 10,
+    ):
+        self.integracion = integracion
+        self.timeout = timeout
+        self.reintentos = max(0, reintentos)
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.metricas = MetricasHTTP()
+
+        self.sesion = requests.Session()
+        # El reintento se hace aquí (con jitter y métricas), no en urllib3
+        adaptador = HTTPAdapter(pool_connections=10, pool_maxsize=pool_maxsize, max_retries=0)
+        self.sesion.mount("https://", adaptador)
+        self.sesion.mount("http://", adaptador)
+
+    def _espera(self, intento: int, resp: Optional[requests.Response]) -> float:
+        limite = min(self.espera_base * 2 ** intento, self.espera_max)
+        retry_after = resp.headers.get("Retry-After") if resp is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.espera_max)
+        return random.uniform(0, limite)
+
+    def _reintentable(self, metodo: str, resp: Optional[requests.Response], exc: Optional[Exception]) -> bool:
+        idempotente = metodo in METODOS_IDEMPOTENTES
+        if exc is not None:
+            if isinstance(exc, requests.ConnectTimeout) or _sin_conexion(exc):
+                return True
+            # Sin respuesta: en un POST no sabemos si llegó a procesarse
+            return idempotente and isinstance(exc, (requests.ConnectionError, requests.Timeout))
+        estados = ESTADOS_REINTENTABLES if idempotente else ESTADOS_REINTENTABLES_POST
+        return resp.status_code in estados
+
+    def request(
+        self,
+        metodo: str,
+        url: str,
+        *,
+        timeout: Optional[Timeout] = None,
+        limite: Optional[float] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """
+        Como requests.request, con el pool de la integración, el timeout por
+        defecto y los reintentos. Devuelve la última respuesta (también si es
+        un error HTTP) o lanza la última excepción de red. Ningún intento
+        pasa de `limite` (time.monotonic()).
+        """
+        metodo = metodo.upper()
+        timeout = self.timeout if timeout is None else timeout
+        intento = 0
+        while True:
+            timeout_intento = timeout
+            if limite is not None:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise PlazoAgotado(f"[HTTP:{self.integracion}] {metodo} {url}: plazo agotado antes de enviar")
+                timeout_intento = _recortar_timeout(timeout, restante)
+            resp, error = None, None
+            inicio = time.perf_counter()
+            try:
+                resp = self.sesion.request(metodo, url, timeout=timeout_intento, **kwargs)
+            except requests.RequestException as exc:
+                error = exc
+            self.metricas.registrar(
+                (time.perf_counter() - inicio) * 1000,
+                resp.status_code if resp is not None else None,
+                reintento=intento > 0,
+            )
+
+            espera = self._espera(intento, resp)
+            sin_tiempo = limite is not None and time.monotonic() + espera >= limite
+            if intento == self.reintentos or sin_tiempo or not self._reintentable(metodo, resp, error):
+                if error is not None:
+                    raise error
+                return resp
+            if resp is not None:
+                resp.close()
+            logger.warning(
+                "[HTTP:%s] %s %s -> %s; reintento en %.1f s",
+                self.integracion, metodo, url, error or resp.status_code, espera,
+            )
+            time.sleep(espera)
+            intento += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def cerrar(self) -> None:
+        self.sesion.close()
+
+
+_clientes: Dict[str, ClienteHTTP] = {}
+_lock = threading.Lock()
+
+
+def obtener_cliente(integracion: str, **opciones) -> ClienteHTTP:
+    """
+    Cliente único por integración (se crea la primera vez). `opciones` son
+    los valores por defecto de ClienteHTTP; las variables de entorno
+    HTTP_<INTEGRACION>_TIMEOUT / _REINTENTOS tienen prioridad.
+    """
+    cliente = _clientes.get(integracion)
+    if cliente is not None:
+        return cliente
+    with _lock:
+        cliente = _clientes.get(integracion)
+        if cliente is None:
+            prefijo = f"HTTP_{integracion.upper()}_"
+            if os.getenv(prefijo + "TIMEOUT"):
+                opciones["timeout"] = float(os.environ[prefijo + "TIMEOUT"])
+            if os.getenv(prefijo + "REINTENTOS"):
+                opciones["reintentos"] = int(os.environ[prefijo + "REINTENTOS"])
+            cliente = ClienteHTTP(integracion, **opciones)
+            _clientes[integracion] = cliente
+    return cliente
+
+
+def metricas_http() -> Dict[str, Dict[str, Any]]:
+    """
+    Contadores de todas las integraciones usadas por este proceso.
+    """
+    return {nombre: cliente.metricas.estadisticas() for nombre, cliente in sorted(_clientes.items())}
@@ -0,0 +1,245 @@
+"""
+Versión compilada (binaria) del fichero de códigos postales.
+
+`compilar_cp` convierte `codigo_postal.txt` en `codigo_postal.bin`, con este
+formato (little-endian):
+
+    cabecera   magic, versión, ancho de clave, nº de claves, nº de filas,
+               tamaño y mtime del TSV de origen (para detectar si está obsoleto)
+    claves     códigos postales ordenados (ancho fijo, ASCII)
+    inicio     uint32[n_claves + 1]: primera fila de cada clave
+    lat/lon/acc  columnas float32[n_filas]
+    nombres    uint32[n_filas + 1] offsets + blob UTF-8 (nombre original)
+    norm       uint32[n_filas + 1] offsets + blob UTF-8 (nombre normalizado)
+
+`AlmacenCPBinario` abre el fichero con mmap: todos los workers de gunicorn
+comparten las mismas páginas y el arranque no necesita parsear nada.
+
+Uso para compilar a mano:
+    python -m web.utils.cp_binario
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import tempfile
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+from .indice_cp import FICHERO_CP, PAIS_POR_DEFECTO, EntradaCP, _cargar_fichero
+
+FICHERO_CP_BIN = FICHERO_CP.with_suffix(".bin")
+
+MAGIC = b"CPBIN\x00\x00\x00"
+VERSION = 1
+CABECERA = struct.Struct("<8sIIIIqq")
+
+
+def _firma_origen(origen: Path) -> tuple[int, int]:
+    st = origen.stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def _offsets_y_blob(textos: list[str]) -> tuple[np.ndarray, bytes]:
+    codificados = [t.encode("utf-8") for t in textos]
+    offsets = np.zeros(len(codificados) + 1, dtype="<u4")
+    offsets[1:] = np.cumsum([len(c) for c in codificados])
+    return offsets, b"".join(codificados)
+
+
+def _padding(n: int, alineacion: int = 8) -> bytes:
+    return b"\x00" * (-n % alineacion)
+
+
+def compilar_cp(
+    origen: Path = FICHERO_CP,
+    destino: Path = FICHERO_CP_BIN,
+    pais: str | None = PAIS_POR_DEFECTO,
+) -> Path:
+    """
+    Compila el TSV de GeoNames en el formato binario. La escritura es atómica
+    (fichero temporal + rename), así que varios procesos pueden compilar a la vez.
+    """
+    origen = Path(origen)
+    destino = Path(destino)
+    indice = _cargar_fichero(origen, pais)
+    claves = sorted(indice)
+    ancho = max((len(c) for c in claves), default=1)
+
+    inicio = np.zeros(len(claves) + 1, dtype="<u4")
+    nombres: list[str] = []
+    nombres_norm: list[str] = []
+    lat: list[float] = []
+    lon: list[float] = []
+    acc: list[float] = []
+    for i, cp in enumerate(claves):
+        entrada = indice[cp]
+        nombres.extend(entrada.nombres)
+        nombres_norm.extend(entrada.nombres_norm)
+        lat.extend(entrada.lat)
+        lon.extend(entrada.lon)
+        acc.extend(entrada.acc)
+        inicio[i + 1] = len(nombres)
+
+    off_nombres, blob_nombres = _offsets_y_blob(nombres)
+    off_norm, blob_norm = _offsets_y_blob(nombres_norm)
+    tamano, mtime_ns = _firma_origen(origen)
+
+    partes = [
+        CABECERA.pack(MAGIC, VERSION, ancho, len(claves), len(nombres), tamano, mtime_ns),
+        np.array(claves, dtype=f"S{ancho}").tobytes(),
+    ]
+    partes.append(_padding(sum(len(p) for p in partes)))
+    partes.extend([
+        inicio.tobytes(),
+        np.asarray(lat, dtype="<f4").tobytes(),
+        np.asarray(lon, dtype="<f4").tobytes(),
+        np.asarray(acc, dtype="<f4").tobytes(),
+        off_nombres.tobytes(),
+        off_norm.tobytes(),
+        blob_nombres,
+        blob_norm,
+    ])
+
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=destino.parent, prefix=destino.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            for parte in partes:
+                fh.write(parte)
+        os.replace(tmp, destino)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return destino
+
+
+class AlmacenCPBinario(Mapping):
+    """
+    Lector de `codigo_postal.bin` sobre mmap. Se comporta como un dict de solo
+    lectura CP -> EntradaCP; las columnas numéricas son vistas sin copia.
+    """
+
+    def __init__(self, ruta: Path = FICHERO_CP_BIN):
+        self.ruta = Path(ruta)
+        with self.ruta.open("rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, ancho, n_claves, n_filas, tamano, mtime_ns = CABECERA.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Formato de fichero de códigos postales no reconocido: {self.ruta}")
+        self.firma_origen = (tamano, mtime_ns)
+        self._n_claves = n_claves
+
+        pos = CABECERA.size
+        self._claves = np.frombuffer(self._mm, dtype=f"S{ancho}", count=n_claves, offset=pos)
+        pos += ancho * n_claves
+        pos += -pos % 8
+
+        def _columna(dtype: str, count: int) -> np.ndarray:
+            nonlocal pos
+            col = np.frombuffer(self._mm, dtype=dtype, count=count, offset=pos)
+            pos += col.nbytes
+            return col
+
+        self._inicio = _columna("<u4", n_claves + 1)
+        self._lat = _columna("<f4", n_filas)
+        self._lon = _columna("<f4", n_filas)
+        self._acc = _columna("<f4", n_filas)
+        self._off_nombres = _columna("<u4", n_filas + 1)
+        self._off_norm = _columna("<u4", n_filas + 1)
+        self._base_nombres = pos
+        self._base_norm = pos + int(self._off_nombres[-1])
+
+    def esta_actualizado(self, origen: Path = FICHERO_CP) -> bool:
+        try:
+            return self.firma_origen == _firma_origen(Path(origen))
+        except OSError:
+            # Sin TSV de origen no hay nada más reciente que el binario.
+            return True
+
+    def _textos(self, base: int, offsets: np.ndarray, ini: int, fin: int) -> tuple[str, ...]:
+        return tuple(
+            self._mm[base + int(offsets[i]):base + int(offsets[i + 1])].decode("utf-8")
+            for i in range(ini, fin)
+        )
+
+    def _posicion(self, cp: str) -> Optional[int]:
+        try:
+            clave = cp.encode("ascii")
+        except (AttributeError, UnicodeEncodeError):
+            return None
+        idx = int(np.searchsorted(self._claves, clave))
+        if idx < self._n_claves and self._claves[idx] == clave:
+            return idx
+        return None
+
+    def __getitem__(self, cp: str) -> EntradaCP:
+        idx = self._posicion(cp)
+        if idx is None:
+            raise KeyError(cp)
+        ini, fin = int(self._inicio[idx]), int(self._inicio[idx + 1])
+        return EntradaCP(
+            nombres=self._textos(self._base_nombres, self._off_nombres, ini, fin),
+            nombres_norm=self._textos(self._base_norm, self._off_norm, ini, fin),
+            lat=self._lat[ini:fin],
+            lon=self._lon[ini:fin],
+            acc=self._acc[ini:fin],
+        )
+
+    def columnas(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (cp de cada fila, lat, lon) para recorrer todas las filas de golpe.
+        """
+        por_clave = np.diff(self._inicio.astype(np.int64))
+        return np.repeat(self._claves, por_clave).astype(str), self._lat, self._lon
+
+    def __contains__(self, cp: object) -> bool:
+        return isinstance(cp, str) and self._posicion(cp) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return (c.decode("ascii") for c in self._claves)
+
+    def __len__(self) -> int:
+        return self._n_claves
+
+
+def abrir_binario(
+    origen: Path = FICHERO_CP,
+    destino: Path | None = None,
+    compilar: bool = True,
+) -> Optional[AlmacenCPBinario]:
+    """
+    Abre el binario asociado a `origen`. Si falta o está obsoleto y `compilar`
+    es True, lo recompila. Devuelve None si no hay forma de usarlo (p. ej.
+    sistema de ficheros de solo lectura); el llamador debe usar entonces el TSV.
+    """
+    origen = Path(origen)
+    destino = Path(destino) if destino else origen.with_suffix(".bin")
+
+    try:
+        almacen = AlmacenCPBinario(destino)
+        if almacen.esta_actualizado(origen):
+            return almacen
+    except (OSError, ValueError, struct.error):
+        pass
+
+    if not compilar or not origen.exists():
+        return None
+    try:
+        compilar_cp(origen, destino)
+        return AlmacenCPBinario(destino)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+if __name__ == "__main__":
+    ruta = compilar_cp()
+    almacen = AlmacenCPBinario(ruta)
+    print(f"Compilado {ruta} ({ruta.stat().st_size} bytes, {len(almacen)} códigos postales)")
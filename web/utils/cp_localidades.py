@@ -1,13 +1,30 @@
 from __future__ import annotations
 
-from pathlib import Path
-from typing import List
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
 
-# import sys
+from .indice_cp import obtener_indice_cp
 
-# Ajusta esta ruta a la ubicación real de tu fichero
-# (por ejemplo, en la carpeta data/ o donde lo tengas guardado).
-RUTA_FICHERO_CP = Path(__file__).resolve().parents[2] / "web"  / "utils"/  "codigo_postal.txt"
+# Mapa precalculado CP -> localidades ordenadas y lista ordenada de CPs
+# (para búsquedas por prefijo con bisect). Se construye una vez por proceso.
+_mapa: Optional[Dict[str, Tuple[str, ...]]] = None
+_cps_ordenados: List[str] = []
+_lock = threading.Lock()
+
+
+def _mapa_localidades() -> Dict[str, Tuple[str, ...]]:
+    global _mapa, _cps_ordenados
+    if _mapa is None:
+        with _lock:
+            if _mapa is None:
+                mapa = {
+                    cp: tuple(sorted({n.strip() for n in entrada.nombres if n.strip()}))
+                    for cp, entrada in obtener_indice_cp().items()
+                }
+                _cps_ordenados = sorted(mapa)
+                _mapa = mapa
+    return _mapa
 
 
 def cp_localidades(cp: str) -> List[str]:
@@ -23,29 +40,22 @@ def cp_localidades(cp: str) -> List[str]:
     if not cp_normalizado.isdigit():
         return []
 
-    localidades: set[str] = set()
-
-    with RUTA_FICHERO_CP.open("r", encoding="utf-8") as fh:
-        for linea in fh:
-            if not linea or linea.startswith("#"):
-                continue
-
-            campos = linea.rstrip("\n").split("\t")
-            if len(campos) < 3:
-                continue
-
-            pais, codigo_postal, place_name = campos[0], campos[1], campos[2]
+    return list(_mapa_localidades().get(cp_normalizado, ()))
 
-            # Filtramos solo España (código ES) y el CP pedido
-            if pais != "ES" or codigo_postal != cp_normalizado:
-                continue
 
-            localidad = place_name.strip()
-            if localidad:
-                localidades.add(localidad)
-
-    print ( sorted(localidades))
-    return sorted(localidades)
+def localidades_por_prefijo(prefijo: str, limite: int = 50) -> List[Dict[str, object]]:
+    """
+    Sugerencias para autocompletar: CPs que empiezan por `prefijo`, cada uno
+    con sus localidades, en orden de CP y como máximo `limite` grupos.
+    """
+    prefijo = (prefijo or "").strip()
+    if not prefijo.isdigit():
+        return []
 
-# if __name__ == "__main__":
-#    print (cp_localidades (sys.argv[1]))
\ No newline at end of file
+    mapa = _mapa_localidades()
+    ini = bisect_left(_cps_ordenados, prefijo)
+    fin = bisect_right(_cps_ordenados, prefijo + "\uffff", lo=ini)
+    return [
+        {"codigo_postal": cp, "localidades": list(mapa[cp])}
+        for cp in _cps_ordenados[ini:min(fin, ini + limite)]
+    ]
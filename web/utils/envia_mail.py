@@ -1,21 +1,59 @@
 import base64
-import urllib.request
+import time
+from dataclasses import dataclass, field
 from datetime import date, datetime
-from typing import Dict, Any, Iterable, Mapping, Optional, Sequence, Tuple, Union
+from typing import Dict, Any, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
 
-import requests
 from flask import current_app
 
+from .cliente_http import obtener_cliente
+from .resolver_fotos import cargar_foto, id_foto_de_url
+
+BREVO_URL = "https://api.brevo.com/v3/smtp/email"
+
+# Destinatarios por petición (cada uno en su propia messageVersion) y pausa
+# entre peticiones para no chocar con el límite de Brevo. Se pueden cambiar con
+# BREVO_LOTE_DESTINATARIOS y BREVO_PAUSA_LOTES en la configuración.
+LOTE_DESTINATARIOS = 50
+PAUSA_LOTES = 0.5
+
+
+@dataclass
+class InformeEnvio:
+    """
+    Destinatarios a los que Brevo aceptó el correo y a los que no. Es falso
+    si no se envió a nadie (como el bool que se devolvía antes).
+    """
+    enviados: List[str] = field(default_factory=list)
+    fallidos: List[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.enviados)
+
+    @property
+    def completo(self) -> bool:
+        return bool(self.enviados) and not self.fallidos
+
+
+def _lotes(destinatarios: List[str], tamano: int) -> List[List[str]]:
+    return [destinatarios[i:i + tamano] for i in range(0, len(destinatarios), tamano)]
+
 
 def send_pet_email(
     subject: str,
     datos: Union[Mapping[str, object], Sequence[Tuple[str, object]]],
     fotos: Optional[Iterable[Dict[str, Any]]] = None,
     destinatarios_extra: Optional[Iterable[str]] = None,
-) -> bool:
+    solo_destinatarios: Optional[Iterable[str]] = None,
+    plazo: Optional[float] = None,
+) -> InformeEnvio:
     """
     Envía un correo electrónico con los datos y archivos indicados usando la API de Brevo.
+    Con `solo_destinatarios` se envía únicamente a esas direcciones (p. ej.
+    las que fallaron en un intento anterior). Con `plazo` (s), no se empiezan
+    lotes una vez vencido: sus destinatarios quedan en `fallidos`.
     """
+    limite = time.monotonic() + plazo if plazo is not None else None
     cfg = current_app.config
     # Reutilizamos las variables existentes
     smtp_user = cfg.get("SMTP_USERNAME")      # Remitente (validado en Brevo)
@@ -33,7 +71,7 @@ def send_pet_email(
         current_app.logger.error(
             "Correo no enviado: faltan variables (SMTP_USERNAME / SMTP_PASSWORD / SMTP_TO_EMAIL)."
         )
-        return False
+        return InformeEnvio()
 
     # Construir lista de destinatarios
     destinatarios = [
@@ -49,6 +87,9 @@ def send_pet_email(
             if correo_norm and correo_norm not in destinatarios:
                 destinatarios.append(correo_norm)
 
+    if solo_destinatarios is not None:
+        destinatarios = list(dict.fromkeys(str(c).strip() for c in solo_destinatarios if str(c).strip()))
+
     current_app.logger.info("[MAIL] Destinatarios finales: %s", destinatarios)
     print("[MAIL] Destinatarios finales:", destinatarios)
 
@@ -56,7 +97,7 @@ def send_pet_email(
         current_app.logger.error(
             "Correo no enviado: no se pudieron determinar destinatarios válidos."
         )
-        return False
+        return InformeEnvio()
 
     # Construir el cuerpo de texto plano
     if isinstance(datos, Mapping):
@@ -82,7 +123,17 @@ def send_pet_email(
         mime_type = foto.get("mime_type") or "application/octet-stream"
         nombre_archivo = foto.get("nombre_archivo") or f"foto_{foto.get('id', 'sin_id')}.jpg"
 
-        if not data_bytes:
+        if not data_bytes and foto.get("id") is not None:
+            # Foto de la propia app: se lee en proceso, sin petición HTTP
+            resuelta = cargar_foto(foto["id"])
+            if resuelta is not None:
+                data_bytes = resuelta.data
+            else:
+                current_app.logger.warning(
+                    "Foto sin datos adjuntables (id=%s). No se incluye en el correo.",
+                    foto.get("id"),
+                )
+        elif not data_bytes:
             url_publica = foto.get("url")
             if url_publica:
                 current_app.logger.info("[MAIL] Descargando foto de: %s", url_publica)
@@ -108,42 +159,68 @@ def send_pet_email(
                 "content": content_b64,
             })
 
-    # Construir el payload para la API de Brevo
+    # Parte común del payload para la API de Brevo. Cada lote la copia de forma
+    # superficial: la lista de adjuntos (lo que más pesa) se comparte.
     payload = {
         "sender": {"email": smtp_user, "name": "buscarmascotas.com"},
-        "to": [{"email": d} for d in destinatarios],
         "subject": subject,
         "textContent": cuerpo,
     }
     if adjuntos:
         payload["attachment"] = adjuntos
 
-    headers = {
-        "api-key": smtp_password,
-        "Content-Type": "application/json",
-    }
+    headers = {"api-key": smtp_password}
 
-    # Enviar el correo por HTTPS a Brevo
-    try:
-        current_app.logger.info("[MAIL] Enviando a Brevo API, destinatarios=%s", destinatarios)
-        print("[MAIL] Enviando a Brevo API...")
-        resp = requests.post(
-            "https://api.brevo.com/v3/smtp/email",
-            json=payload,
-            headers=headers,
-            timeout=30,
+    # Cada destinatario va en su propia messageVersion: nadie ve las
+    # direcciones de los demás, y cada petición lleva como mucho un lote.
+    tamano_lote = max(1, int(cfg.get("BREVO_LOTE_DESTINATARIOS") or LOTE_DESTINATARIOS))
+    pausa = cfg.get("BREVO_PAUSA_LOTES")
+    pausa = PAUSA_LOTES if pausa is None else float(pausa)
+    lotes = _lotes(destinatarios, tamano_lote)
+    cliente = obtener_cliente("brevo", timeout=(5, 30))
+    informe = InformeEnvio()
+
+    for numero, lote in enumerate(lotes, start=1):
+        if numero > 1 and pausa > 0:
+            time.sleep(pausa if limite is None else max(0.0, min(pausa, limite - time.monotonic())))
+        if limite is not None and time.monotonic() >= limite:
+            pendientes = [d for resto in lotes[numero - 1:] for d in resto]
+            current_app.logger.warning(
+                "[MAIL] Plazo agotado: %d lote(s) sin enviar (%d destinatarios)",
+                len(lotes) - numero + 1, len(pendientes),
+            )
+            informe.fallidos.extend(pendientes)
+            break
+        try:
+            current_app.logger.info("[MAIL] Enviando lote %d/%d a Brevo (%d destinatarios)", numero, len(lotes), len(lote))
+            print(f"[MAIL] Enviando a Brevo API, lote {numero}/{len(lotes)}...")
+            resp = cliente.post(
+                BREVO_URL,
+                json={**payload, "messageVersions": [{"to": [{"email": d}]} for d in lote]},
+                headers=headers,
+                limite=limite,
+            )
+            resp.raise_for_status()
+        except Exception as exc:  # pylint: disable=broad-except
+            current_app.logger.exception("Error al enviar correo (%s), lote %d: %s", subject, numero, exc)
+            print("[MAIL] Error al enviar correo:", exc)
+            informe.fallidos.extend(lote)
+        else:
+            informe.enviados.extend(lote)
+
+    if informe.fallidos:
+        # Quien llama puede reintentar solo estos (solo_destinatarios)
+        current_app.logger.error(
+            "Correo (%s) no entregado a %d de %d destinatarios: %s",
+            subject, len(informe.fallidos), len(destinatarios), ", ".join(informe.fallidos),
         )
-        resp.raise_for_status()
+    else:
         current_app.logger.info(
-            "Correo enviado correctamente vía Brevo: %s -> %s",
-            subject, ", ".join(destinatarios)
+            "Correo enviado correctamente vía Brevo: %s -> %d destinatarios en %d lote(s)",
+            subject, len(destinatarios), len(lotes),
         )
         print("[MAIL] Correo enviado OK vía Brevo")
-        return True
-    except Exception as exc:  # pylint: disable=broad-except
-        current_app.logger.exception("Error al enviar correo (%s): %s", subject, exc)
-        print("[MAIL] Error al enviar correo:", exc)
-        return False
+    return informe
 
 
 def formatear_valor(valor) -> str:
@@ -156,11 +233,19 @@ def formatear_valor(valor) -> str:
     return str(valor)
 
 
-def descargar_url_local(url_relativa: str, timeout: int = 30) -> tuple[bytes, Optional[str]]:
+def descargar_url_local(url_relativa: str, timeout: int = 30) -> tuple[bytes | memoryview, Optional[str]]:
     """
     Descarga una URL servida por la propia aplicación (por ejemplo, /foto/5).
-    Usa IG_MEDIA_BASE_URL si está configurada; de lo contrario, http://127.0.0.1:5000.
+    Las fotos (/foto/<id>) se leen en proceso; el resto se pide por HTTP a
+    IG_MEDIA_BASE_URL si está configurada o, si no, a http://127.0.0.1:5000.
     """
+    foto_id = id_foto_de_url(url_relativa)
+    if foto_id is not None:
+        resuelta = cargar_foto(foto_id)
+        if resuelta is None:
+            raise FileNotFoundError(f"La foto {foto_id} no existe o no tiene datos")
+        return resuelta.data, resuelta.mime_type
+
     base = current_app.config.get("IG_MEDIA_BASE_URL") or "http://127.0.0.1:5000"
 
     if url_relativa.startswith(("http://", "https://")):
@@ -171,7 +256,7 @@ def descargar_url_local(url_relativa: str, timeout: int = 30) -> tuple[bytes, Op
     current_app.logger.info("[MAIL] Descargando URL completa: %s", url_completa)
     print("[MAIL] Descargando URL completa:", url_completa)
 
-    with urllib.request.urlopen(url_completa, timeout=timeout) as resp:
-        data = resp.read()
-        mime = resp.info().get_content_type()
-        return data, mime
\ No newline at end of file
+    resp = obtener_cliente("app_local").get(url_completa, timeout=timeout)
+    resp.raise_for_status()
+    mime = resp.headers.get("Content-Type", "").split(";")[0].strip() or None
+    return resp.content, mime
\ No newline at end of file
@@ -0,0 +1,296 @@
+"""
+Exportación estática de las fotos para que las sirva nginx o una CDN.
+
+Cada foto publicada se escribe en MEDIA_DIR con un nombre que depende solo de
+su contenido: `<hash>.<ext>` el original y `<hash>-<ancho>.<ext>` sus
+variantes (JPEG y WebP). Un mismo contenido se escribe una sola vez y un
+fichero ya publicado nunca cambia, así que se puede servir con caché
+indefinida. `manifest.json` recoge qué se ha publicado por cada foto:
+
+    {"fotos": {"12": {"hash": "...", "modificada": "...", "original": "<hash>.jpg",
+                      "variantes": {"320.jpeg": "<hash>-320.jpg", ...}}}}
+
+La exportación es incremental (las fotos cuyo hash y fecha de modificación
+coinciden con el manifiesto no se vuelven a escribir) e idempotente. Las
+fotos borradas se retiran del manifiesto, y sus ficheros cuando ya no los
+usa ninguna otra foto.
+
+Configuración (app.config o variables de entorno):
+    MEDIA_DIR         directorio de exportación (por defecto instance/media)
+    MEDIA_BASE_URL    URL pública de MEDIA_DIR; si se define, _foto_url apunta
+                      allí las fotos ya exportadas y se exporta al subirlas
+    MEDIA_VARIANTES   anchos exportados, separados por comas (por defecto 320,1024)
+"""
+
+from __future__ import annotations
+
+import json
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+
+from ..models import FotoMascotaDesaparecida as Foto
+from .almacen_blobs import calcular_hash
+from .resolver_fotos import datos_de_foto
+from .variantes_foto import FORMATOS, obtener_almacen_variantes
+
+DIRECTORIO_POR_DEFECTO = Path(__file__).resolve().parents[2] / "instance" / "media"
+ANCHOS_EXPORTADOS = (320, 1024)
+MANIFIESTO = "manifest.json"
+
+
+@dataclass
+class InformeExportacion:
+    escritas: List[int] = field(default_factory=list)
+    sin_cambios: int = 0
+    fallos: List[Tuple[int, str]] = field(default_factory=list)
+
+
+def _extension(foto: Foto) -> str:
+    for _, mimetype, extension, _ in FORMATOS.values():
+        if foto.mime_type == mimetype:
+            return extension
+    extension = mimetypes.guess_extension(foto.mime_type or "") or ""
+    return extension.lstrip(".") or "jpg"
+
+
+if os.name == "nt":
+    import msvcrt
+
+    def _bloquear(fh) -> None:
+        fh.seek(0)
+        while True:
+            try:
+                msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK se rinde tras diez intentos de un segundo
+                continue
+
+    def _desbloquear(fh) -> None:
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _bloquear(fh) -> None:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+
+    def _desbloquear(fh) -> None:
+        fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+class ExportadorFotos:
+    def __init__(self, raiz: str | os.PathLike, anchos: Iterable[int] = ANCHOS_EXPORTADOS):
+        self.raiz = Path(raiz)
+        self.anchos = tuple(anchos)
+        self._lock = threading.Lock()
+        self._manifiesto_leido: Tuple[Optional[int], Dict[str, Any]] = (None, {})
+
+    # --- Manifiesto ---------------------------------------------------------
+
+    @contextmanager
+    def _cerrojo(self):
+        """
+        Exclusión mutua al actualizar el manifiesto, entre hilos y entre
+        procesos (worker de la cola, CLI y workers web).
+        """
+        self.raiz.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.raiz / ".manifest.lock", "a+b") as fh:
+            _bloquear(fh)
+            try:
+                yield
+            finally:
+                _desbloquear(fh)
+
+    def leer_manifiesto(self) -> Dict[str, Any]:
+        try:
+            return json.loads((self.raiz / MANIFIESTO).read_text("utf-8")).get("fotos", {})
+        except FileNotFoundError:
+            return {}
+
+    def _guardar_manifiesto(self, fotos: Dict[str, Any]) -> None:
+        contenido = json.dumps({"fotos": fotos}, indent=1, sort_keys=True).encode("utf-8")
+        self._escribir(self.raiz / MANIFIESTO, contenido)
+
+    def ruta_publicada(self, foto_id: int, ancho: Optional[int] = None) -> Optional[str]:
+        """
+        Nombre publicado de la foto (relativo a MEDIA_DIR): el original o, con
+        `ancho`, su variante JPEG de ese ancho. None si no está exportada. El
+        manifiesto se relee solo si cambió.
+        """
+        try:
+            mtime = (self.raiz / MANIFIESTO).stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        leido_en, fotos = self._manifiesto_leido
+        if leido_en != mtime:
+            fotos = self.leer_manifiesto()
+            self._manifiesto_leido = (mtime, fotos)
+        entrada = fotos.get(str(foto_id))
+        if not entrada:
+            return None
+        if ancho is None:
+            return entrada["original"]
+        return entrada.get("variantes", {}).get(f"{ancho}.jpeg")
+
+    # --- Ficheros -----------------------------------------------------------
+
+    @staticmethod
+    def _escribir(destino: Path, contenido: bytes | memoryview) -> None:
+        fd, tmp = tempfile.mkstemp(dir=destino.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(contenido)
+            os.replace(tmp, destino)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _publicar(self, nombre: str, contenido) -> None:
+        # El nombre depende del contenido: si ya existe, es el mismo fichero
+        destino = self.raiz / nombre
+        if destino.is_file():
+            return
+        if isinstance(contenido, Path):
+            fd, tmp = tempfile.mkstemp(dir=self.raiz, suffix=".tmp")
+            os.close(fd)
+            shutil.copyfile(contenido, tmp)
+            os.replace(tmp, destino)
+        else:
+            self._escribir(destino, contenido)
+
+    def _exportar_foto(self, foto: Foto) -> Dict[str, Any]:
+        data = datos_de_foto(foto)
+        if data is None:
+            raise ValueError("foto sin datos")
+        huella = foto.hash_contenido or calcular_hash(data)
+        original = f"{huella}.{_extension(foto)}"
+        self._publicar(original, data)
+
+        variantes = {}
+        origen = foto.hash_contenido or f"foto-{foto.id}"
+        for ancho in self.anchos:
+            for formato, (_, _, extension, _) in FORMATOS.items():
+                ruta = obtener_almacen_variantes().obtener(origen, ancho, formato, lambda: bytes(data))
+                nombre = f"{huella}-{ancho}.{extension}"
+                self._publicar(nombre, ruta)
+                variantes[f"{ancho}.{formato}"] = nombre
+        return {
+            "hash": huella,
+            "modificada": foto.fecha_modificacion.isoformat() if foto.fecha_modificacion else None,
+            "original": original,
+            "variantes": variantes,
+        }
+
+    def _vigente(self, entrada: Optional[Dict[str, Any]], foto: Foto) -> bool:
+        if not entrada:
+            return False
+        modificada = foto.fecha_modificacion.isoformat() if foto.fecha_modificacion else None
+        if entrada.get("modificada") != modificada:
+            return False
+        if foto.hash_contenido and entrada.get("hash") != foto.hash_contenido:
+            return False
+        nombres = [entrada["original"], *entrada.get("variantes", {}).values()]
+        return all((self.raiz / nombre).is_file() for nombre in nombres)
+
+    def _ficheros_huerfanos(self, retiradas: Iterable[Dict[str, Any]], fotos: Dict[str, Any]) -> None:
+        en_uso = {e["original"] for e in fotos.values()}
+        en_uso.update(n for e in fotos.values() for n in e.get("variantes", {}).values())
+        for entrada in retiradas:
+            for nombre in [entrada["original"], *entrada.get("variantes", {}).values()]:
+                if nombre not in en_uso:
+                    try:
+                        (self.raiz / nombre).unlink()
+                    except FileNotFoundError:
+                        pass
+
+    # --- Operaciones --------------------------------------------------------
+
+    def exportar(self, fotos: Iterable[Foto]) -> InformeExportacion:
+        """
+        Publica las fotos que no estén ya exportadas con su contenido actual.
+        La generación se hace fuera del cerrojo; solo la actualización del
+        manifiesto es exclusiva.
+        """
+        informe = InformeExportacion()
+        self.raiz.mkdir(parents=True, exist_ok=True)
+        publicadas = self.leer_manifiesto()
+        nuevas: Dict[str, Dict[str, Any]] = {}
+        for foto in fotos:
+            if self._vigente(publicadas.get(str(foto.id)), foto):
+                informe.sin_cambios += 1
+                continue
+            try:
+                nuevas[str(foto.id)] = self._exportar_foto(foto)
+            except Exception as exc:
+                current_app.logger.warning("No se pudo exportar la foto %s", foto.id, exc_info=True)
+                informe.fallos.append((foto.id, str(exc)))
+                continue
+            informe.escritas.append(foto.id)
+
+        if nuevas:
+            with self._cerrojo():
+                publicadas = self.leer_manifiesto()
+                sustituidas = [publicadas[i] for i in nuevas if i in publicadas]
+                publicadas.update(nuevas)
+                self._guardar_manifiesto(publicadas)
+                self._ficheros_huerfanos(sustituidas, publicadas)
+        return informe
+
+    def despublicar(self, foto_ids: Iterable[int]) -> int:
+        """
+        Retira fotos del manifiesto y borra sus ficheros si nadie más los usa.
+        """
+        claves = {str(foto_id) for foto_id in foto_ids}
+        if not claves or not (self.raiz / MANIFIESTO).is_file():
+            return 0
+        with self._cerrojo():
+            publicadas = self.leer_manifiesto()
+            retiradas = [publicadas.pop(clave) for clave in claves if clave in publicadas]
+            if retiradas:
+                self._guardar_manifiesto(publicadas)
+                self._ficheros_huerfanos(retiradas, publicadas)
+        return len(retiradas)
+
+    def podar(self, ids_vigentes: Iterable[int]) -> int:
+        """
+        Despublica las fotos del manifiesto que ya no existen.
+        """
+        vigentes = {str(foto_id) for foto_id in ids_vigentes}
+        return self.despublicar(int(i) for i in self.leer_manifiesto() if i not in vigentes)
+
+
+def _config(nombre: str) -> Optional[str]:
+    valor = current_app.config.get(nombre)
+    if valor is None:
+        valor = os.getenv(nombre)
+    return valor or None
+
+
+def url_base_media() -> Optional[str]:
+    base = _config("MEDIA_BASE_URL")
+    return base.rstrip("/") if base else None
+
+
+def obtener_exportador() -> ExportadorFotos:
+    app = current_app._get_current_object()
+    exportador = app.extensions.get("exportador_fotos")
+    if exportador is None:
+        anchos = _config("MEDIA_VARIANTES")
+        exportador = ExportadorFotos(
+            _config("MEDIA_DIR") or DIRECTORIO_POR_DEFECTO,
+            [int(a) for a in anchos.split(",") if a.strip()] if anchos else ANCHOS_EXPORTADOS,
+        )
+        app.extensions["exportador_fotos"] = exportador
+    return exportador
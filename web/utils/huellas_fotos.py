@@ -0,0 +1,218 @@
+"""
+Huellas perceptuales de las fotos para preseleccionar candidatas sin OpenAI.
+
+Cada foto guarda tres huellas de 64 bits (aHash, dHash y pHash) en hex. Dos
+fotos parecidas difieren en pocos bits; la distancia entre dos fotos es la
+suma de las tres distancias de Hamming (0-192). Es una distancia métrica, así
+que las huellas se indexan en un árbol BK: la búsqueda por radio descarta
+ramas enteras sin compararlas.
+
+Sirve para ordenar en milisegundos las candidatas de una comparación antes de
+gastar llamadas de pago: detecta la misma foto reenviada, recortada o
+recomprimida y fotos muy parecidas, no reconoce al animal.
+
+Configuración (app.config o variables de entorno):
+    HUELLAS_RADIO   distancia máxima para considerar parecidas dos fotos (por defecto 64)
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from flask import current_app
+from PIL import Image, ImageOps
+from sqlalchemy import func
+
+from ..models import FotoMascotaDesaparecida as Foto, db
+
+BITS = 64
+DISTANCIA_MAXIMA = 3 * BITS
+RADIO_POR_DEFECTO = 64
+
+
+def _matriz_dct(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matriz = np.sqrt(2 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matriz[0] /= np.sqrt(2)
+    return matriz
+
+
+_DCT_32 = _matriz_dct(32)
+
+
+def _a_entero(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(bool).ravel()).tobytes(), "big")
+
+
+@dataclass(frozen=True)
+class Huellas:
+    ahash: int
+    dhash: int
+    phash: int
+
+    @property
+    def combinada(self) -> int:
+        return (self.ahash << 2 * BITS) | (self.dhash << BITS) | self.phash
+
+    def a_hex(self) -> Tuple[str, str, str]:
+        return tuple(f"{h:016x}" for h in (self.ahash, self.dhash, self.phash))
+
+    @classmethod
+    def de_hex(cls, ahash: str, dhash: str, phash: str) -> "Huellas":
+        return cls(int(ahash, 16), int(dhash, 16), int(phash, 16))
+
+
+def calcular_huellas(data: bytes | memoryview) -> Huellas:
+    """
+    aHash (8x8 frente a la media), dHash (gradiente horizontal 9x8) y pHash
+    (DCT 32x32, 8x8 frecuencias bajas frente a la mediana) en escala de
+    grises y con la orientación EXIF aplicada.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        original.draft("L", (128, 128))
+        gris = ImageOps.exif_transpose(original).convert("L")
+
+    a = np.asarray(gris.resize((8, 8), Image.LANCZOS), dtype=np.float64)
+    d = np.asarray(gris.resize((9, 8), Image.LANCZOS), dtype=np.float64)
+    p = np.asarray(gris.resize((32, 32), Image.LANCZOS), dtype=np.float64)
+
+    bajas = (_DCT_32 @ p @ _DCT_32.T)[:8, :8]
+    # La mediana sin el término DC (brillo medio)
+    mediana = np.median(bajas.ravel()[1:])
+    return Huellas(
+        ahash=_a_entero(a > a.mean()),
+        dhash=_a_entero(d[:, 1:] > d[:, :-1]),
+        phash=_a_entero(bajas > mediana),
+    )
+
+
+def distancia(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class ArbolBK:
+    """
+    Árbol BK sobre la distancia de Hamming. Cada nodo guarda sus hijos por
+    distancia; por la desigualdad triangular, una búsqueda de radio r desde
+    un nodo a distancia d solo baja a los hijos en [d - r, d + r].
+    """
+
+    def __init__(self):
+        self._raiz: Optional[list] = None
+        self.tamano = 0
+
+    def insertar(self, huella: int, valor: Any) -> None:
+        self.tamano += 1
+        nodo = [huella, [valor], {}]
+        if self._raiz is None:
+            self._raiz = nodo
+            return
+        actual = self._raiz
+        while True:
+            d = distancia(huella, actual[0])
+            if d == 0:
+                actual[1].append(valor)
+                return
+            hijo = actual[2].get(d)
+            if hijo is None:
+                actual[2][d] = nodo
+                return
+            actual = hijo
+
+    def buscar(self, huella: int, radio: int) -> List[Tuple[int, Any]]:
+        """
+        (distancia, valor) de todo lo que está a `radio` o menos, de menor a
+        mayor distancia.
+        """
+        encontrados: List[Tuple[int, Any]] = []
+        pendientes = [self._raiz] if self._raiz is not None else []
+        while pendientes:
+            nodo = pendientes.pop()
+            d = distancia(huella, nodo[0])
+            if d <= radio:
+                encontrados.extend((d, valor) for valor in nodo[1])
+            for d_hijo, hijo in nodo[2].items():
+                if d - radio <= d_hijo <= d + radio:
+                    pendientes.append(hijo)
+        encontrados.sort(key=lambda e: e[0])
+        return encontrados
+
+
+class IndiceHuellas:
+    """
+    Árbol BK con las huellas de todas las fotos, como (foto_id, mascota_id).
+    """
+
+    def __init__(self, filas: Iterable[Tuple[int, int, str, str, str]] = ()):
+        self.arbol = ArbolBK()
+        for foto_id, mascota_id, ahash, dhash, phash in filas:
+            self.arbol.insertar(Huellas.de_hex(ahash, dhash, phash).combinada, (foto_id, mascota_id))
+
+    def parecidas(self, huellas: Iterable[Huellas], radio: int,
+                  mascota_ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+        """
+        Menor distancia de cada mascota con alguna foto a `radio` o menos de
+        alguna de `huellas`, restringido a `mascota_ids` si se indica.
+        """
+        permitidas = set(mascota_ids) if mascota_ids is not None else None
+        mejores: Dict[int, int] = {}
+        for huella in huellas:
+            for d, (_, mascota_id) in self.arbol.buscar(huella.combinada, radio):
+                if permitidas is not None and mascota_id not in permitidas:
+                    continue
+                if d < mejores.get(mascota_id, DISTANCIA_MAXIMA + 1):
+                    mejores[mascota_id] = d
+        return mejores
+
+
+_COLUMNAS = (Foto.id, Foto.mascota_id, Foto.ahash, Foto.dhash, Foto.phash)
+_lock = threading.Lock()
+
+
+def obtener_indice_huellas() -> IndiceHuellas:
+    """
+    Índice de la app actual. Se reconstruye si cambió el conjunto de fotos con
+    huella (número de filas, id máximo, última modificación o último cálculo
+    de huellas): así lo ven también las altas, bajas y recálculos hechos por
+    otros workers o por `flask huellas-fotos --todas`. Una consulta de
+    agregados por llamada.
+    """
+    firma = tuple(
+        db.session.query(
+            func.count(Foto.id), func.max(Foto.id), func.max(Foto.fecha_modificacion), func.max(Foto.fecha_huellas)
+        ).filter(Foto.phash.isnot(None)).one()
+    )
+    app = current_app._get_current_object()
+    guardado = app.extensions.get("indice_huellas")
+    if guardado is not None and guardado[0] == firma:
+        return guardado[1]
+    with _lock:
+        filas = db.session.query(*_COLUMNAS).filter(Foto.phash.isnot(None)).all()
+        indice = IndiceHuellas(filas)
+        app.extensions["indice_huellas"] = (firma, indice)
+    return indice
+
+
+def huellas_de_mascota(mascota_id: int) -> List[Huellas]:
+    filas = db.session.query(Foto.ahash, Foto.dhash, Foto.phash).filter(
+        Foto.mascota_id == mascota_id, Foto.phash.isnot(None)
+    )
+    return [Huellas.de_hex(*fila) for fila in filas]
+
+
+def radio_huellas() -> int:
+    valor = current_app.config.get("HUELLAS_RADIO") or os.getenv("HUELLAS_RADIO")
+    return int(valor) if valor else RADIO_POR_DEFECTO
+
+
+def similitud(d: int) -> int:
+    """
+    Distancia como porcentaje de parecido (100 = misma imagen).
+    """
+    return round(100 * (1 - d / DISTANCIA_MAXIMA))
@@ -0,0 +1,133 @@
+"""
+Índice en memoria de códigos postales (fichero GeoNames `codigo_postal.txt`).
+
+El índice se carga una única vez por proceso, la primera vez que se necesita,
+y queda compartido por `calcula_KM_con_CP` y `cp_localidades`. Cada código
+postal guarda sus localidades (nombre original y normalizado) y las columnas
+de latitud, longitud y precisión como arrays de floats.
+
+Si existe la versión compilada (`codigo_postal.bin`, ver `cp_binario`) y está
+al día, se abre con mmap; si falta o está obsoleta se intenta recompilar y,
+si no es posible, se parsea el TSV en memoria.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import unicodedata
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+FICHERO_CP = Path(__file__).resolve().parent / "codigo_postal.txt"
+PAIS_POR_DEFECTO = "ES"
+
+
+def _norm(texto: str) -> str:
+    texto = texto.strip().lower()
+    texto = unicodedata.normalize("NFD", texto)
+    return "".join(c for c in texto if unicodedata.category(c) != "Mn")
+
+
+def normalizar_cp(cp: str | None) -> str:
+    """
+    Limpia el código postal y lo rellena con ceros a la izquierda (5 dígitos).
+    """
+    cp = str(cp or "").strip()
+    if cp.isdigit() and len(cp) < 5:
+        cp = cp.zfill(5)
+    return cp
+
+
+@dataclass(frozen=True)
+class EntradaCP:
+    """
+    Filas de un código postal. Las posiciones de todas las columnas coinciden.
+    """
+    nombres: Tuple[str, ...]
+    nombres_norm: Tuple[str, ...]
+    lat: Sequence[float]
+    lon: Sequence[float]
+    acc: Sequence[float]
+
+    def __len__(self) -> int:
+        return len(self.nombres)
+
+
+def _cargar_fichero(filename: Path, pais: str | None) -> Dict[str, EntradaCP]:
+    filas: Dict[str, list] = {}
+    with filename.open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 12:
+                continue
+            if pais and cols[0] != pais:
+                continue
+            try:
+                lat = float(cols[9])
+                lon = float(cols[10])
+                acc = int(cols[11])
+            except ValueError:
+                continue
+            filas.setdefault(cols[1], []).append((cols[2], lat, lon, acc))
+
+    indice: Dict[str, EntradaCP] = {}
+    for cp, registros in filas.items():
+        nombres = tuple(r[0] for r in registros)
+        indice[cp] = EntradaCP(
+            nombres=nombres,
+            nombres_norm=tuple(_norm(n) for n in nombres),
+            lat=array("d", (r[1] for r in registros)),
+            lon=array("d", (r[2] for r in registros)),
+            acc=array("d", (r[3] for r in registros)),
+        )
+    return indice
+
+
+_indices: Dict[Tuple[Path, str | None], Mapping[str, EntradaCP]] = {}
+_lock = threading.Lock()
+
+
+def _cargar_indice(filename: Path, pais: str | None) -> Mapping[str, EntradaCP]:
+    if pais == PAIS_POR_DEFECTO and os.getenv("CP_USAR_BINARIO", "1") == "1":
+        from .cp_binario import abrir_binario
+
+        almacen = abrir_binario(filename, compilar=os.getenv("CP_COMPILAR_BINARIO", "1") == "1")
+        if almacen is not None:
+            return almacen
+    return _cargar_fichero(filename, pais)
+
+
+def obtener_indice_cp(
+    filename: Path = FICHERO_CP,
+    pais: str | None = PAIS_POR_DEFECTO,
+) -> Mapping[str, EntradaCP]:
+    """
+    Devuelve el índice CP -> EntradaCP, construyéndolo en la primera llamada.
+    """
+    clave = (Path(filename), pais)
+    indice = _indices.get(clave)
+    if indice is not None:
+        return indice
+    with _lock:
+        indice = _indices.get(clave)
+        if indice is None:
+            indice = _cargar_indice(Path(filename), pais)
+            _indices[clave] = indice
+    return indice
+
+
+def buscar_cp(cp: str, filename: Path = FICHERO_CP) -> Optional[EntradaCP]:
+    return obtener_indice_cp(filename).get(normalizar_cp(cp))
+
+
+def reiniciar_indice_cp() -> None:
+    """
+    Descarta los índices cargados (útil en pruebas o tras actualizar el fichero).
+    """
+    with _lock:
+        _indices.clear()
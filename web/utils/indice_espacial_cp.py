@@ -0,0 +1,102 @@
+"""
+Índice espacial (rejilla uniforme lat/lon) sobre los centroides de los códigos
+postales de GeoNames.
+
+Permite responder "qué códigos postales están a menos de R km de (cp, localidad)"
+mirando solo las celdas que cubren el radio, en lugar de calcular la distancia
+a todas las filas del fichero.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+import numpy as np
+
+from .calcula_KM_con_CP import cp_localidad_a_lonlat, distancias_km
+from .indice_cp import obtener_indice_cp
+
+TAMANO_CELDA_GRADOS = 0.25  # ~28 km en latitud
+KM_POR_GRADO_LAT = 111.32
+
+
+class IndiceEspacialCP:
+    def __init__(self, cps: np.ndarray, lats: np.ndarray, lons: np.ndarray,
+                 tamano_celda: float = TAMANO_CELDA_GRADOS):
+        self.cps = np.asarray(cps)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.tamano_celda = tamano_celda
+
+        celdas: Dict[Tuple[int, int], list] = defaultdict(list)
+        filas_lat = np.floor(self.lats / tamano_celda).astype(np.int64)
+        filas_lon = np.floor(self.lons / tamano_celda).astype(np.int64)
+        for i, celda in enumerate(zip(filas_lat.tolist(), filas_lon.tolist())):
+            celdas[celda].append(i)
+        self._celdas = {c: np.array(filas, dtype=np.int64) for c, filas in celdas.items()}
+
+    def _filas_candidatas(self, lon: float, lat: float, radio_km: float) -> np.ndarray:
+        dlat = radio_km / KM_POR_GRADO_LAT
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+        dlon = radio_km / (KM_POR_GRADO_LAT * cos_lat)
+
+        t = self.tamano_celda
+        bloques = [
+            self._celdas[(i, j)]
+            for i in range(math.floor((lat - dlat) / t), math.floor((lat + dlat) / t) + 1)
+            for j in range(math.floor((lon - dlon) / t), math.floor((lon + dlon) / t) + 1)
+            if (i, j) in self._celdas
+        ]
+        if not bloques:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(bloques)
+
+    def cps_en_radio_lonlat(self, lon: float, lat: float, radio_km: float) -> Set[str]:
+        filas = self._filas_candidatas(lon, lat, radio_km)
+        if not len(filas):
+            return set()
+        dist = distancias_km(lon, lat, self.lons[filas], self.lats[filas])
+        return set(self.cps[filas[dist <= radio_km]].tolist())
+
+    def cps_en_radio(self, cp: str, localidad: str, radio_km: float) -> Optional[Set[str]]:
+        """
+        Códigos postales con algún centroide a menos de `radio_km` de
+        (cp, localidad). Devuelve None si el origen no se puede geolocalizar.
+        """
+        origen = cp_localidad_a_lonlat(cp, localidad)
+        if origen is None:
+            return None
+        return self.cps_en_radio_lonlat(origen[0], origen[1], radio_km)
+
+
+def _construir() -> IndiceEspacialCP:
+    indice = obtener_indice_cp()
+    if hasattr(indice, "columnas"):
+        cps, lats, lons = indice.columnas()
+    else:
+        cps, lats, lons = [], [], []
+        for cp, entrada in indice.items():
+            cps.extend([cp] * len(entrada))
+            lats.extend(entrada.lat)
+            lons.extend(entrada.lon)
+    return IndiceEspacialCP(np.asarray(cps), lats, lons)
+
+
+_indice_espacial: Optional[IndiceEspacialCP] = None
+_lock = threading.Lock()
+
+
+def obtener_indice_espacial() -> IndiceEspacialCP:
+    global _indice_espacial
+    if _indice_espacial is None:
+        with _lock:
+            if _indice_espacial is None:
+                _indice_espacial = _construir()
+    return _indice_espacial
+
+
+def cps_en_radio(cp: str, localidad: str, radio_km: float) -> Optional[Set[str]]:
+    return obtener_indice_espacial().cps_en_radio(cp, localidad, radio_km)
@@ -0,0 +1,98 @@
+"""
+Normalización de las fotos subidas antes de guardarlas.
+
+Cada subida se decodifica, se orienta según EXIF, se le quitan los metadatos
+(incluida la posición GPS del móvil), se limita el lado largo y se recodifica
+en un formato y calidad fijos. Así la BD, los adjuntos del correo, las subidas
+a Facebook y las peticiones a OpenAI trabajan con imágenes de tamaño acotado.
+
+Configuración (app.config o variables de entorno):
+    FOTOS_LADO_MAXIMO        lado largo máximo en px (por defecto 2048)
+    FOTOS_FORMATO            'jpeg' (por defecto) | 'webp'
+    FOTOS_CALIDAD            calidad de compresión (por defecto 85)
+    FOTOS_GUARDAR_ORIGINAL   '1' para conservar también el fichero subido
+"""
+
+from __future__ import annotations
+
+import io
+import os
+from dataclasses import dataclass
+from typing import Mapping
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .variantes_foto import FORMATOS, codificar
+
+LADO_MAXIMO = 2048
+CALIDAD = 85
+
+
+class FotoNoValida(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class FotoProcesada:
+    data: bytes
+    mime_type: str
+    extension: str
+    ancho: int
+    alto: int
+    bytes_originales: int
+
+    @property
+    def bytes_ahorrados(self) -> int:
+        return self.bytes_originales - len(self.data)
+
+
+@dataclass(frozen=True)
+class OpcionesIngesta:
+    lado_maximo: int = LADO_MAXIMO
+    formato: str = "jpeg"
+    calidad: int = CALIDAD
+    guardar_original: bool = False
+
+    @classmethod
+    def desde_config(cls, config: Mapping) -> "OpcionesIngesta":
+        def _valor(nombre: str, defecto):
+            valor = config.get(nombre)
+            if valor is None:
+                valor = os.getenv(nombre)
+            return defecto if valor in (None, "") else valor
+
+        formato = str(_valor("FOTOS_FORMATO", "jpeg")).strip().lower()
+        if formato not in FORMATOS:
+            raise ValueError(f"FOTOS_FORMATO desconocido: {formato!r}")
+        return cls(
+            lado_maximo=int(_valor("FOTOS_LADO_MAXIMO", LADO_MAXIMO)),
+            formato=formato,
+            calidad=int(_valor("FOTOS_CALIDAD", CALIDAD)),
+            guardar_original=str(_valor("FOTOS_GUARDAR_ORIGINAL", "0")).strip().lower() in ("1", "true", "si", "sí"),
+        )
+
+
+def procesar_foto(data: bytes, opciones: OpcionesIngesta = OpcionesIngesta()) -> FotoProcesada:
+    """
+    Devuelve la foto normalizada. Lanza FotoNoValida si no se puede decodificar.
+    """
+    lado = opciones.lado_maximo
+    try:
+        with Image.open(io.BytesIO(data)) as original:
+            original.draft("RGB", (lado, lado))
+            img = ImageOps.exif_transpose(original)
+            img.thumbnail((lado, lado), Image.LANCZOS)
+            contenido = codificar(img, opciones.formato, opciones.calidad)
+            ancho, alto = img.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as exc:
+        raise FotoNoValida(str(exc)) from exc
+
+    _, mime_type, extension, _ = FORMATOS[opciones.formato]
+    return FotoProcesada(
+        data=contenido,
+        mime_type=mime_type,
+        extension=extension,
+        ancho=ancho,
+        alto=alto,
+        bytes_originales=len(data),
+    )
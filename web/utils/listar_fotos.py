@@ -4,7 +4,6 @@ import os, sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 import os
-from sqlalchemy import func
 from app import app, db          # tu instancia Flask y la sesión SQLAlchemy
 from web.models import FotoMascotaDesaparecida  # el modelo de fotos
 
@@ -17,7 +16,7 @@ def main():
                 FotoMascotaDesaparecida.id,
                 FotoMascotaDesaparecida.nombre_archivo,
                 FotoMascotaDesaparecida.mime_type,
-                func.octet_length(FotoMascotaDesaparecida.data).label("bytes"),
+                FotoMascotaDesaparecida.tamano_bytes.label("bytes"),
             )
             .order_by(FotoMascotaDesaparecida.id.desc())
             .limit(20)
@@ -0,0 +1,144 @@
+"""
+Coincidencia de localidades dentro de un código postal, tolerante a erratas.
+
+Para cada CP se construye (una vez, bajo demanda) un índice con:
+  - nombre normalizado -> filas (coincidencia exacta),
+  - trigramas -> filas (coincidencia parcial/difusa).
+
+`buscar_localidad` devuelve la mejor fila con una confianza entre 0 y 1, de
+modo que "Alcala de Henres" sigue geolocalizando "Alcalá de Henares" sin
+recorrer todas las filas ni renormalizar nombres en cada llamada.
+"""
+
+from __future__ import annotations
+
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional
+
+from .cache_lru import CacheLRU
+from .indice_cp import FICHERO_CP, EntradaCP, obtener_indice_cp
+
+UMBRAL_DIFUSO = 0.45  # Dice mínimo sobre trigramas para aceptar una errata
+
+
+@dataclass(frozen=True)
+class Coincidencia:
+    fila: int
+    nombre: str
+    lon: float
+    lat: float
+    confianza: float
+    tipo: str  # 'exacta' | 'parcial' | 'difusa' | 'cp'
+
+
+def trigramas(texto: str) -> FrozenSet[str]:
+    texto = f"  {texto} "
+    return frozenset(texto[i:i + 3] for i in range(len(texto) - 2))
+
+
+class IndiceLocalidadesCP:
+    def __init__(self, entrada: EntradaCP):
+        self.entrada = entrada
+        self._exactos: Dict[str, List[int]] = defaultdict(list)
+        self._por_trigrama: Dict[str, List[int]] = defaultdict(list)
+        self._n_trigramas: List[int] = []
+        # Nombres de menos de 3 letras no comparten trigramas "internos"; se
+        # comprueban aparte para no perder coincidencias parciales.
+        self._cortos: List[int] = []
+        for i, nombre in enumerate(entrada.nombres_norm):
+            self._exactos[nombre].append(i)
+            if len(nombre) < 3:
+                self._cortos.append(i)
+            tri = trigramas(nombre)
+            self._n_trigramas.append(len(tri))
+            for t in tri:
+                self._por_trigrama[t].append(i)
+
+    def _mejor_por_precision(self, filas: List[int]) -> int:
+        return max(filas, key=lambda i: self.entrada.acc[i])
+
+    def _coincidencia(self, fila: int, confianza: float, tipo: str) -> Coincidencia:
+        return Coincidencia(
+            fila=fila,
+            nombre=self.entrada.nombres[fila],
+            lon=float(self.entrada.lon[fila]),
+            lat=float(self.entrada.lat[fila]),
+            confianza=round(confianza, 3),
+            tipo=tipo,
+        )
+
+    def buscar(self, loc_norm: str) -> Coincidencia:
+        if not loc_norm:
+            return self._coincidencia(self._mejor_por_precision(list(range(len(self.entrada)))), 0.0, "cp")
+
+        exactos = self._exactos.get(loc_norm)
+        if exactos:
+            return self._coincidencia(self._mejor_por_precision(exactos), 1.0, "exacta")
+
+        # Puntuación Dice por trigramas compartidos, solo sobre las filas que
+        # comparten al menos uno (índice invertido).
+        tri = trigramas(loc_norm)
+        comunes: Dict[int, int] = defaultdict(int)
+        for t in tri:
+            for fila in self._por_trigrama.get(t, ()):
+                comunes[fila] += 1
+
+        if len(loc_norm) < 3:
+            revisar = range(len(self.entrada))
+        else:
+            revisar = sorted(set(comunes).union(self._cortos))
+        parciales = [
+            fila for fila in revisar
+            if loc_norm in self.entrada.nombres_norm[fila]
+            or self.entrada.nombres_norm[fila] in loc_norm
+        ]
+        puntuaciones = {
+            fila: 2 * n / (len(tri) + self._n_trigramas[fila])
+            for fila, n in comunes.items()
+        }
+
+        if parciales:
+            mejor = self._mejor_por_precision(parciales)
+            nombre = self.entrada.nombres_norm[mejor]
+            proporcion = min(len(nombre), len(loc_norm)) / max(len(nombre), len(loc_norm))
+            return self._coincidencia(mejor, 0.5 + 0.45 * proporcion, "parcial")
+
+        if puntuaciones:
+            mejor = max(puntuaciones, key=lambda i: (puntuaciones[i], self.entrada.acc[i]))
+            if puntuaciones[mejor] >= UMBRAL_DIFUSO:
+                return self._coincidencia(mejor, puntuaciones[mejor], "difusa")
+
+        return self._coincidencia(self._mejor_por_precision(list(range(len(self.entrada)))), 0.0, "cp")
+
+
+_cache_indices = CacheLRU(int(os.getenv("CP_CACHE_ENTRADAS", "4096")))
+
+
+def _indice_localidades(cp: str, filename: Path) -> Optional[IndiceLocalidadesCP]:
+    def _construir() -> Optional[IndiceLocalidadesCP]:
+        entrada = obtener_indice_cp(filename).get(cp)
+        return IndiceLocalidadesCP(entrada) if entrada is not None else None
+
+    return _cache_indices.obtener((cp, filename), _construir)
+
+
+def buscar_localidad(
+    cp: str,
+    loc_norm: str,
+    filename: Path = FICHERO_CP,
+) -> Optional[Coincidencia]:
+    """
+    Mejor fila del CP (ya normalizado) para la localidad normalizada `loc_norm`.
+    None si el CP no existe.
+    """
+    indice = _indice_localidades(cp, filename)
+    if indice is None:
+        return None
+    return indice.buscar(loc_norm)
+
+
+def limpiar_indices_localidades() -> None:
+    _cache_indices.limpiar()
@@ -1,42 +1,114 @@
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
+from .cliente_http import obtener_cliente
+
 # este es el que conecta con routes.py con la funcion :  publicar_en_instagram
 
 API = "https://graph.facebook.com/v18.0"
 IG_USER_ID = os.environ["IG_USER_ID"]
 ACCESS_TOKEN = os.environ["ACCESS_TOKEN"]
 
-def _crear_contenedor_imagen(url, caption=None):
-    resp = requests.post(
-        f"{API}/{IG_USER_ID}/media",
-        data={
-            "image_url": url,
-            "caption": caption or "",
-            "access_token": ACCESS_TOKEN,
-        },
-        timeout=10,
-    )
+# Tiempo máximo (s) desde que se crean los contenedores hasta publicar
+PLAZO_PUBLICACION = float(os.getenv("IG_PLAZO_PUBLICACION", "120"))
+# Contenedores hijo del carrusel que se crean a la vez
+CREACIONES_CONCURRENTES = int(os.getenv("IG_CREACIONES_CONCURRENTES", "4"))
+
+# Sondeo de status_code: empieza rápido y se va espaciando
+_cliente = obtener_cliente("instagram", timeout=(5, 15))
+
+ESPERA_INICIAL = 0.5
+ESPERA_MAXIMA = 5.0
+FACTOR_ESPERA = 1.5
+
+
+class ErrorContenedorInstagram(RuntimeError):
+    pass
+
+
+def _crear_contenedor_imagen(url, caption=None, is_carousel_item=False, limite=None):
+    data = {
+        "image_url": url,
+        "access_token": ACCESS_TOKEN,
+    }
+    if is_carousel_item:
+        data["is_carousel_item"] = "true"
+    else:
+        data["caption"] = caption or ""
+    resp = _cliente.post(f"{API}/{IG_USER_ID}/media", data=data, limite=limite)
     resp.raise_for_status()
     return resp.json()["id"]
 
-def publicar_en_instagram(caption, fotos_urls):
+
+def _estado_contenedor(container_id, limite=None):
+    resp = _cliente.get(
+        f"{API}/{container_id}",
+        params={"fields": "status_code", "access_token": ACCESS_TOKEN},
+        limite=limite,
+    )
+    resp.raise_for_status()
+    return resp.json().get("status_code")
+
+
+def _esperar_contenedores(container_ids, limite):
+    """
+    Consulta el status_code de los contenedores hasta que todos estén en
+    FINISHED, espaciando las consultas. `limite` es un instante de
+    time.monotonic(); si se alcanza se lanza TimeoutError.
+    """
+    pendientes = list(container_ids)
+    espera = ESPERA_INICIAL
+    while True:
+        siguen = []
+        for container_id in pendientes:
+            try:
+                estado = _estado_contenedor(container_id, limite)
+            except (requests.Timeout, requests.ConnectionError) as exc:
+                # La consulta se cortó al vencer el plazo (solo es una lectura)
+                if time.monotonic() < limite:
+                    raise
+                raise TimeoutError(f"Contenedor {container_id} sin procesar tras el plazo") from exc
+            if estado in ("ERROR", "EXPIRED"):
+                raise ErrorContenedorInstagram(f"Contenedor {container_id} en estado {estado}")
+            if estado != "FINISHED":
+                siguen.append(container_id)
+        if not siguen:
+            return
+        pendientes = siguen
+
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            raise TimeoutError(f"Contenedores sin procesar tras el plazo: {', '.join(pendientes)}")
+        time.sleep(min(espera, restante))
+        espera = min(espera * FACTOR_ESPERA, ESPERA_MAXIMA)
+
+
+def publicar_en_instagram(caption, fotos_urls, plazo=None):
     """
     Publica en IG. `fotos_urls` es una lista de URLs públicas.
     Si hay más de una, se publica como carrusel.
+    Se publica en cuanto Instagram termina de procesar los contenedores, con
+    un máximo de IG_PLAZO_PUBLICACION segundos, o de `plazo` si es menor (el
+    tiempo que le queda al trabajo de la cola).
     """
     if not fotos_urls:
         raise ValueError("Debes proporcionar al menos una URL de foto.")
 
+    limite = time.monotonic() + (PLAZO_PUBLICACION if plazo is None else min(plazo, PLAZO_PUBLICACION))
+
     if len(fotos_urls) == 1:
-        creation_id = _crear_contenedor_imagen(fotos_urls[0], caption)
+        creation_id = _crear_contenedor_imagen(fotos_urls[0], caption, limite=limite)
     else:
-        # Crear contenedores hijo sin caption
-        child_ids = [_crear_contenedor_imagen(url) for url in fotos_urls]
+        # Crear contenedores hijo sin caption, varios a la vez (se conserva el orden)
+        with ThreadPoolExecutor(max_workers=min(CREACIONES_CONCURRENTES, len(fotos_urls))) as pool:
+            child_ids = list(pool.map(lambda url: _crear_contenedor_imagen(url, is_carousel_item=True, limite=limite), fotos_urls))
+        _esperar_contenedores(child_ids, limite)
 
         # Crear contenedor CAROUSEL
-        resp = requests.post(
+        resp = _cliente.post(
             f"{API}/{IG_USER_ID}/media",
             data={
                 "media_type": "CAROUSEL",
@@ -44,22 +116,21 @@ def publicar_en_instagram(caption, fotos_urls):
                 "caption": caption or "",
                 "access_token": ACCESS_TOKEN,
             },
-            timeout=10,
+            limite=limite,
         )
         resp.raise_for_status()
         creation_id = resp.json()["id"]
 
-    # Opcional: esperar un poco a que procese
-    time.sleep(5)
+    _esperar_contenedores([creation_id], limite)
 
     # Publicar
-    resp_pub = requests.post(
+    resp_pub = _cliente.post(
         f"{API}/{IG_USER_ID}/media_publish",
         data={
             "creation_id": creation_id,
             "access_token": ACCESS_TOKEN,
         },
-        timeout=10,
+        limite=limite,
     )
     resp_pub.raise_for_status()
-    return resp_pub.json()
\ No newline at end of file
+    return resp_pub.json()
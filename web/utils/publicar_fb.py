@@ -5,16 +5,23 @@ Requiere como mínimo las variables de entorno:
     - PAGE_ACCESS_TOKEN (token de la página con permisos pages_manage_posts,
       pages_show_list y pages_read_engagement).
     - FACEBOOK_PAGE_ID (ID numérico de la página).
+
+Opcional:
+    - FB_SUBIDAS_CONCURRENTES: fotos que se suben a la vez (por defecto 4).
 """
 
 import json
 import os
-from io import BytesIO
-from typing import Dict, Any, Iterable, Mapping, Optional, Sequence, Tuple, Union
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Any, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
 
 import requests
 from flask import current_app
 
+from .cliente_http import obtener_cliente, resultado_desconocido
+
 PAGE_ACCESS_TOKEN = os.getenv("PAGE_ACCESS_TOKEN")
 if not PAGE_ACCESS_TOKEN:
     raise RuntimeError("Falta la variable de entorno PAGE_ACCESS_TOKEN")
@@ -29,6 +36,10 @@ GRAPH_API_FEED = f"{GRAPH_API_BASE}/{FACEBOOK_PAGE_ID}/feed"
 GRAPH_API_PHOTOS = f"{GRAPH_API_BASE}/{FACEBOOK_PAGE_ID}/photos"
 
 MAX_TEXT_LENGTH = 63_000  # límite aproximado admitido por el feed
+SUBIDAS_CONCURRENTES = int(os.getenv("FB_SUBIDAS_CONCURRENTES", "4"))
+
+# Pool compartido (keep-alive) con Graph; admite las subidas concurrentes
+_cliente = obtener_cliente("facebook", timeout=(5, 30), pool_maxsize=max(SUBIDAS_CONCURRENTES, 10))
 
 DatosType = Union[Mapping[str, object], Sequence[Tuple[str, object]]]
 
@@ -81,6 +92,7 @@ def _post_to_graph(
     payload: dict | None = None,
     files: dict | None = None,
     use_json: bool = False,
+    limite: float | None = None,
 ):
     params = {"access_token": PAGE_ACCESS_TOKEN}
 
@@ -88,13 +100,13 @@ def _post_to_graph(
     json_data = payload if payload and use_json else None
     files_data = files if files is not None else None
 
-    response = requests.post(
+    response = _cliente.post(
         url,
         params=params,
         data=data,
         json=json_data,
         files=files_data,
-        timeout=15,
+        limite=limite,
     )
 
     print("[FB] POST", url, "status", response.status_code)
@@ -107,7 +119,7 @@ def _post_to_graph(
     return response.json()
 
 
-def _upload_photo_url(image_url: str, published: bool = False) -> str:
+def _upload_photo_url(image_url: str, published: bool = False, limite: float | None = None) -> str:
     """
     Sube una foto al álbum de la página usando una URL pública.
     - image_url: URL accesible de la imagen.
@@ -119,7 +131,7 @@ def _upload_photo_url(image_url: str, published: bool = False) -> str:
         "published": "true" if published else "false",
         "temporary": "false" if published else "true",
     }
-    data = _post_to_graph(GRAPH_API_PHOTOS, payload=payload)
+    data = _post_to_graph(GRAPH_API_PHOTOS, payload=payload, limite=limite)
     return data["id"]
 
 
@@ -128,6 +140,7 @@ def _upload_photo_bytes(
     nombre_archivo: str,
     mime_type: str | None = None,
     published: bool = False,
+    limite: float | None = None,
 ) -> str:
     """
     Sube una foto a partir de datos binarios (los que vienen de PostgreSQL).
@@ -138,50 +151,91 @@ def _upload_photo_bytes(
     }
 
     mime = mime_type or "application/octet-stream"
-    buffer = BytesIO(data_bytes)
-    files = {"source": (nombre_archivo, buffer, mime)}
-    data = _post_to_graph(GRAPH_API_PHOTOS, payload=payload, files=files)
+    # bytes y no un buffer: si la petición se reintenta, se reenvía completa
+    files = {"source": (nombre_archivo, data_bytes, mime)}
+    data = _post_to_graph(GRAPH_API_PHOTOS, payload=payload, files=files, limite=limite)
     return data["id"]
 
 
-def _resolver_media_ids(fotos: Optional[Iterable[Dict[str, Any]]]) -> list[str]:
+@dataclass
+class InformeSubida:
     """
-    Procesa la colección de fotos (diccionarios provenientes de `_obtener_rutas_fotos`)
-    y devuelve sus media IDs (tras subirlas sin publicarlas).
+    Resultado de subir las fotos de un post: media IDs en el orden de las
+    fotos y, para las que no se pudieron subir, su id y el motivo.
     """
-    media_ids: list[str] = []
+    media_ids: List[str] = field(default_factory=list)
+    fallos: List[Tuple[Any, str]] = field(default_factory=list)
 
-    for foto in fotos or []:
-        data_bytes = foto.get("data")
-        mime_type = foto.get("mime_type") or "application/octet-stream"
-        nombre_archivo = foto.get("nombre_archivo") or f"foto_{foto.get('id', 'sin_id')}.jpg"
-        url_publica = foto.get("url")
+    @property
+    def completo(self) -> bool:
+        return not self.fallos
 
-        if data_bytes:
-            try:
-                # Convertir memoryview a bytes si hace falta
-                if isinstance(data_bytes, memoryview):
-                    data_bytes = data_bytes.tobytes()
-                media_id = _upload_photo_bytes(data_bytes, nombre_archivo, mime_type, published=False)
-                print(f"[FB] Foto binaria (id={foto.get('id')}) -> media_id {media_id}")
-                media_ids.append(media_id)
-                continue
-            except Exception as exc:  # pylint: disable=broad-except
-                print(f"[FB] ⚠️ Error subiendo foto binaria (id={foto.get('id')}): {exc}")
 
-        if url_publica:
-            try:
-                url_abs = _asegurar_url_absoluta(url_publica)
-                media_id = _upload_photo_url(url_abs, published=False)
-                print(f"[FB] Foto URL {url_abs} -> media_id {media_id}")
-                media_ids.append(media_id)
-                continue
-            except Exception as exc:  # pylint: disable=broad-except
-                print(f"[FB] ⚠️ Error subiendo foto desde URL {url_publica}: {exc}")
+def _subir_foto(
+    foto: Dict[str, Any], url_abs: Optional[str], limite: Optional[float] = None
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Sube una foto sin publicarla: primero sus binarios y, si fallan, su URL.
+    Devuelve (media_id, None) o (None, motivo del fallo). Con el plazo
+    (`limite`) vencido no se empieza la subida.
+    """
+    if limite is not None and time.monotonic() >= limite:
+        return None, "Plazo agotado"
+    data_bytes = foto.get("data")
+    mime_type = foto.get("mime_type") or "application/octet-stream"
+    nombre_archivo = foto.get("nombre_archivo") or f"foto_{foto.get('id', 'sin_id')}.jpg"
+    motivo = "Foto sin datos utilizables"
+
+    if data_bytes:
+        try:
+            # Convertir memoryview a bytes si hace falta
+            if isinstance(data_bytes, memoryview):
+                data_bytes = data_bytes.tobytes()
+            media_id = _upload_photo_bytes(data_bytes, nombre_archivo, mime_type, published=False, limite=limite)
+            print(f"[FB] Foto binaria (id={foto.get('id')}) -> media_id {media_id}")
+            return media_id, None
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"[FB] ⚠️ Error subiendo foto binaria (id={foto.get('id')}): {exc}")
+            motivo = str(exc)
+
+    if url_abs:
+        try:
+            media_id = _upload_photo_url(url_abs, published=False, limite=limite)
+            print(f"[FB] Foto URL {url_abs} -> media_id {media_id}")
+            return media_id, None
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"[FB] ⚠️ Error subiendo foto desde URL {url_abs}: {exc}")
+            motivo = str(exc)
+
+    print(f"[FB] ⚠️ Foto no subida; se omite (id={foto.get('id')}).")
+    return None, motivo
+
+
+def _resolver_media_ids(
+    fotos: Optional[Iterable[Dict[str, Any]]], limite: Optional[float] = None
+) -> InformeSubida:
+    """
+    Sube la colección de fotos (diccionarios provenientes de `_obtener_rutas_fotos`)
+    sin publicarlas, varias a la vez, y devuelve sus media IDs en el orden
+    original junto con las que fallaron.
+    """
+    fotos = list(fotos or [])
+    informe = InformeSubida()
+    if not fotos:
+        return informe
 
-        print(f"[FB] ⚠️ Foto sin datos utilizables; se omite (id={foto.get('id')}).")
+    # Las URLs se resuelven aquí: los hilos del pool no tienen contexto de app
+    urls = [_asegurar_url_absoluta(f["url"]) if f.get("url") else None for f in fotos]
+    with ThreadPoolExecutor(max_workers=max(1, min(SUBIDAS_CONCURRENTES, len(fotos))),
+                            thread_name_prefix="fb-subida") as pool:
+        resultados = list(pool.map(_subir_foto, fotos, urls, [limite] * len(fotos)))
 
-    return media_ids
+    for foto, (media_id, motivo) in zip(fotos, resultados):
+        if media_id:
+            informe.media_ids.append(media_id)
+        else:
+            informe.fallos.append((foto.get("id"), motivo))
+    return informe
 
 
 def _asegurar_url_absoluta(url_relativa: str) -> str:
@@ -202,21 +256,36 @@ def publish_pet_fb_post(
     subject: str,
     datos: DatosType,
     fotos: Optional[Iterable[Dict[str, Any]]] = None,
-) -> bool:
+    plazo: Optional[float] = None,
+) -> Optional[str]:
     """
     Publica en el feed de la página un mensaje con el mismo formato del correo.
     - subject: título o encabezado del post.
     - datos: dict o lista de pares (campo, valor).
     - fotos: iterable de diccionarios retornados por `_obtener_rutas_fotos`.
              Se suben a Facebook en base a sus binarios (o URL pública si aplica).
-    - return: True si la publicación se creó correctamente, False si hubo error.
+    - plazo: segundos disponibles; vencido, no se empiezan subidas ni se
+             publica, y cada petición se recorta a lo que quede.
+    - return: id del post creado, o None si hubo error.
+    Si la llamada al feed falla sin que se sepa si creó el post (timeout,
+    5xx), la excepción se propaga: no debe reintentarse a ciegas.
     """
+    limite = time.monotonic() + plazo if plazo is not None else None
     try:
         mensaje = construir_texto_post(subject, datos)
-        media_ids = _resolver_media_ids(fotos)
+        informe = _resolver_media_ids(fotos, limite)
+        if not informe.completo:
+            print(
+                f"[FB] ⚠️ {len(informe.fallos)} foto(s) sin subir; se publica con "
+                f"{len(informe.media_ids)}: {informe.fallos}"
+            )
+
+        if limite is not None and time.monotonic() >= limite:
+            print("[FB] ❌ Plazo agotado antes de publicar; no se publica")
+            return None
 
         payload = {"message": mensaje}
-        for idx, media_id in enumerate(media_ids):
+        for idx, media_id in enumerate(informe.media_ids):
             payload[f"attached_media[{idx}]"] = json.dumps(
                 {"media_fbid": media_id},
                 separators=(",", ":"),
@@ -224,14 +293,16 @@ def publish_pet_fb_post(
 
         print("[FB] Payload a feed:", payload)
 
-        respuesta = _post_to_graph(GRAPH_API_FEED, payload=payload)
+        respuesta = _post_to_graph(GRAPH_API_FEED, payload=payload, limite=limite)
 
         print("[FB] Respuesta feed:", respuesta)
 
-        return True
+        return respuesta["id"]
 
     except Exception as exc:  # pylint: disable=broad-except
+        if resultado_desconocido(exc):
+            raise
         print("[FB] ❌ Error publicando:", exc)
         if hasattr(exc, "response") and exc.response is not None:
             print("[FB] ❌ Respuesta completa:", exc.response.text)
-        return False
\ No newline at end of file
+        return None
\ No newline at end of file
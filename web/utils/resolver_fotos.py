@@ -0,0 +1,82 @@
+"""
+Acceso en proceso a los binarios de las fotos por su id.
+
+Sustituye a las descargas HTTP contra la propia app (`/foto/<id>`): esas
+peticiones ocupan un worker mientras otro espera la respuesta, y con un solo
+worker se bloquean. Los datos se entregan como memoryview, sin copias
+adicionales; base64, BytesIO y Pillow los aceptan tal cual.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Optional, Set
+from urllib.parse import urlsplit
+
+from flask import current_app
+from sqlalchemy.orm import undefer
+
+from ..models import FotoMascotaDesaparecida as Foto, db
+from .almacen_blobs import BlobNoEncontrado, obtener_almacen
+
+# /foto/5, /foto/5.jpg (la ruta, sin dominio ni query string)
+_RUTA_FOTO = re.compile(r"^/foto/(\d+)(?:\.jpg)?$")
+
+
+@dataclass(frozen=True)
+class FotoResuelta:
+    id: int
+    data: memoryview
+    mime_type: Optional[str]
+    nombre_archivo: Optional[str]
+
+
+def datos_de_foto(foto: Optional[Foto]) -> Optional[memoryview]:
+    """
+    Binario de una foto ya cargada: del almacén de blobs o, en filas antiguas
+    sin migrar o cuyo blob falta, de la columna `data`.
+    """
+    if foto is None:
+        return None
+    if foto.hash_contenido:
+        try:
+            return obtener_almacen().leer_vista(foto.hash_contenido)
+        except BlobNoEncontrado:
+            current_app.logger.warning("Blob %s de la foto %s no encontrado", foto.hash_contenido, foto.id)
+    # Filas migradas conservan `data` hasta `flask fotos-vaciar-data`
+    return memoryview(foto.data) if foto.data else None
+
+
+def cargar_foto(foto_id: int) -> Optional[FotoResuelta]:
+    """
+    Foto por id con sus binarios, o None si no existe o no tiene datos.
+    """
+    foto = db.session.get(Foto, foto_id, options=[undefer(Foto.data)])
+    data = datos_de_foto(foto)
+    if data is None:
+        return None
+    return FotoResuelta(id=foto.id, data=data, mime_type=foto.mime_type, nombre_archivo=foto.nombre_archivo)
+
+
+def _hosts_propios() -> Set[str]:
+    hosts = set()
+    for nombre in ("EXTERNAL_BASE_URL", "IG_MEDIA_BASE_URL"):
+        base = current_app.config.get(nombre)
+        if base:
+            hosts.add(urlsplit(base).netloc.lower())
+    return hosts
+
+
+def id_foto_de_url(url: str) -> Optional[int]:
+    """
+    Id de la foto si `url` apunta al endpoint /foto/<id> de la app: una ruta
+    relativa o una URL de EXTERNAL_BASE_URL o IG_MEDIA_BASE_URL. Las de otros
+    dominios no son fotos nuestras aunque tengan la misma ruta.
+    """
+    partes = urlsplit(url or "")
+    if partes.scheme or partes.netloc:
+        if partes.scheme not in ("http", "https") or partes.netloc.lower() not in _hosts_propios():
+            return None
+    coincidencia = _RUTA_FOTO.match(partes.path)
+    return int(coincidencia.group(1)) if coincidencia else None
@@ -1,4 +1,12 @@
-from calcula_KM_con_CP import calcula_KM_con_CP
+import os
+import sys
+
+# Subimos dos niveles (utils -> web -> web_mascotas) para encontrar el paquete 'web'
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from web.utils.calcula_KM_con_CP import calcula_KM_con_CP  # noqa: E402
 
 def main():
     ejemplos = [
@@ -15,4 +23,4 @@ def main():
             print(f"{cp1} ({loc1 or 'default'}) – {cp2} ({loc2 or 'default'}): {dist:.2f} km")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,138 @@
+"""
+Variantes redimensionadas de las fotos (miniaturas y tamaños intermedios).
+
+`/foto/<id>?w=320` o `/foto/<id>?variante=thumb` sirven una copia reducida,
+orientada según EXIF y recomprimida en JPEG o WebP. Las variantes se generan
+la primera vez y se guardan en disco, con clave (origen, ancho, formato), donde
+origen es el hash de contenido de la foto (o `foto-<id>` en filas antiguas).
+
+Los anchos pedidos se ajustan al siguiente de ANCHOS para no generar una
+variante por cada valor de `w` que llegue en la URL.
+
+Configuración:
+    FOTOS_VARIANTES_DIR   raíz de la caché de variantes (por defecto instance/variantes)
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional
+
+from flask import current_app
+from PIL import Image, ImageOps
+
+VARIANTES = {"thumb": 320, "medium": 1024, "full": None}
+ANCHOS = (160, 320, 640, 1024, 1600)
+
+# formato -> (nombre PIL, mimetype, extensión, calidad)
+FORMATOS = {
+    "jpeg": ("JPEG", "image/jpeg", "jpg", 82),
+    "webp": ("WEBP", "image/webp", "webp", 80),
+}
+
+DIRECTORIO_POR_DEFECTO = Path(__file__).resolve().parents[2] / "instance" / "variantes"
+
+
+def resolver_ancho(w: Optional[str] = None, variante: Optional[str] = None) -> Optional[int]:
+    """
+    Ancho de la variante pedida, ajustado a ANCHOS. None = foto original.
+    Lanza ValueError si los parámetros no son válidos.
+    """
+    if variante:
+        variante = variante.strip().lower()
+        if variante not in VARIANTES:
+            raise ValueError(f"Variante desconocida: {variante!r}")
+        return VARIANTES[variante]
+    if not w:
+        return None
+    if not w.isdigit() or int(w) <= 0:
+        raise ValueError(f"Ancho no válido: {w!r}")
+    pedido = int(w)
+    return next((ancho for ancho in ANCHOS if ancho >= pedido), ANCHOS[-1])
+
+
+def codificar(img: Image.Image, formato: str = "jpeg", calidad: Optional[int] = None) -> bytes:
+    """
+    Codifica `img` en JPEG o WebP sin metadatos. Las transparencias se
+    aplanan sobre blanco en JPEG.
+    """
+    nombre_pil, _, _, calidad_defecto = FORMATOS[formato]
+    if nombre_pil == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGBA")
+        fondo = Image.new("RGB", img.size, (255, 255, 255))
+        fondo.paste(img, mask=img.getchannel("A"))
+        img = fondo
+    elif img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA")
+
+    salida = io.BytesIO()
+    opciones = {"quality": calidad or calidad_defecto, "optimize": True}
+    if nombre_pil == "JPEG":
+        opciones["progressive"] = True
+    else:
+        opciones["method"] = 4
+    img.save(salida, nombre_pil, **opciones)
+    return salida.getvalue()
+
+
+def generar_variante(data: bytes, ancho: int, formato: str = "jpeg") -> bytes:
+    """
+    Reduce la imagen a `ancho` px como máximo (sin ampliar), aplicando la
+    orientación EXIF y descartando los metadatos.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        # En JPEG, draft() decodifica ya reducido (escalado DCT): mucho más rápido
+        original.draft("RGB", (ancho, ancho))
+        img = ImageOps.exif_transpose(original)
+        img.thumbnail((ancho, ancho * 4), Image.LANCZOS)
+        return codificar(img, formato)
+
+
+class AlmacenVariantes:
+    def __init__(self, raiz: str | os.PathLike):
+        self.raiz = Path(raiz)
+
+    def _directorio(self, origen: str) -> Path:
+        if not origen or "/" in origen or "\\" in origen or origen.startswith("."):
+            raise ValueError(f"Origen de variante no válido: {origen!r}")
+        return self.raiz / origen[:2] / origen
+
+    def ruta(self, origen: str, ancho: int, formato: str) -> Path:
+        return self._directorio(origen) / f"{int(ancho)}.{FORMATOS[formato][2]}"
+
+    def obtener(self, origen: str, ancho: int, formato: str, cargar: Callable[[], bytes]) -> Path:
+        """
+        Ruta de la variante, generándola desde `cargar()` si aún no existe.
+        """
+        destino = self.ruta(origen, ancho, formato)
+        if destino.is_file():
+            return destino
+        contenido = generar_variante(cargar(), ancho, formato)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=destino.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(contenido)
+            os.replace(tmp, destino)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return destino
+
+    def eliminar(self, origen: str) -> None:
+        shutil.rmtree(self._directorio(origen), ignore_errors=True)
+
+
+def obtener_almacen_variantes() -> AlmacenVariantes:
+    app = current_app._get_current_object()
+    almacen = app.extensions.get("variantes_fotos")
+    if almacen is None:
+        raiz = app.config.get("FOTOS_VARIANTES_DIR") or os.getenv("FOTOS_VARIANTES_DIR") or DIRECTORIO_POR_DEFECTO
+        almacen = AlmacenVariantes(raiz)
+        app.extensions["variantes_fotos"] = almacen
+    return almacen